@@ -0,0 +1,184 @@
+import os
+import logging
+import threading
+from config_cache import load_json, CONFIG_FILE, PROMPTS_FILE, DEFAULT_CREDENTIALS_KEY
+from queue_backends import create_reply_queue, get_shared_processed_store, share_rate_limits, REPLY_QUEUE_DB_FILE
+from reply_journal import REPLY_JOURNAL_FILE
+from rate_limiter import get_rate_limiter
+from monitor_state import get_high_water_marks, MONITOR_STATE_FILE
+from prompt_registry import get_prompt_registry
+from reply_cache import get_reply_cache
+from processed_store import get_processed_store, PROCESSED_LOG_FILE, REPLIED_LOG_FILE, LEGACY_PROCESSED_FILE
+
+logger = logging.getLogger("accounts")
+
+# Name of the account used when config.json has no "accounts" section
+DEFAULT_ACCOUNT_NAME = "default"
+
+def account_file(path, account_name):
+    """Return a per-account variant of a state file name, e.g. processed_tweets.<name>.log."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{account_name}{ext}"
+
+class Account:
+    """
+    A persona account run by this process.
+
+    Each account has its own credentials, persona prompts, dedup stores,
+    high-water marks, rate limit buckets and reply queue. Reply workers and
+    the HTTP connection pool are shared by every account.
+
+    The default account keeps the original state file names, so a single
+    account setup reads the same files as before; other accounts use files
+    suffixed with their name.
+
+    Args:
+        name: Name of the account, used in logs and state file names
+        credentials_key: Section of config.json holding the account's credentials
+        prompts_file: Persona prompt template file of the account
+        default: Whether this is the default account
+    """
+
+    def __init__(self, name, credentials_key=DEFAULT_CREDENTIALS_KEY, prompts_file=PROMPTS_FILE, default=False):
+        self.name = name
+        self.credentials_key = credentials_key
+        self.prompts_file = prompts_file
+        self.default = default
+
+        if default:
+            self.processed_log = PROCESSED_LOG_FILE
+            self.replied_log = REPLIED_LOG_FILE
+            self.legacy_processed_file = LEGACY_PROCESSED_FILE
+            state_file = MONITOR_STATE_FILE
+            queue_file = REPLY_QUEUE_DB_FILE
+            journal_file = REPLY_JOURNAL_FILE
+        else:
+            self.processed_log = account_file(PROCESSED_LOG_FILE, name)
+            self.replied_log = account_file(REPLIED_LOG_FILE, name)
+            self.legacy_processed_file = None
+            state_file = account_file(MONITOR_STATE_FILE, name)
+            queue_file = account_file(REPLY_QUEUE_DB_FILE, name)
+            journal_file = account_file(REPLY_JOURNAL_FILE, name)
+
+        # With a shared queue backend the queue, dedup stores and rate limits
+        # are coordinated with every other process serving the account
+        self.reply_queue = create_reply_queue(queue_file, f"reply_queue:{credentials_key}", journal_file)
+        self.rate_limiter = get_rate_limiter(credentials_key)
+        share_rate_limits(self.rate_limiter, credentials_key)
+        self.high_water_marks = get_high_water_marks(state_file)
+        self.prompt_registry = get_prompt_registry(prompts_file)
+
+    @property
+    def token_manager(self):
+        """The account's token manager (token_refresher is imported on first use)."""
+        from token_refresher import get_token_manager
+        return get_token_manager(self.credentials_key)
+
+    def monitoring_config(self):
+        """Load the monitoring configuration from the account's prompts file (cached until it changes)."""
+        try:
+            return load_json(self.prompts_file).get("monitoring", {})
+        except Exception as e:
+            logger.error(f"Error loading monitoring config for account {self.name}: {e}")
+            return {}
+
+    def processed_tweets(self):
+        """Return the account's store of processed tweet IDs."""
+        retention_days = self.monitoring_config().get("processed_retention_days", 30)
+        shared_store = get_shared_processed_store(self.processed_log, retention_days)
+        if shared_store is not None:
+            return shared_store
+        return get_processed_store(
+            self.processed_log,
+            retention_days=retention_days,
+            legacy_path=self.legacy_processed_file
+        )
+
+    def replied_tweets(self):
+        """Return the account's store of tweets its reply workers have answered."""
+        retention_days = self.monitoring_config().get("processed_retention_days", 30)
+        shared_store = get_shared_processed_store(self.replied_log, retention_days)
+        if shared_store is not None:
+            return shared_store
+        return get_processed_store(self.replied_log, retention_days=retention_days)
+
+    def reply_cache(self):
+        """Return the reply cache of the account's persona, or None if it is disabled."""
+        return get_reply_cache(self.prompts_file)
+
+    def get_clients(self):
+        """Return the account's shared Tweepy clients with a current bearer token."""
+        return self.token_manager.get_clients()
+
+    def __repr__(self):
+        return f"Account({self.name!r})"
+
+def load_accounts_config():
+    """
+    Load the "accounts" section of config.json.
+
+    Each entry maps an account name to its credentials section and persona
+    prompts file, e.g. {"alex": {"credentials": "Aalexhealth_token",
+    "prompts_file": "prompts_template_alex.json"}}. The first entry is the
+    default account.
+    """
+    if not os.path.exists(CONFIG_FILE):
+        return {}
+    try:
+        return load_json(CONFIG_FILE).get("accounts", {})
+    except Exception as e:
+        logger.error(f"Error loading accounts config: {e}")
+        return {}
+
+def get_account_credentials():
+    """
+    Return (account name, credentials key) for every configured account, the default account first.
+
+    Only reads config.json; unlike get_accounts() it builds no reply queues,
+    stores or rate limiters, for callers that just need the credentials.
+    """
+    credentials = [(name, settings.get("credentials", name)) for name, settings in load_accounts_config().items()]
+    return credentials or [(DEFAULT_ACCOUNT_NAME, DEFAULT_CREDENTIALS_KEY)]
+
+# Process-wide accounts, built once from config.json
+_accounts = None
+_accounts_lock = threading.Lock()
+
+def get_accounts():
+    """
+    Get every configured account, the default account first.
+
+    Without an "accounts" section in config.json there is a single default
+    account using the original credentials, prompts and state files.
+    """
+    global _accounts
+    with _accounts_lock:
+        if _accounts is None:
+            accounts = []
+            for name, settings in load_accounts_config().items():
+                accounts.append(Account(
+                    name,
+                    credentials_key=settings.get("credentials", name),
+                    prompts_file=settings.get("prompts_file", PROMPTS_FILE),
+                    default=not accounts
+                ))
+            if not accounts:
+                accounts.append(Account(DEFAULT_ACCOUNT_NAME, default=True))
+            logger.info(f"Running {len(accounts)} accounts: {', '.join(account.name for account in accounts)}")
+            _accounts = accounts
+        return _accounts
+
+def get_default_account():
+    """Get the default account."""
+    return get_accounts()[0]
+
+def create_token_refresh_thread(accounts=None, check_interval=30 * 60):
+    """Create a daemon thread that keeps the tokens of every account fresh (not started)."""
+    from token_refresher import run_refresh_loops
+    managers = [account.token_manager for account in (accounts or get_accounts())]
+    return threading.Thread(
+        target=run_refresh_loops,
+        args=(managers, check_interval),
+        daemon=True,
+        name="TokenRefresher"
+    )
@@ -1,138 +1,250 @@
 import json
 import os
-import random
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image
-from dotenv import load_dotenv
-from openai import OpenAI
+from prompt_registry import get_prompt_registry
 
-# Load environment variables from .env file
-load_dotenv()
-# Access the OpenAI API key
-api_key = os.getenv("OPENAI_API_KEY")
+# The OpenAI client, HTTP session and heavy libraries (openai, requests, PIL)
+# are created on first use, so importing this module is cheap and never fails
+_openai_client = None
+_async_openai_client = None
+_http_session = None
+_lazy_lock = threading.Lock()
 
-if api_key is None:
-    raise ValueError("OPENAI_API_KEY is not set. Please check your .env file.")
+def get_openai_client():
+    """Return the shared OpenAI client, creating it from OPENAI_API_KEY on first use."""
+    global _openai_client
+    with _lazy_lock:
+        if _openai_client is None:
+            from dotenv import load_dotenv
+            from openai import OpenAI
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=api_key)
+            # Load environment variables from .env file
+            load_dotenv()
+            api_key = os.getenv("OPENAI_API_KEY")
+            if api_key is None:
+                raise ValueError("OPENAI_API_KEY is not set. Please check your .env file.")
 
-# Load prompt templates
-with open("prompts_template_alex.json", "r", encoding="utf-8") as file:
-    prompt_data = json.load(file)
+            _openai_client = OpenAI(api_key=api_key)
+        return _openai_client
 
-def generate_tweet_and_image():
-    # Select a random image prompt template
-    image_templates = prompt_data["Image_prompts"]
-    random_template = random.choice(image_templates)
-    
-    # Generate tweet using the tweet_text_prompt
-    tweet_response = client.chat.completions.create(
+def get_async_openai_client():
+    """Return the shared AsyncOpenAI client for the async runtime, creating it on first use."""
+    global _async_openai_client
+    with _lazy_lock:
+        if _async_openai_client is None:
+            from dotenv import load_dotenv
+            from openai import AsyncOpenAI
+
+            load_dotenv()
+            api_key = os.getenv("OPENAI_API_KEY")
+            if api_key is None:
+                raise ValueError("OPENAI_API_KEY is not set. Please check your .env file.")
+
+            _async_openai_client = AsyncOpenAI(api_key=api_key)
+        return _async_openai_client
+
+def get_http_session():
+    """Return the shared HTTP session, so image downloads reuse pooled connections."""
+    global _http_session
+    with _lazy_lock:
+        if _http_session is None:
+            import requests
+            _http_session = requests.Session()
+        return _http_session
+
+def __getattr__(name):
+    """Keep the old module attributes working; they are created on first access."""
+    if name == "client":
+        return get_openai_client()
+    if name == "http_session":
+        return get_http_session()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Image formats media_upload accepts without re-encoding
+UPLOADABLE_IMAGE_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+
+# Reply posted when a reply can't be generated
+FALLBACK_REPLY = "Thanks for reaching out! Check out our symptom tool at https://harley.healthchat.ai/ for personalized health insights. #HarleyAI #AskHarley"
+
+# Validated, precompiled prompt templates (reloaded when the file changes)
+prompt_registry = get_prompt_registry()
+
+def _generate_tweet_text(tweet_prompt):
+    """Generate tweet text from a compiled prompt and extract it from the JSON response."""
+    tweet_response = get_openai_client().chat.completions.create(
         model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": random_template["tweet_text_prompt"]}
-        ],
+        messages=tweet_prompt.messages(),
         temperature=0.4
     )
-    
-    # Generate image using the image_prompt
-    image_response = client.images.generate(
+
+    # Extract and parse the tweet JSON response
+    tweet_content = tweet_response.choices[0].message.content
+    try:
+        tweet_json = json.loads(tweet_content)
+        return tweet_json["tweet"]
+    except (json.JSONDecodeError, KeyError):
+        return tweet_content
+
+def _generate_image_url(image_prompt):
+    """Generate an image with DALL-E and return its URL."""
+    image_response = get_openai_client().images.generate(
         model="dall-e-3",
-        prompt=random_template["image_prompt"],
+        prompt=image_prompt,
         quality="standard",
         n=1,
         size="1024x1024"
     )
+    return image_response.data[0].url
 
-    # Save the image
-    image_url = image_response.data[0].url
-    image_response = requests.get(image_url)
-    image = Image.open(BytesIO(image_response.content))
-    image.save("generated_image.png")
+def fetch_image(image_url):
+    """
+    Download an image into memory over the shared HTTP session.
 
-    # Extract and parse the tweet JSON response
-    tweet_content = tweet_response.choices[0].message.content
-    try:
-        tweet_json = json.loads(tweet_content)
-        tweet_text = tweet_json["tweet"]
-    except (json.JSONDecodeError, KeyError):
-        tweet_text = tweet_content
+    The image is downscaled and recompressed in a worker process (see
+    image_optimizer). With optimization off, or if it fails, formats that
+    media_upload accepts are kept as-is and anything else is decoded with
+    PIL and re-encoded as PNG.
+
+    Returns:
+        Tuple of (image bytes, file extension)
+    """
+    with get_http_session().get(image_url, timeout=60) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        data = response.content
+
+    from image_optimizer import get_image_optimizer
+    optimized = get_image_optimizer().optimize(data)
+    if optimized is not None:
+        return optimized
+
+    if content_type in UPLOADABLE_IMAGE_TYPES:
+        from media_store import IMAGE_EXTENSIONS
+        return data, IMAGE_EXTENSIONS[content_type]
+
+    from PIL import Image
+    output = BytesIO()
+    Image.open(BytesIO(data)).save(output, format="PNG")
+    return output.getvalue(), ".png"
+
+def store_image(image_url):
+    """Download an image into the media store and return its unique path."""
+    from media_store import get_media_store
+    data, extension = fetch_image(image_url)
+    return get_media_store().put(data, extension)
+
+def generate_tweet_and_image(save=True):
+    """
+    Generate a tweet and a matching image.
+
+    The image bytes are always returned in memory, so they can be uploaded
+    without touching disk. With save=True the image is also written to the
+    media store under a path unique to its contents, for callers (like the
+    content buffer) that post it later; concurrent generations never share
+    a file.
+
+    Returns:
+        Dict with "tweet", "image_data", "image_extension" (e.g. ".jpg")
+        and "image_path" (None if not saved)
+    """
+    # Select a random image prompt template
+    random_template = prompt_registry.random_image_template()
+
+    # Generate the tweet text and the image at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        tweet_future = executor.submit(_generate_tweet_text, random_template["tweet"])
+        image_future = executor.submit(_generate_image_url, random_template["image_prompt"])
+        tweet_text = tweet_future.result()
+        image_url = image_future.result()
+
+    image_data, extension = fetch_image(image_url)
+    image_path = None
+    if save:
+        from media_store import get_media_store
+        image_path = get_media_store().put(image_data, extension)
 
     return {
         "tweet": tweet_text,
-        "image_path": "generated_image.png"
+        "image_data": image_data,
+        "image_extension": extension,
+        "image_path": image_path
     }
 
 def generate_tweet_only():
     # Select a random tweet prompt
-    tweet_templates = prompt_data["tweet_prompt"]
-    random_template = random.choice(tweet_templates)
+    random_template = prompt_registry.random_tweet_template()
 
     # Generate tweet using the tweet_text_prompt
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": random_template["tweet_text_prompt"]}
-        ],
-        temperature=0.4
-    )
+    return _generate_tweet_text(random_template["tweet"])
 
-    # Extract and parse the tweet JSON response
-    tweet_content = response.choices[0].message.content
+def parse_reply_content(reply_content):
+    """Extract the reply from the model's JSON response, falling back to the raw content."""
     try:
-        tweet_json = json.loads(tweet_content)
-        return tweet_json["tweet"]
-    except (json.JSONDecodeError, KeyError):
-        return tweet_content
+        reply_json = json.loads(reply_content)
+        return reply_json["reply"]
+    except (json.JSONDecodeError, KeyError) as e:
+        print(f"Error parsing JSON response: {e}. Using raw content instead.")
+        # If we can't parse the JSON, just return the raw content
+        # Clean up the response if it contains JSON-like content
+        if "{" in reply_content and "}" in reply_content:
+            # Try to extract just the reply text
+            start = reply_content.find('"reply":')
+            if start != -1:
+                start += 9  # Length of '"reply": "'
+                end = reply_content.find('"', start)
+                if end != -1:
+                    return reply_content[start:end]
+        
+        return reply_content
+
+def generate_reply(user_tweet, registry=None):
+    """
+    Generate a reply to a user's tweet using the OpenAI API.
 
-def generate_reply(user_tweet):
-    """Generate a reply to a user's tweet using the OpenAI API."""
+    Args:
+        user_tweet: Text of the tweet to reply to
+        registry: Prompt registry of the replying persona (default: the default prompts file)
+    """
     try:
-        # Get the reply prompt template
-        prompt_template = prompt_data["reply_prompt"]
-        
-        # Create the full prompt by joining the task and instructions
-        instructions = prompt_template["instructions"].copy()
-        instructions[1] = f"User's Tweet: {user_tweet}"  # Update the user tweet
-        prompt = prompt_template["task"] + "\n" + "\n".join(instructions)
+        # The static instructions go in the system message and the tweet in
+        # the user message, so the system prefix is identical on every call
+        registry = registry or prompt_registry
+        messages = registry.reply_prompt().messages(user_tweet=user_tweet)
 
         print(f"Generating reply to: {user_tweet}")
         
         # Generate a response using OpenAI's ChatCompletion
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": prompt}
-            ],
+            messages=messages,
             temperature=0.4
         )
 
         # Extract and parse the reply JSON response
         reply_content = response.choices[0].message.content
         print(f"Raw AI response: {reply_content}")
-        
-        try:
-            reply_json = json.loads(reply_content)
-            return reply_json["reply"]
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing JSON response: {e}. Using raw content instead.")
-            # If we can't parse the JSON, just return the raw content
-            # Clean up the response if it contains JSON-like content
-            if "{" in reply_content and "}" in reply_content:
-                # Try to extract just the reply text
-                start = reply_content.find('"reply":')
-                if start != -1:
-                    start += 9  # Length of '"reply": "'
-                    end = reply_content.find('"', start)
-                    if end != -1:
-                        return reply_content[start:end]
-            
-            return reply_content
+        return parse_reply_content(reply_content)
     except Exception as e:
         print(f"Error generating reply: {e}")
         # Return a fallback response
-        return "Thanks for reaching out! Check out our symptom tool at https://harley.healthchat.ai/ for personalized health insights. #HarleyAI #AskHarley"
+        return FALLBACK_REPLY
+
+async def async_generate_reply(user_tweet, registry=None):
+    """Generate a reply to a user's tweet with the async OpenAI client."""
+    try:
+        registry = registry or prompt_registry
+        messages = registry.reply_prompt().messages(user_tweet=user_tweet)
+        response = await get_async_openai_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            temperature=0.4
+        )
+        return parse_reply_content(response.choices[0].message.content)
+    except Exception as e:
+        print(f"Error generating reply: {e}")
+        return FALLBACK_REPLY
 
 # Only run this code if the file is executed directly, not when imported
 if __name__ == "__main__":
@@ -0,0 +1,462 @@
+import asyncio
+import logging
+import queue
+import signal
+import time
+import tweepy
+from tweepy.asynchronous import AsyncClient
+from ai_utils import async_generate_reply
+from twitter_poster import load_config, get_twitter_clients, HTTP_POOL_SIZE
+from twitter_monitor import (
+    TweetPager,
+    load_processed_tweets,
+    load_replied_tweets,
+    save_processed_tweets,
+    load_monitoring_config,
+    get_hashtag_query,
+    find_missing_parents,
+    add_parent_authors,
+    queue_mentions,
+    queue_search_hits,
+    approve_reply,
+    configure_rate_limits,
+    test_reply_queue
+)
+from accounts import get_default_account
+from query_planner import get_query_planner, seed_high_water_mark
+from content_buffer import get_content_buffer, generate_buffered_item, load_posting_config
+from batch_generation import create_batch_worker, batch_replies_enabled, batch_tweets_enabled
+
+logger = logging.getLogger("async_agent")
+
+# Same retry policy as twitter_retry in twitter_monitor
+MAX_ATTEMPTS = 3
+MIN_RETRY_WAIT = 4
+MAX_RETRY_WAIT = 60
+
+# Longest an idle reply worker waits without being woken, so it still sees
+# tweets that the batch thread or another process added to the queue
+IDLE_WAIT_SECONDS = 30
+
+def create_async_client(credentials):
+    """Create a Tweepy AsyncClient with the given credentials."""
+    return AsyncClient(
+        bearer_token=credentials["access_bearer_token"],
+        consumer_key=credentials["consumer_key"],
+        consumer_secret=credentials["consumer_secret"],
+        access_token=credentials["access_token"],
+        access_token_secret=credentials["access_secret"]
+    )
+
+def open_session(client, pool_size=HTTP_POOL_SIZE * 4):
+    """
+    Give an AsyncClient a shared keep-alive aiohttp session.
+
+    Without one, Tweepy opens a new session for every request. The session
+    also reports rate limit headers to the shared rate limiter. Must be called
+    from inside the running event loop.
+    """
+    import aiohttp
+    client.session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=pool_size),
+        trace_configs=[get_default_account().rate_limiter.trace_config()]
+    )
+    return client
+
+async def call_api(endpoint, method, *args, **kwargs):
+    """Make an async API call under the endpoint's rate limit, retrying rate limit errors with backoff."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        await get_default_account().rate_limiter.acquire_async(endpoint)
+        try:
+            return await method(*args, **kwargs)
+        except tweepy.errors.TooManyRequests:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            wait = min(MAX_RETRY_WAIT, max(MIN_RETRY_WAIT, 2 ** attempt))
+            logger.warning(f"Rate limit hit, waiting {wait} seconds before retry {attempt}")
+            await asyncio.sleep(wait)
+
+async def fetch_new_tweets(fetch_page, stream_key, max_results):
+    """
+    Async version of twitter_monitor.fetch_new_tweets, driving the same TweetPager with an async fetch_page.
+
+    Returns:
+        Tuple of (list of tweets, dict of includes, TweetPager to commit once the tweets are queued)
+    """
+    pager = TweetPager(stream_key, max_results, get_default_account())
+    request = pager.next_request()
+    while request is not None:
+        try:
+            pager.add_page(await fetch_page(**request))
+        except tweepy.errors.BadRequest as e:
+            await asyncio.to_thread(pager.restart, e)
+        request = pager.next_request()
+    tweets, includes = pager.result()
+    return tweets, includes, pager
+
+def search_page(client, query):
+    """Return a fetch_page function searching recent tweets for a query."""
+    async def fetch_page(max_results, since_id, until_id, page_token):
+        kwargs = {}
+        if since_id:
+            kwargs["since_id"] = since_id
+        if until_id:
+            kwargs["until_id"] = until_id
+        if page_token:
+            kwargs["next_token"] = page_token
+        return await call_api(
+            "search", client.search_recent_tweets,
+            query=query,
+            max_results=max_results,
+            tweet_fields=["author_id", "created_at", "conversation_id"],
+            **kwargs
+        )
+    return fetch_page
+
+async def get_parent_authors(client, mentions, includes):
+    """Async version of twitter_monitor.get_parent_authors."""
+    parent_authors, batches = find_missing_parents(mentions, includes)
+    for batch in batches:
+        try:
+            response = await call_api(
+                "tweet_lookup", client.get_tweets,
+                ids=batch, tweet_fields=["author_id", "created_at", "conversation_id"]
+            )
+            add_parent_authors(parent_authors, response)
+        except Exception as e:
+            logger.warning(f"Error looking up {len(batch)} parent tweets: {e}")
+
+    return parent_authors
+
+async def sleep_until_next_check(name):
+    """Sleep for the configured check interval."""
+    sleep_time = load_monitoring_config().get("check_interval_minutes", 30) * 60
+    logger.info(f"Sleeping for {sleep_time/60} minutes before checking {name} again")
+    await asyncio.sleep(sleep_time)
+
+async def monitor_mentions(client, user_id, reply_ready):
+    """Task monitoring mentions, adding them to the reply queue and waking the reply workers."""
+    logger.info("Starting mentions monitoring task")
+    account = get_default_account()
+
+    async def fetch_page(max_results, since_id, until_id, page_token):
+        kwargs = {}
+        if since_id:
+            kwargs["since_id"] = since_id
+        if until_id:
+            kwargs["until_id"] = until_id
+        if page_token:
+            kwargs["pagination_token"] = page_token
+        return await call_api(
+            "mentions", client.get_users_mentions,
+            id=user_id,
+            max_results=max_results,
+            tweet_fields=["author_id", "created_at", "conversation_id", "referenced_tweets"],
+            expansions=["referenced_tweets.id", "referenced_tweets.id.author_id"],
+            **kwargs
+        )
+
+    while True:
+        try:
+            logger.info("Checking for new mentions")
+            mentions, includes, pager = await fetch_new_tweets(fetch_page, f"mentions:{user_id}", max_results=10)
+
+            if mentions:
+                logger.info(f"Found {len(mentions)} mentions")
+                parent_authors = await get_parent_authors(client, mentions, includes)
+                # Claims and queue writes touch the disk, so they run in a worker thread
+                if await asyncio.to_thread(queue_mentions, mentions, user_id, parent_authors, account):
+                    reply_ready.set()
+            else:
+                logger.info("No new mentions found")
+            # Only now that the mentions are queued may the next poll skip them (writes the state file)
+            await asyncio.to_thread(pager.commit)
+
+            await sleep_until_next_check("mentions")
+
+        except asyncio.CancelledError:
+            raise
+        except tweepy.errors.TooManyRequests as e:
+            logger.warning(f"Rate limit exceeded: {e}")
+            await asyncio.sleep(60 * 15)
+        except Exception as e:
+            logger.error(f"Error in mentions monitoring: {e}")
+            await asyncio.sleep(60)
+
+async def monitor_search(client, user_id, source, reply_ready):
+    """Task monitoring hashtag ("hashtag") or keyword ("keyword") searches and adding hits to the reply queue."""
+    logger.info(f"Starting {source} monitoring task")
+    account = get_default_account()
+    planner = get_query_planner(account.name, load_monitoring_config())
+
+    while True:
+        try:
+            config = load_monitoring_config()
+            delay_minutes = config.get("reply_delay_minutes", 60)
+            if source == "hashtag":
+                searches = [(get_hashtag_query(), "hashtags", None)]
+            else:
+                # Packed keyword queries covering every category (see query_planner)
+                searches = []
+                for keyword_query in planner.next_queries(config.get("keywords", {})):
+                    seed_high_water_mark(account.high_water_marks, keyword_query)
+                    searches.append((keyword_query.text, keyword_query.stream_key, keyword_query))
+
+            for query, stream_key, keyword_query in searches:
+                logger.info(f"Searching for {source} tweets: {query}")
+                tweets, _, pager = await fetch_new_tweets(search_page(client, query), stream_key, max_results=20)
+                if keyword_query is not None:
+                    planner.record(keyword_query, len(tweets))
+
+                if tweets:
+                    # Claims and queue writes touch the disk, so they run in a worker thread
+                    queued = await asyncio.to_thread(
+                        queue_search_hits, tweets, user_id, source, delay_minutes, account, keyword_query
+                    )
+                    if queued:
+                        reply_ready.set()
+                await asyncio.to_thread(pager.commit)
+
+            await sleep_until_next_check(f"{source}s")
+
+        except asyncio.CancelledError:
+            raise
+        except tweepy.errors.TooManyRequests as e:
+            logger.warning(f"Rate limit exceeded: {e}")
+            await asyncio.sleep(60 * 15)
+        except Exception as e:
+            logger.error(f"Error in {source} monitoring: {e}")
+            await asyncio.sleep(60)
+
+async def next_reply(reply_ready):
+    """
+    Wait (without blocking the event loop) for the next tweet in the reply queue that is due.
+
+    Idle workers sleep on reply_ready, which the monitors set after queueing
+    tweets, until the earliest queued tweet is due (at most IDLE_WAIT_SECONDS).
+    Queue calls run in a worker thread, since the durable and shared queues
+    touch the disk or the network.
+    """
+    reply_queue = get_default_account().reply_queue
+    while True:
+        reply_ready.clear()
+        try:
+            return await asyncio.to_thread(reply_queue.get, block=False)
+        except queue.Empty:
+            pass
+        due_in = await asyncio.to_thread(reply_queue.next_due_in)
+        timeout = IDLE_WAIT_SECONDS if due_in is None else min(max(due_in, 0.05), IDLE_WAIT_SECONDS)
+        try:
+            await asyncio.wait_for(reply_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+async def reply_worker(client, generation_slots, reply_ready):
+    """
+    Task taking tweets off the reply queue and posting replies.
+
+    Store, cache and queue calls that may block (log flushes, embeddings,
+    journal writes) run in worker threads.
+    """
+    account = get_default_account()
+    reply_queue = account.reply_queue
+    rate_limiter = account.rate_limiter
+    replied_tweets = load_replied_tweets(account)
+    reply_cache = account.reply_cache()
+
+    while True:
+        tweet_data = await next_reply(reply_ready)
+        tweet_id = tweet_data["tweet_id"]
+        try:
+            if not await asyncio.to_thread(replied_tweets.claim, tweet_id):
+                logger.info(f"Already replied to tweet {tweet_id}, skipping")
+                await asyncio.to_thread(reply_queue.ack, tweet_data)
+                continue
+
+            tweet_text = tweet_data["text"]
+            category = tweet_data.get("category", tweet_data.get("source"))
+
+            reply_text = tweet_data.get("reply_text")
+            cache_key = None
+            if not reply_text and reply_cache is not None:
+                reply_text, cache_key = await asyncio.to_thread(reply_cache.lookup, tweet_text, category)
+                if reply_text:
+                    logger.info(f"Reply cache: {reply_cache.format_stats()}")
+            from_cache = bool(reply_text) and cache_key is not None
+            if not reply_text:
+                async with generation_slots:
+                    reply_text = await async_generate_reply(tweet_text, account.prompt_registry)
+
+            try:
+                await call_api("create", client.create_tweet, text=reply_text, in_reply_to_tweet_id=tweet_id)
+                logger.info(f"Posted reply to tweet {tweet_id}: {reply_text}")
+                if not from_cache:
+                    await asyncio.to_thread(approve_reply, reply_cache, tweet_text, reply_text, category, cache_key)
+            except tweepy.errors.Forbidden as e:
+                logger.warning(f"Permission error posting reply to {tweet_id}, skipping: {e}")
+            except tweepy.errors.TooManyRequests as e:
+                logger.warning(f"Rate limit exceeded when replying to {tweet_id}: {e}")
+                replied_tweets.release(tweet_id)
+                await asyncio.to_thread(reply_queue.put, tweet_data, not_before=time.time() + 60 * 15)
+                rate_limiter.pause("create", 60 * 15)
+
+        except asyncio.CancelledError:
+            # The reply was never posted, so don't record it as answered, and leave it
+            # unacknowledged so a shared queue hands it out again once its lease expires
+            replied_tweets.release(tweet_id)
+            raise
+        except Exception as e:
+            logger.error(f"Error processing reply for tweet {tweet_id}: {e}")
+            replied_tweets.release(tweet_id)
+        await asyncio.to_thread(reply_queue.ack, tweet_data)
+
+async def post_buffered_tweet(client, api, image_probability=0.7):
+    """Async version of twitter_poster.post_buffered_tweet; buffer access, generation and media upload run in threads."""
+    buffer = get_content_buffer()
+    item = await asyncio.to_thread(buffer.pop)
+    if item is None:
+        logger.info("Content buffer is empty, generating tweet now")
+        await asyncio.to_thread(generate_buffered_item, buffer, image_probability)
+        item = await asyncio.to_thread(buffer.pop)
+
+    try:
+        media_ids = None
+        if item["image_path"]:
+            # Reuses the media ID uploaded ahead of time (or on a failed earlier attempt)
+            media_ids = [await asyncio.to_thread(buffer.upload_media, item, api)]
+        response = await call_api("create", client.create_tweet, text=item["tweet"], media_ids=media_ids)
+        logger.info(f"Tweet posted successfully! Tweet ID: {response.data['id']}")
+    except Exception as e:
+        logger.error(f"Error posting buffered tweet: {e}")
+        await asyncio.to_thread(buffer.requeue, item)
+        return
+
+    if item["image_path"]:
+        await asyncio.to_thread(buffer.discard, item)
+
+async def tweet_scheduler(client, api, interval_hours=8):
+    """Task posting a buffered tweet every interval_hours."""
+    logger.info(f"Starting tweet scheduler task (interval: {interval_hours} hours)")
+    while True:
+        try:
+            await post_buffered_tweet(client, api)
+            await asyncio.sleep(interval_hours * 60 * 60)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in tweet scheduler: {e}")
+            await asyncio.sleep(15 * 60)
+
+async def content_producer(api, check_interval=5 * 60):
+    """Task keeping the content buffer filled and its images uploaded; each generation and upload runs in a worker thread."""
+    buffer = get_content_buffer()
+    while True:
+        try:
+            await asyncio.to_thread(buffer.expire)
+            config = load_posting_config()
+            if await asyncio.to_thread(buffer.needs_refill):
+                image_probability = config.get("image_probability", 0.7)
+                while not await asyncio.to_thread(buffer.is_full):
+                    await asyncio.to_thread(generate_buffered_item, buffer, image_probability)
+            if config.get("preupload_media", True):
+                await asyncio.to_thread(buffer.preupload, api)
+            await asyncio.sleep(check_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in content producer: {e}")
+            await asyncio.sleep(60)
+
+async def token_refresher(client, check_interval=30 * 60):
+    """Task refreshing the bearer token shortly before it expires and rotating it into the async client."""
+    manager = get_default_account().token_manager
+    while True:
+        try:
+            await asyncio.to_thread(manager.refresh)
+            # Rotate the token into the shared sync clients (used for media upload) and the async client
+            await asyncio.to_thread(get_twitter_clients)
+            bearer_token = load_config(manager.credentials_key)["access_bearer_token"]
+            if client.bearer_token != bearer_token:
+                client.bearer_token = bearer_token
+                logger.info("Rotated bearer token on the async client")
+            await asyncio.sleep(manager.next_check_in(check_interval))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in token refresh task: {e}")
+            await asyncio.sleep(manager.retry_interval)
+
+async def run_async_agent(include_scheduler=True, test_mode=False, scheduler_interval=8):
+    """
+    Run the agent as tasks in a single event loop.
+
+    Monitors, reply workers, the tweet scheduler, the content producer and the
+    token refresher are asyncio tasks instead of threads, so many API and
+    OpenAI calls can be in flight at once. SIGINT/SIGTERM cancel every task,
+    release replies that were in progress and flush the processed stores.
+    """
+    logger.info("Starting async Twitter agent")
+
+    # Refresh the token if needed and get the sync clients (used for media upload)
+    _, api = await asyncio.to_thread(get_default_account().get_clients)
+    client = open_session(create_async_client(load_config(get_default_account().credentials_key)))
+
+    configure_rate_limits()
+    load_processed_tweets()
+    user_id = (await call_api("users_me", client.get_me)).data.id
+    logger.info(f"Starting monitoring for user ID: {user_id}")
+
+    config = load_monitoring_config()
+    num_workers = config.get("async_reply_workers", 100)
+    generation_slots = asyncio.Semaphore(config.get("async_max_concurrent_generations", num_workers))
+
+    # Set whenever tweets are queued, so idle reply workers wake up instead of polling
+    reply_ready = asyncio.Event()
+
+    coroutines = [
+        ("TokenRefresher", token_refresher(client)),
+        ("MentionsMonitor", monitor_mentions(client, user_id, reply_ready)),
+        ("HashtagsMonitor", monitor_search(client, user_id, "hashtag", reply_ready)),
+        ("KeywordsMonitor", monitor_search(client, user_id, "keyword", reply_ready))
+    ]
+    coroutines += [
+        (f"ReplyWorker-{index + 1}", reply_worker(client, generation_slots, reply_ready))
+        for index in range(num_workers)
+    ]
+    if include_scheduler:
+        coroutines.append(("TweetScheduler", tweet_scheduler(client, api, scheduler_interval)))
+        if not batch_tweets_enabled():
+            coroutines.append(("ContentProducer", content_producer(api)))
+
+    # Batches are polled rarely and block on file uploads, so they keep their own thread
+    batch_tweets = include_scheduler and batch_tweets_enabled()
+    if batch_replies_enabled() or batch_tweets:
+        create_batch_worker(get_default_account().reply_queue, include_tweets=batch_tweets).start()
+
+    tasks = [asyncio.create_task(coroutine, name=name) for name, coroutine in coroutines]
+    logger.info(f"Started {len(tasks)} tasks with {num_workers} reply workers")
+
+    if test_mode:
+        test_reply_queue(client)
+        reply_ready.set()
+
+    # Stop on SIGINT/SIGTERM (where the event loop supports signal handlers)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Shutting down...")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await client.session.close()
+        await asyncio.to_thread(save_processed_tweets)
+        await asyncio.to_thread(load_replied_tweets().flush)
+        logger.info("All tasks stopped")
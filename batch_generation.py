@@ -0,0 +1,467 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from config_cache import load_json, PROMPTS_FILE
+from content_buffer import get_content_buffer, load_posting_config, preupload_buffered_media
+from prompt_registry import get_prompt_registry
+
+logger = logging.getLogger("batch_generation")
+
+# OpenAI Batch API settings
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_MODEL = "gpt-4o-mini"
+
+# Batch states after which no more results will arrive
+FINISHED_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Files used to track batches in flight and the JSONL inputs sent to OpenAI
+BATCH_STATE_FILE = "batch_jobs.json"
+BATCH_INPUT_DIR = "batches"
+
+def load_batch_config():
+    """Load the batch configuration from the prompts template file."""
+    try:
+        return load_json(PROMPTS_FILE).get("batch", {})
+    except Exception as e:
+        logger.error(f"Error loading batch config: {e}")
+        return {}
+
+def batch_replies_enabled():
+    """Check whether hashtag and keyword replies should be generated in batches."""
+    config = load_batch_config()
+    return config.get("enabled", False) and config.get("replies", True)
+
+def batch_tweets_enabled():
+    """Check whether the content buffer should be filled through batches."""
+    config = load_batch_config()
+    return config.get("enabled", False) and config.get("tweets", True)
+
+def build_chat_request(custom_id, messages, model=BATCH_MODEL, temperature=0.4):
+    """Build one line of a Batch API input file for a chat completion."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature
+        }
+    }
+
+def write_batch_file(requests, path):
+    """Write batch requests to a JSONL file and return its path."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+    return path
+
+def extract_field(content, field):
+    """Extract a field from a JSON model response, falling back to the raw content."""
+    try:
+        return json.loads(content)[field]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return content
+
+def get_result_content(result):
+    """Return the message content of a Batch API output line, or None if the request failed."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+    try:
+        return response["body"]["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+class OpenAIBatchTransport:
+    """
+    Submits batch files to the OpenAI Batch API.
+
+    Args:
+        client: Optional OpenAI client (default: the shared client from ai_utils)
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from ai_utils import get_openai_client
+            self._client = get_openai_client()
+        return self._client
+
+    def submit(self, path, metadata=None):
+        """Upload a JSONL file and start a batch. Returns the batch ID."""
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+            metadata=metadata
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        """
+        Check on a batch.
+
+        Returns:
+            Tuple of (status, results); results is a list of output lines once
+            the batch has finished, otherwise None
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in FINISHED_STATUSES:
+            return batch.status, None
+
+        # Expired and cancelled batches can still hold results for the requests that ran
+        results = []
+        if batch.output_file_id:
+            content = self.client.files.content(batch.output_file_id)
+            for line in content.text.splitlines():
+                if line.strip():
+                    results.append(json.loads(line))
+        return batch.status, results
+
+    def cancel(self, batch_id):
+        """Cancel a batch that is still running."""
+        self.client.batches.cancel(batch_id)
+
+class LocalBatchTransport:
+    """
+    In-process stand-in for the Batch API, for testing without OpenAI.
+
+    Batches finish after the given number of polls and every request is
+    answered by the responder, a function taking the request body and
+    returning the message content.
+
+    Args:
+        responder: Function of (request body) -> content (default: a fixed JSON tweet/reply)
+        polls_until_done: Number of polls a batch stays in progress (default: 0)
+    """
+
+    def __init__(self, responder=None, polls_until_done=0):
+        self.responder = responder or (lambda body: json.dumps({
+            "tweet": "Local batch tweet",
+            "reply": "Local batch reply"
+        }))
+        self.polls_until_done = polls_until_done
+        self._batches = {}
+
+    def submit(self, path, metadata=None):
+        """Read a JSONL file and register it as a batch. Returns the batch ID."""
+        with open(path, "r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        self._batches[batch_id] = {"requests": requests, "polls": 0, "status": "in_progress"}
+        return batch_id
+
+    def poll(self, batch_id):
+        """Check on a batch, answering all of its requests once it is done."""
+        batch = self._batches[batch_id]
+        if batch["status"] == "in_progress":
+            batch["polls"] += 1
+            if batch["polls"] <= self.polls_until_done:
+                return "in_progress", None
+            batch["status"] = "completed"
+
+        results = []
+        if batch["status"] == "completed":
+            for request in batch["requests"]:
+                results.append({
+                    "id": f"batch_req_{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"content": self.responder(request["body"])}}]}
+                    },
+                    "error": None
+                })
+        return batch["status"], results
+
+    def cancel(self, batch_id):
+        """Cancel a batch that is still running."""
+        self._batches[batch_id]["status"] = "cancelled"
+
+def _serializable(tweet_data):
+    """Return a copy of a reply queue item that can be stored as JSON."""
+    item = dict(tweet_data)
+    created_at = item.get("created_at")
+    if hasattr(created_at, "isoformat"):
+        item["created_at"] = created_at.isoformat()
+    return item
+
+class BatchGenerator:
+    """
+    Generates tweets and replies through batch jobs instead of one request each.
+
+    Tweets go into the content buffer once their batch finishes; for image
+    templates the text comes from the batch and the image is generated when
+    the result is ingested, since images can't be batched. Replies collected
+    with queue_reply() are submitted together and put on the reply queue with
+    their reply_text filled in. Replies whose batch fails or takes longer than
+    reply_max_wait_minutes are queued without a reply_text, so the reply
+    workers generate them as usual.
+
+    Batches in flight are tracked in a JSON file, so results submitted before
+    a restart are still picked up.
+
+    Args:
+        transport: Object with submit(path, metadata), poll(batch_id) and cancel(batch_id)
+                   (default: OpenAIBatchTransport)
+        reply_queue: Queue that finished replies are put on
+        content_buffer: Buffer that finished tweets are added to (default: the shared buffer)
+        state_path: Path of the JSON file tracking batches in flight
+        input_dir: Directory the JSONL input files are written to
+    """
+
+    def __init__(self, transport=None, reply_queue=None, content_buffer=None,
+                 state_path=BATCH_STATE_FILE, input_dir=BATCH_INPUT_DIR):
+        self.transport = transport or OpenAIBatchTransport()
+        self.reply_queue = reply_queue
+        self.content_buffer = content_buffer or get_content_buffer()
+        self.state_path = state_path
+        self.input_dir = input_dir
+        self._state = {"jobs": {}, "pending_replies": []}
+        self._lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        """Load the batches in flight from disk."""
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    self._state.update(json.load(f))
+                logger.info(f"Loaded {len(self._state['jobs'])} batches in flight")
+        except Exception as e:
+            logger.error(f"Error loading batch state from {self.state_path}: {e}")
+
+    def _save(self):
+        """Write the batches in flight to disk atomically."""
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, indent=4)
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving batch state to {self.state_path}: {e}")
+
+    def _submit(self, kind, requests, items):
+        """Write and submit a batch, recording what each request is for."""
+        batch_name = f"{kind}-{uuid.uuid4().hex}"
+        path = write_batch_file(requests, os.path.join(self.input_dir, f"{batch_name}.jsonl"))
+        batch_id = self.transport.submit(path, metadata={"kind": kind})
+        with self._lock:
+            self._state["jobs"][batch_id] = {
+                "kind": kind,
+                "submitted_at": time.time(),
+                "input_path": path,
+                "items": items
+            }
+            self._save()
+        logger.info(f"Submitted {kind} batch {batch_id} with {len(requests)} requests")
+        return batch_id
+
+    def has_pending(self, kind):
+        """Check whether a batch of the given kind is still in flight."""
+        with self._lock:
+            return any(job["kind"] == kind for job in self._state["jobs"].values())
+
+    def pending_replies(self):
+        """Return the number of replies held for the next batch or waiting on a batch in flight."""
+        with self._lock:
+            in_flight = sum(len(job["items"]) for job in self._state["jobs"].values() if job["kind"] == "replies")
+            return len(self._state["pending_replies"]) + in_flight
+
+    def submit_tweets(self, count, image_probability=0.7):
+        """Submit a batch generating count tweets from the prompt templates."""
+        registry = get_prompt_registry()
+        requests = []
+        items = {}
+        for _ in range(count):
+            custom_id = f"tweet-{uuid.uuid4().hex}"
+            if random.random() < image_probability:
+                template = registry.random_image_template()
+                items[custom_id] = {"image_prompt": template["image_prompt"]}
+            else:
+                template = registry.random_tweet_template()
+                items[custom_id] = {"image_prompt": None}
+            requests.append(build_chat_request(custom_id, template["tweet"].messages()))
+        return self._submit("tweets", requests, items)
+
+    def queue_reply(self, tweet_data):
+        """Hold a reply queue item until the next reply batch is submitted."""
+        with self._lock:
+            self._state["pending_replies"].append(_serializable(tweet_data))
+            self._save()
+
+    def submit_replies(self):
+        """Submit every held reply as one batch. Returns the batch ID, or None if none were held."""
+        with self._lock:
+            pending = self._state["pending_replies"]
+            if not pending or self.reply_queue is None:
+                return None
+            self._state["pending_replies"] = []
+            self._save()
+
+        requests = []
+        items = {}
+        try:
+            for tweet_data in pending:
+                custom_id = f"reply-{tweet_data['tweet_id']}"
+                messages = get_prompt_registry().reply_prompt().messages(user_tweet=tweet_data["text"])
+                requests.append(build_chat_request(custom_id, messages))
+                items[custom_id] = tweet_data
+            return self._submit("replies", requests, items)
+        except Exception as e:
+            logger.error(f"Error submitting reply batch, generating those replies directly: {e}")
+            for tweet_data in pending:
+                self._queue_reply_item(tweet_data)
+            return None
+
+    def _queue_reply_item(self, tweet_data, reply_text=None):
+        """Put a reply on the reply queue, with its pre-generated text if there is one."""
+        if reply_text:
+            tweet_data["reply_text"] = reply_text
+        self.reply_queue.put(tweet_data)
+
+    def _ingest_tweet(self, item, content):
+        """Add a finished tweet to the content buffer, generating its image if it has one."""
+        tweet_text = extract_field(content, "tweet")
+        image_path = None
+        if item.get("image_prompt"):
+            from ai_utils import _generate_image_url, store_image
+            image_path = store_image(_generate_image_url(item["image_prompt"]))
+        self.content_buffer.add(tweet_text, image_path)
+
+    def _ingest(self, job, results):
+        """Hand the results of a finished batch to the content buffer or reply queue."""
+        contents = {}
+        for result in results or []:
+            content = get_result_content(result)
+            if content is not None:
+                contents[result.get("custom_id")] = content
+
+        for custom_id, item in job["items"].items():
+            content = contents.get(custom_id)
+            try:
+                if job["kind"] == "replies":
+                    # Replies without a result are generated by the reply workers instead
+                    reply_text = extract_field(content, "reply") if content else None
+                    self._queue_reply_item(item, reply_text)
+                elif content is not None:
+                    self._ingest_tweet(item, content)
+            except Exception as e:
+                logger.error(f"Error ingesting batch result {custom_id}: {e}")
+
+        logger.info(f"Ingested {len(contents)}/{len(job['items'])} results from {job['kind']} batch")
+
+    def _finish(self, batch_id):
+        """Stop tracking a batch and remove its input file."""
+        with self._lock:
+            job = self._state["jobs"].pop(batch_id, None)
+            self._save()
+        if job and os.path.exists(job["input_path"]):
+            os.remove(job["input_path"])
+        return job
+
+    def poll(self, reply_max_wait_minutes=120):
+        """
+        Check every batch in flight and ingest the ones that have finished.
+
+        Reply batches still running after reply_max_wait_minutes are cancelled
+        and their replies queued for direct generation. Reply batches are left
+        alone when there is no reply queue (e.g. when only posting tweets).
+        """
+        with self._lock:
+            jobs = dict(self._state["jobs"])
+
+        for batch_id, job in jobs.items():
+            # Reply batches wait until a process with a reply queue picks them up
+            if job["kind"] == "replies" and self.reply_queue is None:
+                continue
+
+            try:
+                status, results = self.transport.poll(batch_id)
+            except Exception as e:
+                logger.error(f"Error polling batch {batch_id}: {e}")
+                continue
+
+            if status in FINISHED_STATUSES:
+                logger.info(f"Batch {batch_id} finished with status '{status}'")
+                # Ingest before forgetting the batch, so a crash in between re-ingests it
+                # on restart instead of losing its results (the stores drop duplicates)
+                self._ingest(job, results)
+                self._finish(batch_id)
+                continue
+
+            waited_minutes = (time.time() - job["submitted_at"]) / 60
+            if job["kind"] == "replies" and waited_minutes > reply_max_wait_minutes:
+                logger.warning(f"Reply batch {batch_id} still '{status}' after {waited_minutes:.0f} minutes, cancelling")
+                try:
+                    self.transport.cancel(batch_id)
+                except Exception as e:
+                    logger.error(f"Error cancelling batch {batch_id}: {e}")
+                self._ingest(job, [])
+                self._finish(batch_id)
+
+def batch_worker(generator, include_tweets=True):
+    """
+    Thread function that submits and polls batches.
+
+    On every round it submits the replies collected since the last round,
+    refills the content buffer through a batch when it runs low (if
+    include_tweets is set) and ingests the batches that have finished.
+    """
+    logger.info("Starting batch worker thread")
+
+    while True:
+        config = load_batch_config()
+        try:
+            generator.submit_replies()
+
+            buffer = generator.content_buffer
+            if include_tweets and buffer.needs_refill() and not generator.has_pending("tweets"):
+                image_probability = load_posting_config().get("image_probability", 0.7)
+                generator.submit_tweets(buffer.capacity - len(buffer), image_probability)
+
+            generator.poll(config.get("reply_max_wait_minutes", 120))
+
+            # Upload the images of freshly ingested tweets ahead of posting
+            if include_tweets and load_posting_config().get("preupload_media", True):
+                preupload_buffered_media(buffer)
+
+        except Exception as e:
+            logger.error(f"Error in batch worker: {e}")
+
+        time.sleep(config.get("poll_interval_minutes", 10) * 60)
+
+# Process-wide generator shared by the monitors and the batch worker
+_batch_generator = None
+_batch_generator_lock = threading.Lock()
+
+def get_batch_generator(reply_queue=None, transport=None):
+    """Get the shared batch generator, creating it on first use."""
+    global _batch_generator
+    with _batch_generator_lock:
+        if _batch_generator is None:
+            _batch_generator = BatchGenerator(transport=transport, reply_queue=reply_queue)
+        elif reply_queue is not None and _batch_generator.reply_queue is None:
+            _batch_generator.reply_queue = reply_queue
+        return _batch_generator
+
+def create_batch_worker(reply_queue, include_tweets=True):
+    """Create (but don't start) the thread that submits and polls batches."""
+    return threading.Thread(
+        target=batch_worker,
+        args=(get_batch_generator(reply_queue), include_tweets),
+        daemon=True,
+        name="BatchWorker"
+    )
@@ -0,0 +1,94 @@
+import os
+import json
+import signal
+import logging
+import threading
+
+logger = logging.getLogger("config_cache")
+
+# Files shared by the whole agent
+PROMPTS_FILE = "prompts_template_alex.json"
+CONFIG_FILE = "config.json"
+
+# Section of config.json holding the credentials of the default account
+DEFAULT_CREDENTIALS_KEY = "Aalexhealth_token"
+
+class JsonFileCache:
+    """
+    Cached, parsed copy of a JSON file.
+
+    The file is parsed once and only re-read when its modification time or
+    size changes, or after invalidate_all() (e.g. on SIGHUP). Checking for a
+    change costs a single os.stat call, so callers can use get() on every loop.
+
+    Args:
+        path: Path of the JSON file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._signature = None
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        """Return a value that changes whenever the file is rewritten."""
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """Return the parsed file contents, reloading them if the file changed."""
+        with self._lock:
+            signature = self._file_signature()
+            generation = current_generation()
+            if self._data is None or signature != self._signature or generation != self._generation:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+                self._signature = signature
+                self._generation = generation
+                logger.info(f"Loaded {self.path}")
+            return self._data
+
+# Process-wide caches, one per file
+_caches = {}
+_caches_lock = threading.Lock()
+
+# Bumped to invalidate every cache at once. A plain counter needs no lock,
+# so it is safe to change from inside a signal handler.
+_generation = 0
+
+def current_generation():
+    """Return the current cache generation; cached values from older generations are stale."""
+    return _generation
+
+def invalidate_all():
+    """Force every cached file (and anything else keyed on the generation) to be reloaded."""
+    global _generation
+    _generation += 1
+
+def get_json_cache(path):
+    """Get the shared cache for a JSON file, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = JsonFileCache(path)
+            _caches[path] = cache
+        return cache
+
+def load_json(path):
+    """Return the cached, parsed contents of a JSON file."""
+    return get_json_cache(path).get()
+
+def install_reload_signal_handler():
+    """Reload cached configuration when the process receives SIGHUP (where supported)."""
+    if not hasattr(signal, "SIGHUP"):
+        logger.debug("SIGHUP is not available on this platform, skipping reload handler")
+        return False
+    if threading.current_thread() is not threading.main_thread():
+        logger.warning("Signal handlers can only be installed from the main thread")
+        return False
+
+    signal.signal(signal.SIGHUP, lambda signum, frame: invalidate_all())
+    logger.info("Send SIGHUP to reload configuration")
+    return True
@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from config_cache import load_json, PROMPTS_FILE
+from media_store import get_media_store, upload_image, media_expires_at, media_id_valid
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows): only threads of one process are serialized
+    fcntl = None
+
+logger = logging.getLogger("content_buffer")
+
+# File used to persist the buffer (images live in the media store)
+CONTENT_BUFFER_FILE = "content_buffer.json"
+
+def load_posting_config():
+    """Load the posting configuration from the prompts template file."""
+    try:
+        return load_json(PROMPTS_FILE).get("posting", {})
+    except Exception as e:
+        logger.error(f"Error loading posting config: {e}")
+        return {}
+
+class ContentBuffer:
+    """
+    Bounded, persisted buffer of ready-to-post tweets.
+
+    Each item holds the tweet text and, for image posts, the media store path
+    of an image that has already been generated and downloaded. Images are
+    uploaded ahead of time as well (see preupload()); the item keeps the media
+    ID and its expiry, so posting, and retrying a failed post, reuses the
+    upload until it is about to expire. Items older than max_age_hours are
+    discarded (with their images) instead of being posted, and so are items
+    whose post failed max_attempts times.
+
+    Several processes may share the buffer file (the agent, --post-now,
+    schedule_tweets.py), so every operation re-reads the file and writes it
+    back while holding an exclusive lock on path + ".lock".
+
+    Args:
+        path: Path of the JSON file holding the buffered items
+        capacity: Maximum number of buffered items
+        low_water_mark: Refill once the buffer holds this many items or fewer
+        max_age_hours: Age after which an item is considered stale
+        max_attempts: Failed posts after which an item is dropped (default: 3)
+    """
+
+    def __init__(self, path=CONTENT_BUFFER_FILE, capacity=6, low_water_mark=2, max_age_hours=48, max_attempts=3):
+        self.path = path
+        self.capacity = capacity
+        self.low_water_mark = low_water_mark
+        self.max_age_hours = max_age_hours
+        self.max_attempts = max_attempts
+        self._items = []
+        self._lock = threading.Lock()
+        with self._locked():
+            logger.info(f"Loaded {len(self._items)} buffered tweets")
+
+    @contextmanager
+    def _locked(self):
+        """Hold the buffer lock across threads and processes, with the items freshly loaded from disk."""
+        with self._lock:
+            with open(self.path + ".lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        """Load the buffered items from disk."""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._items = json.load(f)
+            else:
+                self._items = []
+        except Exception as e:
+            logger.error(f"Error loading content buffer from {self.path}: {e}")
+            self._items = []
+
+    def _save(self):
+        """Write the buffered items to disk atomically."""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._items, f, indent=4)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving content buffer to {self.path}: {e}")
+
+    def _is_stale(self, item, now):
+        """Check whether an item is too old or its image has gone missing."""
+        if now - item["created_at"] > self.max_age_hours * 60 * 60:
+            return True
+        image_path = item.get("image_path")
+        return bool(image_path) and not os.path.exists(image_path)
+
+    def discard(self, item):
+        """Delete the files belonging to a discarded item."""
+        image_path = item.get("image_path")
+        if image_path:
+            get_media_store().remove(image_path)
+
+    def expire(self):
+        """Drop stale items. Returns the number of items dropped."""
+        with self._locked():
+            now = time.time()
+            stale = [item for item in self._items if self._is_stale(item, now)]
+            if not stale:
+                return 0
+            self._items = [item for item in self._items if item not in stale]
+            self._save()
+
+        for item in stale:
+            self.discard(item)
+        logger.info(f"Expired {len(stale)} stale buffered tweets")
+        return len(stale)
+
+    def add(self, tweet_text, image_path=None):
+        """Add a ready-to-post tweet to the buffer."""
+        item = {
+            "id": uuid.uuid4().hex,
+            "tweet": tweet_text,
+            "image_path": image_path,
+            "created_at": time.time()
+        }
+        with self._locked():
+            self._items.append(item)
+            self._save()
+        return item
+
+    def pop(self):
+        """Remove and return the oldest fresh item, or None if the buffer is empty."""
+        self.expire()
+        with self._locked():
+            if not self._items:
+                return None
+            item = self._items.pop(0)
+            self._save()
+            return item
+
+    def requeue(self, item):
+        """
+        Put an item that could not be posted back at the front of the buffer.
+
+        After max_attempts failed posts the item is discarded instead, so one
+        tweet X keeps rejecting can't block the buffer. Returns True if the
+        item was requeued.
+        """
+        item["attempts"] = item.get("attempts", 0) + 1
+        if item["attempts"] >= self.max_attempts:
+            logger.warning(f"Dropping buffered tweet {item['id']} after {item['attempts']} failed attempts")
+            self.discard(item)
+            return False
+
+        with self._locked():
+            self._items.insert(0, item)
+            self._save()
+        return True
+
+    def upload_media(self, item, api):
+        """
+        Return a media ID for an item's image, uploading it only if the item has no valid one yet.
+
+        The new media ID and its expiry are recorded in the item (and saved,
+        if it is still buffered), so a later retry reuses the upload.
+        """
+        if media_id_valid(item.get("media_id"), item.get("media_expires_at")):
+            return item["media_id"]
+
+        media = upload_image(api, item["image_path"])
+        item["media_id"] = media.media_id
+        item["media_expires_at"] = media_expires_at(media)
+        with self._locked():
+            for buffered in self._items:
+                if buffered["id"] == item["id"]:
+                    buffered["media_id"] = item["media_id"]
+                    buffered["media_expires_at"] = item["media_expires_at"]
+                    self._save()
+                    break
+        logger.debug(f"Uploaded image of buffered tweet {item['id']} as media {media.media_id}")
+        return item["media_id"]
+
+    def preupload(self, api):
+        """Upload the images of buffered items that have no valid media ID. Returns the number uploaded."""
+        with self._locked():
+            pending = [
+                item for item in self._items
+                if item.get("image_path") and not media_id_valid(item.get("media_id"), item.get("media_expires_at"))
+            ]
+
+        uploaded = 0
+        for item in pending:
+            try:
+                self.upload_media(item, api)
+                uploaded += 1
+            except Exception as e:
+                logger.warning(f"Could not pre-upload image of buffered tweet {item['id']}: {e}")
+        if uploaded:
+            logger.info(f"Pre-uploaded {uploaded} buffered images")
+        return uploaded
+
+    def __len__(self):
+        with self._locked():
+            return len(self._items)
+
+    def needs_refill(self):
+        """Check whether the buffer has dropped to its low-water mark."""
+        return len(self) <= self.low_water_mark
+
+    def is_full(self):
+        """Check whether the buffer holds as many items as it may."""
+        return len(self) >= self.capacity
+
+def generate_buffered_item(buffer, image_probability=0.7):
+    """Generate one tweet (with an image, based on the probability) and add it to the buffer."""
+    from ai_utils import generate_tweet_and_image, generate_tweet_only
+
+    if random.random() < image_probability:
+        result = generate_tweet_and_image()
+        return buffer.add(result["tweet"], result["image_path"])
+
+    return buffer.add(generate_tweet_only())
+
+def preupload_buffered_media(buffer):
+    """Upload the buffered images that have no valid media ID with the shared v1.1 API."""
+    # Imported here since twitter_poster itself imports this module
+    from twitter_poster import get_twitter_clients
+    client, api = get_twitter_clients()
+    return buffer.preupload(api)
+
+def content_producer(buffer, check_interval=5 * 60):
+    """
+    Keep the content buffer topped up in the background.
+
+    Once the buffer drops to its low-water mark, tweets are generated until it
+    is full again, so scheduled posts never wait on OpenAI. With
+    posting.preupload_media on, buffered images are uploaded right away (and
+    again shortly before their media ID expires), so posts don't wait on the
+    upload either.
+    """
+    logger.info("Starting content producer thread")
+
+    while True:
+        try:
+            buffer.expire()
+            config = load_posting_config()
+
+            if buffer.needs_refill():
+                image_probability = config.get("image_probability", 0.7)
+                logger.info(f"Refilling content buffer ({len(buffer)}/{buffer.capacity} items)")
+                while not buffer.is_full():
+                    item = generate_buffered_item(buffer, image_probability)
+                    logger.info(f"Buffered tweet {item['id']} ({'with' if item['image_path'] else 'without'} image)")
+
+            if config.get("preupload_media", True):
+                preupload_buffered_media(buffer)
+
+            time.sleep(check_interval)
+
+        except Exception as e:
+            logger.error(f"Error in content producer: {e}")
+            time.sleep(60)  # Wait 1 minute before retrying
+
+# Process-wide buffer shared by the producer and the schedulers
+_content_buffer = None
+_content_buffer_lock = threading.Lock()
+
+def get_content_buffer():
+    """Get the shared content buffer, configured from the posting section of the prompts file."""
+    global _content_buffer
+    with _content_buffer_lock:
+        if _content_buffer is None:
+            config = load_posting_config()
+            _content_buffer = ContentBuffer(
+                capacity=config.get("buffer_size", 6),
+                low_water_mark=config.get("buffer_low_water_mark", 2),
+                max_age_hours=config.get("buffer_max_age_hours", 48),
+                max_attempts=config.get("buffer_max_post_attempts", 3)
+            )
+        return _content_buffer
+
+def create_content_producer():
+    """Create (but don't start) the thread that keeps the shared content buffer filled."""
+    return threading.Thread(
+        target=content_producer,
+        args=(get_content_buffer(),),
+        daemon=True,
+        name="ContentProducer"
+    )
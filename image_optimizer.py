@@ -0,0 +1,182 @@
+import logging
+import threading
+from io import BytesIO
+from config_cache import load_json, PROMPTS_FILE
+
+logger = logging.getLogger("image_optimizer")
+
+# PIL format name and file extension of each output format
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", ".jpg"),
+    "webp": ("WEBP", ".webp"),
+    "png": ("PNG", ".png")
+}
+
+# Palette sizes tried, in order, when quantizing a PNG
+PNG_COLOR_LEVELS = (256, 128, 64)
+
+# Images are never downscaled below this size to fit the byte budget
+MIN_DIMENSION = 256
+
+# Seconds to wait for a worker process before uploading the original
+OPTIMIZE_TIMEOUT = 120
+
+def _encode(image, pil_format, level):
+    """Encode an image at one quality level (palette size for PNG)."""
+    from PIL import Image
+    output = BytesIO()
+    if pil_format == "PNG":
+        image.quantize(colors=level, method=Image.Quantize.FASTOCTREE).save(output, format="PNG", optimize=True)
+    elif pil_format == "JPEG":
+        image.save(output, format="JPEG", quality=level, optimize=True)
+    else:
+        image.save(output, format=pil_format, quality=level)
+    return output.getvalue()
+
+def optimize_image(data, output_format="jpeg", quality=90, min_quality=70, max_bytes=1024 * 1024, max_dimension=1024):
+    """
+    Re-encode an image to fit a byte budget, without its metadata.
+
+    JPEG and WebP step the quality down from quality to min_quality; PNG is
+    quantized to a shrinking palette. If no level fits max_bytes, the image
+    is downscaled and tried again, down to MIN_DIMENSION pixels. Only the
+    pixels are kept, so EXIF, ICC profiles and text chunks are dropped.
+
+    Runs in a worker process, so it only depends on its arguments.
+
+    Returns:
+        Tuple of (image bytes, file extension)
+    """
+    from PIL import Image
+    pil_format, extension = OUTPUT_FORMATS[output_format]
+
+    image = Image.open(BytesIO(data))
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha and pil_format != "JPEG" else "RGB")
+    image.info = {}
+
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    if pil_format == "PNG":
+        levels = PNG_COLOR_LEVELS
+    else:
+        levels = range(quality, min_quality - 1, -5)
+
+    while True:
+        for level in levels:
+            encoded = _encode(image, pil_format, level)
+            if len(encoded) <= max_bytes:
+                return encoded, extension
+
+        if max(image.size) * 0.8 < MIN_DIMENSION:
+            return encoded, extension
+        image = image.resize((int(image.width * 0.8), int(image.height * 0.8)), Image.LANCZOS)
+
+class ImageOptimizer:
+    """
+    Shrinks generated images before they are stored and uploaded.
+
+    Encoding runs in a small process pool, so the CPU-heavy work never holds
+    the GIL of the thread that is about to post. If the pool fails, the
+    original image is used and the pool is rebuilt on the next call.
+
+    Args:
+        enabled: Whether images are optimized at all
+        output_format: "jpeg", "webp" or "png" (quantized)
+        quality: Starting JPEG/WebP quality (default: 90)
+        min_quality: Lowest JPEG/WebP quality tried before downscaling (default: 70)
+        max_bytes: Byte budget of an optimized image (default: 1 MB)
+        max_dimension: Longest side of an optimized image in pixels (default: 1024)
+        workers: Number of worker processes (default: 2)
+    """
+
+    def __init__(self, enabled=True, output_format="jpeg", quality=90, min_quality=70,
+                 max_bytes=1024 * 1024, max_dimension=1024, workers=2):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported image format '{output_format}', expected one of {', '.join(OUTPUT_FORMATS)}")
+        self.enabled = enabled
+        self.workers = workers
+        self.options = {
+            "output_format": output_format,
+            "quality": quality,
+            "min_quality": min_quality,
+            "max_bytes": max_bytes,
+            "max_dimension": max_dimension
+        }
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Return the process pool, starting it on first use."""
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # The agent's threads are already running, and forking a threaded
+                # process can copy a lock some other thread holds. Workers are
+                # forked from a clean single-threaded server (with PIL already
+                # imported) instead, or spawned where there is no forkserver.
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    mp_context = multiprocessing.get_context("forkserver")
+                    mp_context.set_forkserver_preload(["PIL.Image", "image_optimizer"])
+                else:
+                    mp_context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context)
+            return self._executor
+
+    def optimize(self, data):
+        """
+        Optimize an image in a worker process.
+
+        Returns:
+            Tuple of (image bytes, file extension), or None if optimization
+            is disabled or failed
+        """
+        if not self.enabled:
+            return None
+
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            future = self._get_executor().submit(optimize_image, data, **self.options)
+            optimized, extension = future.result(timeout=OPTIMIZE_TIMEOUT)
+        except BrokenProcessPool as e:
+            logger.error(f"Image optimizer pool broke, restarting it: {e}")
+            with self._lock:
+                self._executor = None
+            return None
+        except Exception as e:
+            logger.warning(f"Could not optimize image, using the original: {e}")
+            return None
+
+        logger.debug(f"Optimized image from {len(data) // 1024} KB to {len(optimized) // 1024} KB ({extension})")
+        return optimized, extension
+
+def load_image_config():
+    """Load the image optimization configuration from the prompts template file."""
+    try:
+        return load_json(PROMPTS_FILE).get("images", {})
+    except Exception as e:
+        logger.error(f"Error loading image config: {e}")
+        return {}
+
+# Process-wide optimizer, so every generation shares one process pool
+_image_optimizer = None
+_image_optimizer_lock = threading.Lock()
+
+def get_image_optimizer():
+    """Get the shared image optimizer, configured from the images section of the prompts file."""
+    global _image_optimizer
+    with _image_optimizer_lock:
+        if _image_optimizer is None:
+            config = load_image_config()
+            _image_optimizer = ImageOptimizer(
+                enabled=config.get("optimize", True),
+                output_format=config.get("format", "jpeg"),
+                quality=config.get("quality", 90),
+                min_quality=config.get("min_quality", 70),
+                max_bytes=config.get("max_kb", 1024) * 1024,
+                max_dimension=config.get("max_dimension", 1024),
+                workers=config.get("workers", 2)
+            )
+        return _image_optimizer
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from config_cache import load_json, PROMPTS_FILE
+
+logger = logging.getLogger("media_store")
+
+# Directory holding generated images, named by the hash of their contents
+MEDIA_STORE_DIR = "media"
+
+# File extension for each image type the Twitter media upload accepts
+IMAGE_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp"
+}
+
+class MediaStore:
+    """
+    Content-addressed, size-bounded store of generated images.
+
+    Each image is written once under the SHA-256 of its bytes, through a
+    uniquely named temporary file and an atomic rename, so concurrent
+    generations (in threads or in separate processes such as --post-now and
+    schedule_tweets.py) never overwrite each other's images. Once the
+    directory grows past max_bytes the least recently stored images are
+    deleted; the directory itself is the source of truth, so every process
+    sharing it sees the same size.
+
+    Args:
+        directory: Directory the images are stored in
+        max_bytes: Maximum total size of the stored images (default: 200 MB)
+    """
+
+    def __init__(self, directory=MEDIA_STORE_DIR, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path_for(self, data, extension=".png"):
+        """Return the path an image is (or would be) stored at."""
+        return os.path.join(self.directory, hashlib.sha256(data).hexdigest() + extension)
+
+    def put(self, data, extension=".png"):
+        """Store image bytes and return their unique path."""
+        path = self.path_for(data, extension)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if os.path.exists(path):
+                # Same image already stored; refresh it so eviction keeps it
+                os.utime(path)
+                return path
+
+            temp_path = f"{path}.{uuid.uuid4().hex}.part"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def remove(self, path):
+        """Delete a stored image that is no longer needed."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete stored image {path}: {e}")
+
+    def evict(self, keep=None):
+        """Delete the least recently stored images until the store fits max_bytes. Returns the number deleted."""
+        with self._lock:
+            files = []
+            total = 0
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return 0
+            for name in names:
+                if name.endswith(".part"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            evicted = 0
+            for mtime, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                self.remove(path)
+                total -= size
+                evicted += 1
+
+        if evicted:
+            logger.info(f"Evicted {evicted} images from the media store")
+        return evicted
+
+# Images larger than this are uploaded in chunks (INIT/APPEND/FINALIZE)
+CHUNKED_UPLOAD_THRESHOLD = 1024 * 1024
+
+# Lifetime assumed for a media ID when the upload response doesn't report one
+DEFAULT_MEDIA_LIFETIME = 24 * 60 * 60
+
+# A media ID this close to expiring is uploaded again rather than reused
+MEDIA_EXPIRY_MARGIN = 30 * 60
+
+def upload_image(api, image_path=None, image_data=None, extension=None, chunked_threshold=CHUNKED_UPLOAD_THRESHOLD):
+    """
+    Upload an image with the v1.1 API and return the media object.
+
+    Bytes are uploaded straight from memory; a path is only read when no
+    bytes are given. Images larger than chunked_threshold go through the
+    chunked INIT/APPEND/FINALIZE endpoints, which retry per chunk instead of
+    resending the whole file. The media type is worked out from the file
+    name, so in-memory bytes should come with their extension (e.g. ".jpg").
+    """
+    if image_data is None:
+        with open(image_path, "rb") as f:
+            image_data = f.read()
+    filename = os.path.basename(image_path) if image_path else "image" + (extension or ".png")
+    return api.media_upload(
+        filename=filename,
+        file=BytesIO(image_data),
+        chunked=len(image_data) > chunked_threshold,
+        media_category="tweet_image"
+    )
+
+def media_expires_at(media, uploaded_at=None):
+    """Return the time after which an uploaded media ID can no longer be attached to a tweet."""
+    lifetime = getattr(media, "expires_after_secs", None) or DEFAULT_MEDIA_LIFETIME
+    return (uploaded_at or time.time()) + lifetime
+
+def media_id_valid(media_id, expires_at, now=None):
+    """Check whether an uploaded media ID can still be reused."""
+    if not media_id or not expires_at:
+        return False
+    return (now or time.time()) < expires_at - MEDIA_EXPIRY_MARGIN
+
+# Process-wide media store
+_media_store = None
+_media_store_lock = threading.Lock()
+
+def get_media_store():
+    """Get the shared media store, sized from the posting section of the prompts file."""
+    global _media_store
+    with _media_store_lock:
+        if _media_store is None:
+            try:
+                config = load_json(PROMPTS_FILE).get("posting", {})
+            except Exception as e:
+                logger.error(f"Error loading posting config: {e}")
+                config = {}
+            _media_store = MediaStore(max_bytes=config.get("media_store_max_mb", 200) * 1024 * 1024)
+        return _media_store
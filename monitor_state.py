@@ -0,0 +1,122 @@
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger("monitor_state")
+
+# File to store the newest tweet ID seen per monitored stream
+MONITOR_STATE_FILE = "monitor_state.json"
+
+class HighWaterMarks:
+    """
+    Thread-safe record of the newest tweet ID seen on each monitored stream.
+
+    Streams are identified by keys such as "mentions:<user_id>", "hashtags" or
+    "keywords:<query hash>" (one per packed keyword query, see query_planner).
+    Marks only ever move forward and are written to disk atomically after each
+    update so polling resumes where it left off after a restart.
+
+    A poll that stops paging before it reaches the mark leaves a gap of unread
+    tweets below the ones it fetched. The gap is recorded next to the mark
+    (the oldest tweet read and the newest tweet seen) and the mark stays put,
+    so the next polls read the gap first and only then move the mark up.
+
+    Args:
+        path: Path of the JSON file holding the marks
+    """
+
+    def __init__(self, path=MONITOR_STATE_FILE):
+        self.path = path
+        self._marks = {}
+        self._gaps = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Load the marks from disk."""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                self._marks = state.get("since_ids", {})
+                self._gaps = state.get("gaps", {})
+                logger.info(f"Loaded high-water marks for {len(self._marks)} streams")
+        except Exception as e:
+            logger.error(f"Error loading monitor state from {self.path}: {e}")
+            self._marks = {}
+            self._gaps = {}
+
+    def _save(self):
+        """Write the marks to disk atomically."""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"since_ids": self._marks, "gaps": self._gaps}, f, indent=4)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving monitor state to {self.path}: {e}")
+
+    def get(self, stream_key):
+        """Return the newest tweet ID seen on a stream, or None if it was never polled."""
+        with self._lock:
+            return self._marks.get(stream_key)
+
+    def update(self, stream_key, tweet_id):
+        """Move a stream's mark forward to tweet_id if it is newer."""
+        if not tweet_id:
+            return
+        with self._lock:
+            current = self._marks.get(stream_key)
+            if current is not None and int(current) >= int(tweet_id):
+                return
+            self._marks[stream_key] = str(tweet_id)
+            self._save()
+
+    def reset(self, stream_key):
+        """Forget a stream's mark (and gap) so the next poll starts from the latest tweets."""
+        with self._lock:
+            had_gap = self._gaps.pop(stream_key, None) is not None
+            if self._marks.pop(stream_key, None) is not None or had_gap:
+                self._save()
+
+    def get_gap(self, stream_key):
+        """
+        Return the unread gap of a stream, or None if it has none.
+
+        Returns:
+            Tuple of (ID of the oldest tweet read above the gap, newest tweet ID seen)
+        """
+        with self._lock:
+            gap = self._gaps.get(stream_key)
+            return (gap["until_id"], gap["newest_id"]) if gap else None
+
+    def set_gap(self, stream_key, until_id, newest_id):
+        """Record that the tweets between a stream's mark and until_id are still unread."""
+        with self._lock:
+            self._gaps[stream_key] = {"until_id": str(until_id), "newest_id": str(newest_id)}
+            self._save()
+
+    def close_gap(self, stream_key):
+        """Move a stream's mark to the newest tweet seen above its gap, once the gap has been read."""
+        with self._lock:
+            gap = self._gaps.pop(stream_key, None)
+            if gap is None:
+                return
+            current = self._marks.get(stream_key)
+            if current is None or int(current) < int(gap["newest_id"]):
+                self._marks[stream_key] = gap["newest_id"]
+            self._save()
+
+# Process-wide marks shared by every monitor, one per state file
+_high_water_marks = {}
+_high_water_marks_lock = threading.Lock()
+
+def get_high_water_marks(path=MONITOR_STATE_FILE):
+    """Get the shared high-water marks for a state file, loading them on first use."""
+    with _high_water_marks_lock:
+        marks = _high_water_marks.get(path)
+        if marks is None:
+            marks = HighWaterMarks(path)
+            _high_water_marks[path] = marks
+        return marks
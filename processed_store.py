@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger("processed_store")
+
+# Default files used to persist processed tweet IDs
+PROCESSED_LOG_FILE = "processed_tweets.log"
+REPLIED_LOG_FILE = "replied_tweets.log"
+LEGACY_PROCESSED_FILE = "processed_tweets.json"
+
+# Marker written in place of a timestamp when a claim is released
+RELEASED_MARKER = "-"
+
+class ProcessedTweetStore:
+    """
+    Indexed, thread-safe store of processed tweet IDs.
+
+    IDs are kept in an in-memory dict (tweet ID -> time processed) for O(1)
+    lookups and persisted to an append-only log, one "<tweet_id>\\t<timestamp>"
+    line per entry. Entries older than the retention window are dropped and the
+    log is compacted each time it has grown by compact_threshold lines (or by its
+    own size, whichever is larger), so disk use stays proportional to the window.
+
+    New entries are buffered and written in one append per flush, either when
+    flush_batch_size entries are pending or every flush_interval seconds.
+
+    Args:
+        path: Path of the append-only log file
+        retention_days: How long to remember a processed tweet (default: 30)
+        compact_threshold: Minimum number of log lines before compaction is considered
+        flush_batch_size: Number of pending entries that forces a flush (default: 50)
+        flush_interval: Seconds between background flushes, 0 to disable (default: 5)
+        legacy_path: Optional JSON list of IDs to import when the log doesn't exist yet
+    """
+
+    def __init__(self, path=PROCESSED_LOG_FILE, retention_days=30, compact_threshold=5000,
+                 flush_batch_size=50, flush_interval=5, legacy_path=None):
+        self.path = path
+        self.retention_seconds = retention_days * 24 * 60 * 60
+        self.compact_threshold = compact_threshold
+        self.flush_batch_size = flush_batch_size
+        self.flush_interval = flush_interval
+        self.legacy_path = legacy_path
+        self._entries = {}
+        self._pending = []
+        self._log_lines = 0
+        self._compact_at = compact_threshold
+        self._lock = threading.RLock()
+        self._load()
+
+        # Flush whatever is still buffered when the process exits
+        atexit.register(self.flush)
+
+        if flush_interval > 0:
+            flusher = threading.Thread(
+                target=self._flush_loop,
+                daemon=True,
+                name=f"ProcessedStoreFlusher-{os.path.basename(path)}"
+            )
+            flusher.start()
+
+    def _load(self):
+        """Load entries from the log file, migrating the legacy JSON list if needed."""
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        self._log_lines += 1
+                        parts = line.rstrip("\n").split("\t")
+                        if len(parts) != 2:
+                            # Skip lines truncated by a crash mid-write
+                            continue
+                        if parts[1] == RELEASED_MARKER:
+                            self._entries.pop(parts[0], None)
+                            continue
+                        try:
+                            self._entries[parts[0]] = float(parts[1])
+                        except ValueError:
+                            continue
+                logger.info(f"Loaded {len(self._entries)} processed tweets from {self.path}")
+            except Exception as e:
+                logger.error(f"Error loading processed tweets from {self.path}: {e}")
+        elif self.legacy_path and os.path.exists(self.legacy_path):
+            # Import the old JSON list once, then continue with the log
+            try:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
+                    legacy_ids = json.load(f)
+                now = time.time()
+                for tweet_id in legacy_ids:
+                    self._entries[str(tweet_id)] = now
+                logger.info(f"Migrated {len(self._entries)} processed tweets from {self.legacy_path}")
+                self.compact()
+            except Exception as e:
+                logger.error(f"Error migrating processed tweets from {self.legacy_path}: {e}")
+        else:
+            logger.info(f"No processed tweets file found at {self.path}, creating a new one")
+
+        if self.prune() or self._log_lines > len(self._entries):
+            self.compact()
+
+    def __contains__(self, tweet_id):
+        with self._lock:
+            return str(tweet_id) in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def claim(self, tweet_id):
+        """
+        Atomically check and mark a tweet ID as processed.
+
+        Returns:
+            True if the caller claimed the tweet, False if it was already processed
+        """
+        key = str(tweet_id)
+        with self._lock:
+            if key in self._entries:
+                return False
+
+            processed_at = time.time()
+            self._entries[key] = processed_at
+            self._pending.append(f"{key}\t{processed_at:.0f}\n")
+
+            if len(self._pending) >= self.flush_batch_size:
+                self.flush()
+            return True
+
+    def add(self, tweet_id):
+        """Mark a tweet ID as processed."""
+        self.claim(tweet_id)
+
+    def release(self, tweet_id):
+        """Forget a claimed tweet ID so it can be processed again."""
+        key = str(tweet_id)
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return
+            self._pending.append(f"{key}\t{RELEASED_MARKER}\n")
+
+    def flush(self):
+        """Write all pending entries to the log in a single append."""
+        with self._lock:
+            if not self._pending:
+                return
+
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(self._pending))
+                self._log_lines += len(self._pending)
+                self._pending = []
+            except Exception as e:
+                logger.error(f"Error appending processed tweets to {self.path}: {e}")
+                return
+
+            self._maybe_compact()
+
+    def _flush_loop(self):
+        """Background loop that coalesces pending entries into periodic writes."""
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def prune(self):
+        """Drop entries older than the retention window."""
+        with self._lock:
+            cutoff = time.time() - self.retention_seconds
+            expired = [key for key, processed_at in self._entries.items() if processed_at < cutoff]
+            for key in expired:
+                del self._entries[key]
+
+        if expired:
+            logger.info(f"Pruned {len(expired)} processed tweets older than the retention window")
+        return len(expired)
+
+    def _maybe_compact(self):
+        """Prune and compact the log once it has grown past the next checkpoint."""
+        if self._log_lines >= self._compact_at:
+            self.prune()
+            self.compact()
+
+    def compact(self):
+        """Rewrite the log so it holds exactly one line per live entry."""
+        with self._lock:
+            # Pending entries are part of the live set, so they go into the rewrite
+            self._pending = []
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    for key, processed_at in self._entries.items():
+                        f.write(f"{key}\t{processed_at:.0f}\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+                self._log_lines = len(self._entries)
+                self._compact_at = self._log_lines + max(self.compact_threshold, self._log_lines)
+                logger.debug(f"Compacted {self.path} to {self._log_lines} entries")
+            except Exception as e:
+                logger.error(f"Error compacting {self.path}: {e}")
+
+# Process-wide stores, one per log file
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_processed_store(path=PROCESSED_LOG_FILE, retention_days=30, legacy_path=None):
+    """
+    Get the shared store for a log file, creating it on first use.
+
+    Every thread that dedups against the same file must use the same instance,
+    so the monitors and reply workers all go through this function.
+    """
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = ProcessedTweetStore(path, retention_days=retention_days, legacy_path=legacy_path)
+            _stores[path] = store
+        return store
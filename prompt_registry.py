@@ -0,0 +1,151 @@
+import random
+import logging
+import threading
+from config_cache import load_json, PROMPTS_FILE
+
+logger = logging.getLogger("prompt_registry")
+
+# Placeholder for the tweet being replied to in the reply prompt instructions
+USER_TWEET_PLACEHOLDER = "{user_tweet}"
+
+class CompiledPrompt:
+    """
+    Prompt split into a static system prefix and an optional user message template.
+
+    The system prefix is rendered once when the templates are loaded and is
+    identical on every call, so OpenAI can serve it from its prompt cache. Only
+    the user message changes per call; its placeholders are filled by name.
+
+    Args:
+        system_prefix: Static system message
+        user_template: Optional user message with named placeholders, e.g. "{user_tweet}"
+    """
+
+    def __init__(self, system_prefix, user_template=None):
+        self.system_prefix = system_prefix
+        self.user_template = user_template
+
+    def render_user(self, **values):
+        """Fill the named placeholders of the user message template."""
+        text = self.user_template
+        for name, value in values.items():
+            text = text.replace("{" + name + "}", str(value))
+        return text
+
+    def messages(self, **values):
+        """Return the chat messages for this prompt with the placeholders filled in."""
+        messages = [{"role": "system", "content": self.system_prefix}]
+        if self.user_template is not None:
+            messages.append({"role": "user", "content": self.render_user(**values)})
+        return messages
+
+def _require(condition, message, path=PROMPTS_FILE):
+    """Raise a ValueError describing an invalid template file unless the condition holds."""
+    if not condition:
+        raise ValueError(f"Invalid {path}: {message}")
+
+def compile_reply_prompt(reply_prompt, path=PROMPTS_FILE):
+    """
+    Compile the reply prompt.
+
+    The instruction line holding the {user_tweet} placeholder becomes the user
+    message; the task and every other instruction form the static system prefix.
+    """
+    _require(isinstance(reply_prompt.get("task"), str), "reply_prompt.task must be a string", path)
+    instructions = reply_prompt.get("instructions")
+    _require(isinstance(instructions, list), "reply_prompt.instructions must be a list", path)
+
+    placeholder_lines = [line for line in instructions if USER_TWEET_PLACEHOLDER in line]
+    _require(len(placeholder_lines) == 1,
+             f"reply_prompt.instructions must contain {USER_TWEET_PLACEHOLDER} exactly once", path)
+
+    static_lines = [line for line in instructions if USER_TWEET_PLACEHOLDER not in line]
+    system_prefix = reply_prompt["task"] + "\n" + "\n".join(static_lines)
+    return CompiledPrompt(system_prefix, placeholder_lines[0])
+
+def compile_tweet_prompts(templates, section, with_image=False, path=PROMPTS_FILE):
+    """Compile a list of tweet templates, keeping the image prompt alongside when there is one."""
+    _require(isinstance(templates, list) and templates, f"{section} must be a non-empty list", path)
+
+    compiled = []
+    for index, template in enumerate(templates):
+        _require(isinstance(template.get("tweet_text_prompt"), str),
+                 f"{section}[{index}].tweet_text_prompt must be a string", path)
+        entry = {"tweet": CompiledPrompt(template["tweet_text_prompt"])}
+        if with_image:
+            _require(isinstance(template.get("image_prompt"), str),
+                     f"{section}[{index}].image_prompt must be a string", path)
+            entry["image_prompt"] = template["image_prompt"]
+        compiled.append(entry)
+    return compiled
+
+class PromptRegistry:
+    """
+    Validated, precompiled prompts from the prompt template file.
+
+    The file is read through the shared config cache and compiled once; it is
+    only recompiled after the file changes on disk (or on SIGHUP). If an edited
+    file doesn't validate, the last good prompts stay in use.
+
+    Args:
+        path: Path of the prompt template file
+    """
+
+    def __init__(self, path=PROMPTS_FILE):
+        self.path = path
+        self._source = None
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        """Return the compiled prompts, recompiling them if the file changed."""
+        data = load_json(self.path)
+        with self._lock:
+            if data is not self._source:
+                try:
+                    self._compiled = {
+                        "reply": compile_reply_prompt(data.get("reply_prompt", {}), self.path),
+                        "tweet": compile_tweet_prompts(data.get("tweet_prompt"), "tweet_prompt", path=self.path),
+                        "image": compile_tweet_prompts(data.get("Image_prompts"), "Image_prompts", with_image=True,
+                                                       path=self.path)
+                    }
+                    logger.info(f"Compiled prompt templates from {self.path}")
+                except (ValueError, AttributeError) as e:
+                    if self._compiled is None:
+                        raise
+                    logger.error(f"Keeping the previous prompt templates: {e}")
+                self._source = data
+            return self._compiled
+
+    def reply_prompt(self):
+        """Return the compiled reply prompt (fill it with user_tweet=...)."""
+        return self._get()["reply"]
+
+    def tweet_templates(self):
+        """Return the compiled text-only tweet templates."""
+        return self._get()["tweet"]
+
+    def image_templates(self):
+        """Return the compiled image tweet templates, each with its image prompt."""
+        return self._get()["image"]
+
+    def random_tweet_template(self):
+        """Return a random text-only tweet template."""
+        return random.choice(self.tweet_templates())
+
+    def random_image_template(self):
+        """Return a random image tweet template."""
+        return random.choice(self.image_templates())
+
+# Process-wide registry, one per template file
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_prompt_registry(path=PROMPTS_FILE):
+    """Get the shared prompt registry for a template file, creating it on first use."""
+    with _registries_lock:
+        registry = _registries.get(path)
+        if registry is None:
+            registry = PromptRegistry(path)
+            _registries[path] = registry
+        return registry
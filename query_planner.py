@@ -0,0 +1,221 @@
+import re
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("query_planner")
+
+# Maximum length of a recent search query
+MAX_QUERY_LENGTH = 512
+
+# Operators appended to every keyword query
+KEYWORD_QUERY_SUFFIX = "lang:en"
+
+# Weight of the latest poll in a query's smoothed hit rate
+HIT_RATE_SMOOTHING = 0.3
+
+def pack_terms(terms, suffix="", max_length=MAX_QUERY_LENGTH):
+    """
+    Pack OR-ed terms into as few query values as fit max_length.
+
+    Args:
+        terms: Terms to match, already quoted where needed
+        suffix: Operators appended to every value, e.g. "lang:en"
+
+    Returns:
+        List of query values
+    """
+    return [value for value, group in pack_groups(terms, suffix, max_length)]
+
+def pack_groups(terms, suffix="", max_length=MAX_QUERY_LENGTH):
+    """Like pack_terms, but return (value, terms in the value) pairs."""
+    def query_value(group):
+        value = " OR ".join(group)
+        if suffix:
+            value = f"({value}) {suffix}" if len(group) > 1 else f"{value} {suffix}"
+        return value
+
+    packed = []
+    group = []
+    for term in terms:
+        if group and len(query_value(group + [term])) > max_length:
+            packed.append((query_value(group), group))
+            group = []
+        group.append(term)
+    if group:
+        packed.append((query_value(group), group))
+    return packed
+
+def keyword_pattern(keywords):
+    """Compile a case-insensitive pattern matching any of the keywords as whole words."""
+    alternatives = [r"\s+".join(re.escape(word) for word in keyword.split()) for keyword in keywords]
+    return re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)", re.IGNORECASE)
+
+class KeywordQuery:
+    """
+    One packed search query and the keywords of each category it covers.
+
+    Args:
+        text: The search query
+        keywords: Dict of category -> keywords included in the query
+    """
+
+    def __init__(self, text, keywords):
+        self.text = text
+        self.keywords = keywords
+        self.categories = list(keywords)
+        # Each query has its own high-water mark, keyed by its text
+        self.stream_key = "keywords:" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        self.hit_rate = 0.0
+        self.weight = 1.0
+        self.current_weight = 0.0
+        self._patterns = [(category, keyword_pattern(words)) for category, words in keywords.items()]
+
+    def route(self, text):
+        """
+        Return the category of a tweet found by this query.
+
+        The tweet text is matched against each category's keywords locally;
+        when none match (X also matches inside URLs and normalizes some
+        punctuation), the query's first category is used.
+        """
+        for category, pattern in self._patterns:
+            if pattern.search(text or ""):
+                return category
+        return self.categories[0]
+
+    def __repr__(self):
+        return f"KeywordQuery({', '.join(self.categories)})"
+
+class QueryPlanner:
+    """
+    Plans the keyword searches of each poll.
+
+    The keywords of every category are packed, in configuration order, into
+    as few queries of at most max_query_length characters as possible, so a
+    poll that runs all of them covers every category at the lowest request
+    cost. With queries_per_poll set, each poll runs only that many of them,
+    picked round-robin or, with the "weighted" strategy, by smooth weighted
+    round-robin on each query's recent hit rate. Every query keeps a weight of
+    at least 1, so quiet categories are still searched regularly.
+
+    The plan is rebuilt when the keywords change; queries whose text is
+    unchanged keep their hit rate.
+
+    Args:
+        max_query_length: Maximum length of a query (default: 512)
+        strategy: "round_robin" or "weighted" (default: "round_robin")
+        queries_per_poll: Number of queries run per poll, 0 for all of them (default: 0)
+    """
+
+    def __init__(self, max_query_length=MAX_QUERY_LENGTH, strategy="round_robin", queries_per_poll=0):
+        if strategy not in ("round_robin", "weighted"):
+            raise ValueError(f"Unknown query strategy '{strategy}', expected 'round_robin' or 'weighted'")
+        self.max_query_length = max_query_length
+        self.strategy = strategy
+        self.queries_per_poll = queries_per_poll
+        self.queries = []
+        self._signature = None
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    def _plan(self, keyword_categories):
+        """Pack the keyword categories into queries (called with the lock held)."""
+        signature = json.dumps(keyword_categories, sort_keys=True)
+        if signature == self._signature:
+            return
+        self._signature = signature
+
+        terms = []
+        categories = {}
+        for category, keywords in keyword_categories.items():
+            for keyword in keywords:
+                term = f'"{keyword}"'
+                terms.append(term)
+                categories.setdefault(term, []).append((category, keyword))
+
+        previous = {query.text: query for query in self.queries}
+        queries = []
+        for value, group in pack_groups(terms, KEYWORD_QUERY_SUFFIX, self.max_query_length):
+            keywords = {}
+            for term in dict.fromkeys(group):
+                for category, keyword in categories[term]:
+                    keywords.setdefault(category, []).append(keyword)
+            query = previous.get(value) or KeywordQuery(value, keywords)
+            queries.append(query)
+
+        self.queries = queries
+        self._next_index = 0
+        logger.info(f"Packed {len(keyword_categories)} keyword categories into {len(queries)} search queries")
+
+    def next_queries(self, keyword_categories):
+        """Return the queries to run on this poll."""
+        with self._lock:
+            self._plan(keyword_categories)
+            count = self.queries_per_poll or len(self.queries)
+            if count >= len(self.queries):
+                return list(self.queries)
+
+            if self.strategy == "round_robin":
+                selected = [
+                    self.queries[(self._next_index + offset) % len(self.queries)]
+                    for offset in range(count)
+                ]
+                self._next_index = (self._next_index + count) % len(self.queries)
+                return selected
+
+            # Smooth weighted round-robin, picking count distinct queries
+            candidates = list(self.queries)
+            selected = []
+            for _ in range(count):
+                total = sum(query.weight for query in candidates)
+                for query in candidates:
+                    query.current_weight += query.weight
+                chosen = max(candidates, key=lambda query: query.current_weight)
+                chosen.current_weight -= total
+                candidates.remove(chosen)
+                selected.append(chosen)
+            return selected
+
+    def record(self, query, hits):
+        """Record how many new tweets a query found, for the weighted strategy."""
+        with self._lock:
+            query.hit_rate = (1 - HIT_RATE_SMOOTHING) * query.hit_rate + HIT_RATE_SMOOTHING * hits
+            query.weight = 1.0 + query.hit_rate
+
+def seed_high_water_mark(high_water_marks, query):
+    """
+    Give a new query the high-water mark of the categories it covers.
+
+    Marks used to be kept per category ("keywords:<category>"). When a query
+    has no mark yet but all of its categories do, it starts from the oldest of
+    them, so no tweets are skipped when the plan changes.
+    """
+    if high_water_marks.get(query.stream_key) is not None:
+        return
+    marks = [high_water_marks.get(f"keywords:{category}") for category in query.categories]
+    if marks and all(mark is not None for mark in marks):
+        high_water_marks.update(query.stream_key, min(marks, key=int))
+
+def load_query_config(monitoring_config):
+    """Return the keyword_queries section of a monitoring configuration."""
+    return monitoring_config.get("keyword_queries", {})
+
+# Process-wide planners, one per account so each rotates through its own plan
+_query_planners = {}
+_query_planners_lock = threading.Lock()
+
+def get_query_planner(key, monitoring_config=None):
+    """Get the query planner for an account, configured from its monitoring configuration on first use."""
+    with _query_planners_lock:
+        planner = _query_planners.get(key)
+        if planner is None:
+            config = load_query_config(monitoring_config or {})
+            planner = QueryPlanner(
+                max_query_length=config.get("max_query_length", MAX_QUERY_LENGTH),
+                strategy=config.get("strategy", "round_robin"),
+                queries_per_poll=config.get("queries_per_poll", 0)
+            )
+            _query_planners[key] = planner
+        return planner
@@ -0,0 +1,660 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import sqlite3
+import threading
+from copy import deepcopy
+from reply_scheduler import ReplyScheduler, get_due_time, get_priority
+from reply_journal import DurableReplyScheduler, REPLY_JOURNAL_FILE
+from config_cache import load_json, PROMPTS_FILE
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:
+    class WatchError(Exception):
+        """Raised when a watched key changed before a transaction ran (redis is not installed)."""
+
+logger = logging.getLogger("queue_backends")
+
+# Database used by the SQLite reply queue backend
+REPLY_QUEUE_DB_FILE = "reply_queue.db"
+
+# Key of the lease attached to items handed out by a leased queue
+LEASE_KEY = "_lease"
+
+def load_queue_config():
+    """Load the reply queue backend configuration from the prompts template file."""
+    try:
+        return load_json(PROMPTS_FILE).get("queue", {})
+    except Exception as e:
+        logger.error(f"Error loading queue config: {e}")
+        return {}
+
+def _serialize(tweet_data):
+    """Encode a reply queue item as JSON, without its lease."""
+    item = {key: value for key, value in tweet_data.items() if key != LEASE_KEY}
+    created_at = item.get("created_at")
+    if hasattr(created_at, "isoformat"):
+        item["created_at"] = created_at.isoformat()
+    return json.dumps(item)
+
+class LeasedReplyQueue:
+    """
+    Base class of the reply queues that can be shared between processes.
+
+    Items are claimed with a lease instead of being removed: get() hides the
+    item for visibility_timeout seconds and ack() deletes it once it has been
+    handled. If the worker holding the lease dies, the lease expires and the
+    item is handed out again, so a crash never loses a reply. Delivery is
+    at-least-once; the replied tweets store catches the rare duplicate.
+
+    Subclasses implement _push, _claim, _ack, next_due_in and qsize.
+
+    Args:
+        visibility_timeout: Seconds a claimed item stays hidden before it is handed out again (default: 600)
+        poll_interval: Maximum seconds between checks for items put by other processes (default: 1)
+    """
+
+    def __init__(self, visibility_timeout=600, poll_interval=1.0):
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._local_put = threading.Condition()
+
+    def put(self, tweet_data, not_before=None):
+        """Schedule a tweet for replying, not before its due time."""
+        due_time = get_due_time(tweet_data)
+        if not_before is not None:
+            due_time = max(due_time, not_before)
+
+        self._push(_serialize(tweet_data), due_time, get_priority(tweet_data))
+        with self._local_put:
+            self._local_put.notify()
+
+    def get(self, block=True, timeout=None):
+        """
+        Claim and return the highest-priority tweet that is due.
+
+        The returned item carries its lease; pass it to ack() when done. Raises
+        queue.Empty if nothing became due within the timeout, or immediately
+        when block is False.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            claimed = self._claim(time.time())
+            if claimed is not None:
+                lease, data = claimed
+                tweet_data = json.loads(data)
+                tweet_data[LEASE_KEY] = lease
+                return tweet_data
+
+            if not block:
+                raise queue.Empty
+
+            # Wait for the next due item, a local put, or another process's put (by polling)
+            wait_time = self.poll_interval
+            due_in = self.next_due_in()
+            if due_in is not None:
+                wait_time = min(wait_time, due_in)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+                wait_time = min(wait_time, remaining)
+            with self._local_put:
+                self._local_put.wait(wait_time)
+
+    def ack(self, tweet_data):
+        """Delete a claimed tweet once it has been handled."""
+        lease = tweet_data.get(LEASE_KEY)
+        if lease is not None:
+            self._ack(lease)
+
+    def empty(self):
+        """Return True if no tweets are scheduled."""
+        return self.qsize() == 0
+
+    def __len__(self):
+        return self.qsize()
+
+class SQLiteReplyQueue(LeasedReplyQueue):
+    """
+    Reply queue stored in a SQLite database.
+
+    Survives restarts, and several processes on the same machine can share
+    one backlog: claims run in an IMMEDIATE transaction so only one process
+    gets each item.
+
+    Args:
+        path: Path of the database file
+        visibility_timeout: Seconds a claimed item stays hidden before it is handed out again (default: 600)
+        poll_interval: Maximum seconds between checks for items put by other processes (default: 1)
+    """
+
+    def __init__(self, path=REPLY_QUEUE_DB_FILE, visibility_timeout=600, poll_interval=1.0):
+        super().__init__(visibility_timeout, poll_interval)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reply_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, due REAL NOT NULL, priority INTEGER NOT NULL, "
+            "data TEXT NOT NULL, lease TEXT, lease_until REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reply_queue_due ON reply_queue (due)")
+        logger.info(f"Using SQLite reply queue {path} with {self.qsize()} pending replies")
+
+    def _push(self, data, due_time, priority):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO reply_queue (due, priority, data) VALUES (?, ?, ?)",
+                (due_time, priority, data)
+            )
+
+    def _claim(self, now):
+        lease = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, data, lease FROM reply_queue WHERE due <= ? AND lease_until <= ? "
+                    "ORDER BY priority, due, id LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE reply_queue SET lease = ?, lease_until = ? WHERE id = ?",
+                        (lease, now + self.visibility_timeout, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        if row[2] is not None:
+            logger.warning(f"Lease on queued reply {row[0]} expired, handing it out again")
+        return lease, row[1]
+
+    def _ack(self, lease):
+        with self._lock:
+            self._conn.execute("DELETE FROM reply_queue WHERE lease = ?", (lease,))
+
+    def next_due_in(self):
+        """Return seconds until the next item is due (0 if one is ready), or None if empty."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(MAX(due, lease_until)) FROM reply_queue").fetchone()
+        if row[0] is None:
+            return None
+        return max(0, row[0] - time.time())
+
+    def qsize(self):
+        """Return the number of tweets waiting, ready or claimed."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reply_queue").fetchone()[0]
+
+class RedisReplyQueue(LeasedReplyQueue):
+    """
+    Reply queue kept in Redis, shared by agent processes on any number of machines.
+
+    Item bodies live in a hash, waiting items in a sorted set scored by due
+    time and claimed items in a sorted set scored by lease expiry. A claim is
+    a ZADD NX into the lease set followed by a ZREM from the waiting set, and
+    only succeeds if both do, so each item goes to one worker; expired leases
+    are moved back to the waiting set by whichever worker sees them first.
+    Every claim also stores a fresh token in a third hash, and ack() only
+    deletes the item (in a WATCH/MULTI transaction) while the token is still
+    the caller's, so a worker whose lease expired can't delete an item that
+    another worker has claimed since.
+
+    Args:
+        client: Redis client created with decode_responses=True (or a LocalRedis)
+        name: Key prefix of the queue
+        visibility_timeout: Seconds a claimed item stays hidden before it is handed out again (default: 600)
+        poll_interval: Maximum seconds between checks for items put by other processes (default: 1)
+        batch_size: Number of due items compared by priority on each claim (default: 50)
+    """
+
+    def __init__(self, client, name="twitter_agent:reply_queue", visibility_timeout=600,
+                 poll_interval=1.0, batch_size=50):
+        super().__init__(visibility_timeout, poll_interval)
+        self.client = client
+        self.batch_size = batch_size
+        self.items_key = f"{name}:items"
+        self.due_key = f"{name}:due"
+        self.leases_key = f"{name}:leases"
+        self.tokens_key = f"{name}:tokens"
+
+    def _push(self, data, due_time, priority):
+        item_id = uuid.uuid4().hex
+        pipe = self.client.pipeline()
+        pipe.hset(self.items_key, item_id, json.dumps([priority, data]))
+        pipe.zadd(self.due_key, {item_id: due_time})
+        pipe.execute()
+
+    def _requeue_expired(self, now):
+        """Move items whose lease expired back to the waiting set."""
+        for item_id in self.client.zrangebyscore(self.leases_key, "-inf", now):
+            # Only the worker that removes the lease requeues the item
+            if not self.client.zrem(self.leases_key, item_id):
+                continue
+            logger.warning(f"Lease on queued reply {item_id} expired, handing it out again")
+            self.client.hdel(self.tokens_key, item_id)
+            self.client.zadd(self.due_key, {item_id: now}, nx=True)
+
+    def _claim(self, now):
+        self._requeue_expired(now)
+
+        candidates = self.client.zrangebyscore(self.due_key, "-inf", now, start=0, num=self.batch_size,
+                                               withscores=True)
+        if not candidates:
+            return None
+        bodies = self.client.hmget(self.items_key, [item_id for item_id, _ in candidates])
+
+        entries = []
+        for (item_id, due_time), body in zip(candidates, bodies):
+            if body is None:
+                # Acknowledged while its expired lease was being requeued
+                self.client.zrem(self.due_key, item_id)
+                continue
+            priority, data = json.loads(body)
+            entries.append((priority, due_time, item_id, data))
+
+        for priority, due_time, item_id, data in sorted(entries):
+            if not self.client.zadd(self.leases_key, {item_id: now + self.visibility_timeout}, nx=True):
+                continue
+            token = uuid.uuid4().hex
+            self.client.hset(self.tokens_key, item_id, token)
+            if self.client.zrem(self.due_key, item_id):
+                return f"{item_id}:{token}", data
+            # Another worker claimed and acknowledged it since the candidates were read
+            self.client.hdel(self.tokens_key, item_id)
+            self.client.zrem(self.leases_key, item_id)
+        return None
+
+    def _ack(self, lease):
+        item_id, _, token = lease.partition(":")
+        pipe = self.client.pipeline()
+        while True:
+            try:
+                pipe.watch(self.tokens_key)
+                if pipe.hget(self.tokens_key, item_id) != token:
+                    pipe.reset()
+                    logger.warning(f"Lease on queued reply {item_id} expired before it was acknowledged, leaving it queued")
+                    return
+                pipe.multi()
+                pipe.zrem(self.leases_key, item_id)
+                pipe.zrem(self.due_key, item_id)
+                pipe.hdel(self.items_key, item_id)
+                pipe.hdel(self.tokens_key, item_id)
+                pipe.execute()
+                return
+            except WatchError:
+                # A claim or requeue changed the tokens in between; check again
+                continue
+
+    def next_due_in(self):
+        """Return seconds until the next item is due (0 if one is ready), or None if empty."""
+        due_times = []
+        for key in (self.due_key, self.leases_key):
+            first = self.client.zrange(key, 0, 0, withscores=True)
+            if first:
+                due_times.append(first[0][1])
+        if not due_times:
+            return None
+        return max(0, min(due_times) - time.time())
+
+    def qsize(self):
+        """Return the number of tweets waiting, ready or claimed."""
+        return self.client.hlen(self.items_key)
+
+class RedisProcessedStore:
+    """
+    Processed tweet IDs kept in a Redis sorted set, shared by every agent process.
+
+    Drop-in replacement for ProcessedTweetStore: claim() is an atomic ZADD NX,
+    so exactly one process claims each tweet. Entries are scored by the time
+    they were claimed and dropped after retention_days.
+
+    Args:
+        client: Redis client created with decode_responses=True (or a LocalRedis)
+        name: Key of the sorted set
+        retention_days: How long processed IDs are remembered (default: 30)
+    """
+
+    def __init__(self, client, name, retention_days=30):
+        self.client = client
+        self.name = name
+        self.retention_days = retention_days
+
+    def __contains__(self, tweet_id):
+        return self.client.zscore(self.name, str(tweet_id)) is not None
+
+    def __len__(self):
+        return self.client.zcard(self.name)
+
+    def claim(self, tweet_id):
+        """Atomically mark a tweet as processed, returning False if another process already had."""
+        return bool(self.client.zadd(self.name, {str(tweet_id): time.time()}, nx=True))
+
+    def add(self, tweet_id):
+        """Mark a tweet as processed."""
+        self.claim(tweet_id)
+
+    def release(self, tweet_id):
+        """Forget a claimed tweet so it can be claimed again."""
+        self.client.zrem(self.name, str(tweet_id))
+
+    def flush(self):
+        """Nothing to flush; every change is written to Redis immediately."""
+
+    def prune(self):
+        """Drop entries older than the retention period."""
+        self.client.zremrangebyscore(self.name, "-inf", time.time() - self.retention_days * 24 * 60 * 60)
+
+    def compact(self):
+        """Nothing to compact; pruning keeps the sorted set small."""
+
+class SharedRateBudget:
+    """
+    Request counts per endpoint and window kept in Redis, shared by every agent process.
+
+    Each process still has its own token buckets; this caps the total across
+    processes by counting requests in fixed windows with INCR.
+
+    Args:
+        client: Redis client created with decode_responses=True (or a LocalRedis)
+        name: Key prefix of the counters
+    """
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def acquire(self, endpoint, capacity, window_seconds):
+        """Block until the endpoint's shared window has room, returning the seconds waited."""
+        waited = 0.0
+        while True:
+            now = time.time()
+            window = int(now // window_seconds)
+            key = f"{self.name}:{endpoint}:{window}"
+            count = self.client.incr(key)
+            if count == 1:
+                self.client.expire(key, int(window_seconds) + 60)
+            if count <= capacity:
+                return waited
+            wait_time = (window + 1) * window_seconds - now
+            time.sleep(wait_time)
+            waited += wait_time
+
+class LocalRedis:
+    """
+    In-memory stand-in for the subset of Redis used by the shared backends.
+
+    Lets the Redis backends run in tests and on a single machine without a
+    Redis server. Commands are applied under one lock, so a pipeline is atomic
+    as it is with MULTI/EXEC, and WATCH is honoured by comparing the watched
+    keys with their values when they were watched.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _get(self, name, default_type):
+        """Return the value at a key, dropping it first if it expired."""
+        expires_at = self._expires.get(name)
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(name, None)
+            self._expires.pop(name, None)
+        if name not in self._data and default_type is not None:
+            self._data[name] = default_type()
+        return self._data.get(name)
+
+    def pipeline(self, transaction=True):
+        return LocalRedisPipeline(self)
+
+    def set(self, name, value, nx=False, ex=None):
+        with self._lock:
+            if nx and self._get(name, None) is not None:
+                return None
+            self._data[name] = str(value)
+            self._expires.pop(name, None)
+            if ex is not None:
+                self._expires[name] = time.time() + ex
+            return True
+
+    def get(self, name):
+        with self._lock:
+            return self._get(name, None)
+
+    def delete(self, *names):
+        with self._lock:
+            removed = 0
+            for name in names:
+                if self._get(name, None) is not None:
+                    removed += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return removed
+
+    def incr(self, name):
+        with self._lock:
+            value = int(self._get(name, None) or 0) + 1
+            self._data[name] = str(value)
+            return value
+
+    def expire(self, name, seconds):
+        with self._lock:
+            if self._get(name, None) is None:
+                return False
+            self._expires[name] = time.time() + seconds
+            return True
+
+    def hset(self, name, key, value):
+        with self._lock:
+            hash_ = self._get(name, dict)
+            added = key not in hash_
+            hash_[key] = value
+            return int(added)
+
+    def hget(self, name, key):
+        with self._lock:
+            return self._get(name, dict).get(key)
+
+    def hmget(self, name, keys):
+        with self._lock:
+            hash_ = self._get(name, dict)
+            return [hash_.get(key) for key in keys]
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            hash_ = self._get(name, dict)
+            return sum(1 for key in keys if hash_.pop(key, None) is not None)
+
+    def hlen(self, name):
+        with self._lock:
+            return len(self._get(name, dict))
+
+    def zadd(self, name, mapping, nx=False):
+        with self._lock:
+            zset = self._get(name, dict)
+            added = 0
+            for member, score in mapping.items():
+                if member in zset:
+                    if nx:
+                        continue
+                else:
+                    added += 1
+                zset[member] = float(score)
+            return added
+
+    def zrem(self, name, *members):
+        with self._lock:
+            zset = self._get(name, dict)
+            return sum(1 for member in members if zset.pop(member, None) is not None)
+
+    def zscore(self, name, member):
+        with self._lock:
+            return self._get(name, dict).get(member)
+
+    def zcard(self, name):
+        with self._lock:
+            return len(self._get(name, dict))
+
+    def _sorted(self, name):
+        return sorted(self._get(name, dict).items(), key=lambda entry: (entry[1], entry[0]))
+
+    def zrange(self, name, start, end, withscores=False):
+        with self._lock:
+            entries = self._sorted(name)
+            entries = entries[start:] if end == -1 else entries[start:end + 1]
+            return entries if withscores else [member for member, _ in entries]
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        with self._lock:
+            low, high = float(min), float(max)
+            entries = [entry for entry in self._sorted(name) if low <= entry[1] <= high]
+            if start is not None:
+                entries = entries[start:start + num if num is not None else None]
+            return entries if withscores else [member for member, _ in entries]
+
+    def zremrangebyscore(self, name, min, max):
+        with self._lock:
+            low, high = float(min), float(max)
+            zset = self._get(name, dict)
+            members = [member for member, score in zset.items() if low <= score <= high]
+            for member in members:
+                del zset[member]
+            return len(members)
+
+class LocalRedisPipeline:
+    """
+    Queues LocalRedis commands and applies them together on execute().
+
+    As with redis-py, commands run immediately between watch() and multi(),
+    and execute() raises WatchError if a watched key changed meanwhile.
+    """
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+        self._watched = {}
+        self._immediate = False
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+        if self._immediate:
+            return method
+
+        def queue_command(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue_command
+
+    def watch(self, *names):
+        with self._redis._lock:
+            for name in names:
+                self._watched[name] = deepcopy(self._redis._get(name, None) or None)
+        self._immediate = True
+
+    def multi(self):
+        self._immediate = False
+
+    def reset(self):
+        self._commands = []
+        self._watched = {}
+        self._immediate = False
+
+    def execute(self):
+        try:
+            with self._redis._lock:
+                for name, value in self._watched.items():
+                    if (self._redis._get(name, None) or None) != value:
+                        raise WatchError(f"Watched key {name} changed")
+                return [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        finally:
+            self.reset()
+
+# Process-wide Redis clients, one per URL
+_redis_clients = {}
+_redis_clients_lock = threading.Lock()
+
+def get_redis_client(url):
+    """
+    Get the shared Redis client for a URL, creating it on first use.
+
+    The URL "local://" returns a process-wide LocalRedis instead. The redis
+    package is only needed (and imported) when a real server is used.
+    """
+    with _redis_clients_lock:
+        client = _redis_clients.get(url)
+        if client is None:
+            if url.startswith("local://"):
+                client = LocalRedis()
+            else:
+                try:
+                    import redis
+                except ImportError:
+                    raise ImportError("The redis queue backend needs the redis package: pip install redis")
+                client = redis.Redis.from_url(url, decode_responses=True)
+            _redis_clients[url] = client
+        return client
+
+def _redis_settings():
+    """Return the Redis client and key prefix if the redis backend is configured, else (None, None)."""
+    config = load_queue_config()
+    if config.get("backend", "journal") != "redis":
+        return None, None
+    client = get_redis_client(config.get("redis_url", "redis://localhost:6379/0"))
+    return client, config.get("redis_prefix", "twitter_agent")
+
+def create_reply_queue(sqlite_path=REPLY_QUEUE_DB_FILE, redis_name="reply_queue", journal_path=REPLY_JOURNAL_FILE):
+    """
+    Create a reply queue with the backend set in the "queue" configuration section.
+
+    Backends are "journal" (default, in-process with a write-ahead log so it
+    survives restarts), "memory" (in-process only), "sqlite" (survives
+    restarts, shared by processes on one machine) and "redis" (shared by
+    processes on any number of machines).
+
+    Args:
+        sqlite_path: Database file used by the sqlite backend
+        redis_name: Queue name used by the redis backend, under the configured prefix
+        journal_path: Write-ahead log used by the journal backend
+    """
+    config = load_queue_config()
+    backend = config.get("backend", "journal")
+    visibility_timeout = config.get("visibility_timeout_minutes", 10) * 60
+
+    if backend == "journal":
+        return DurableReplyScheduler(journal_path, fsync_interval=config.get("journal_fsync_interval_seconds", 1))
+    if backend == "sqlite":
+        return SQLiteReplyQueue(sqlite_path, visibility_timeout=visibility_timeout)
+    if backend == "redis":
+        client, prefix = _redis_settings()
+        logger.info(f"Using Redis reply queue {prefix}:{redis_name}")
+        return RedisReplyQueue(client, f"{prefix}:{redis_name}", visibility_timeout=visibility_timeout)
+    if backend != "memory":
+        logger.warning(f"Unknown reply queue backend '{backend}', using the in-memory queue without a journal")
+    return ReplyScheduler()
+
+def get_shared_processed_store(path, retention_days=30):
+    """Return a Redis-backed store for a processed tweets log when the redis backend is configured, else None."""
+    client, prefix = _redis_settings()
+    if client is None:
+        return None
+    name = os.path.splitext(os.path.basename(path))[0]
+    return RedisProcessedStore(client, f"{prefix}:{name}", retention_days=retention_days)
+
+def share_rate_limits(rate_limiter, name):
+    """Cap a rate limiter's requests across every process when the redis backend is configured."""
+    client, prefix = _redis_settings()
+    if client is not None:
+        rate_limiter.share(SharedRateBudget(client, f"{prefix}:rate:{name}"))
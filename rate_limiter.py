@@ -0,0 +1,335 @@
+import time
+import logging
+import threading
+import weakref
+from urllib.parse import urlparse
+from config_cache import DEFAULT_CREDENTIALS_KEY
+
+logger = logging.getLogger("rate_limiter")
+
+# Default request budgets per endpoint: (requests, window in seconds).
+# These are conservative starting points; each bucket recalibrates from the
+# x-rate-limit-* headers as soon as the endpoint has been called once.
+DEFAULT_LIMITS = {
+    "mentions": (10, 15 * 60),
+    "tweet_lookup": (15, 15 * 60),
+    "search": (60, 15 * 60),
+    "create": (100, 24 * 60 * 60),
+    "friendship": (15, 15 * 60),
+    "users_me": (25, 24 * 60 * 60)
+}
+
+# How long to hold an endpoint back after a 429 when no reset header was seen
+DEFAULT_PAUSE_SECONDS = 15 * 60
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for a single endpoint.
+
+    Tokens refill continuously at capacity / window_seconds. Once the server
+    has reported its own budget through rate limit headers, the bucket follows
+    that fixed window instead: it hands out the reported remaining requests and
+    refills to the full limit when the window resets.
+
+    Args:
+        capacity: Maximum number of requests per window
+        window_seconds: Length of the rate limit window in seconds
+        min_interval: Minimum number of seconds between two requests (default: 0)
+    """
+
+    def __init__(self, capacity, window_seconds, min_interval=0):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.min_interval = min_interval
+        self.tokens = float(capacity)
+        self.reset_at = None
+        self._updated_at = time.time()
+        self._last_acquired = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """Add the tokens earned since the last update."""
+        if self.reset_at is not None:
+            # Following the server's window: nothing refills until it resets
+            if now >= self.reset_at:
+                self.tokens = float(self.capacity)
+                self.reset_at = None
+        else:
+            rate = self.capacity / self.window_seconds
+            self.tokens = min(float(self.capacity), self.tokens + (now - self._updated_at) * rate)
+        self._updated_at = now
+
+    def _wait_time(self, now):
+        """Return how long to wait before the next request may be made."""
+        wait = max(0, self._last_acquired + self.min_interval - now)
+        if self.tokens < 1:
+            if self.reset_at is not None:
+                wait = max(wait, self.reset_at - now)
+            else:
+                rate = self.capacity / self.window_seconds
+                wait = max(wait, (1 - self.tokens) / rate)
+        return wait
+
+    def try_acquire(self):
+        """
+        Consume a token if a request may be made right now, without blocking.
+
+        Returns:
+            0 if a token was consumed, otherwise the number of seconds to wait
+            before trying again
+        """
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            wait = self._wait_time(now)
+            if wait <= 0:
+                self.tokens -= 1
+                self._last_acquired = now
+                return 0
+            return wait
+
+    def acquire(self):
+        """
+        Block until a request may be made, then consume a token.
+
+        Returns:
+            Number of seconds spent waiting
+        """
+        waited = 0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, limit=None, remaining=None, reset_at=None):
+        """Calibrate the bucket from the budget reported by the server."""
+        with self._lock:
+            self._refill(time.time())
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                self.tokens = float(remaining)
+            if reset_at is not None:
+                self.reset_at = reset_at
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds."""
+        with self._lock:
+            self.tokens = 0.0
+            self.reset_at = max(self.reset_at or 0, time.time() + seconds)
+
+    def budget(self):
+        """Return a snapshot of the bucket's current budget."""
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            return {
+                "remaining": int(self.tokens),
+                "limit": self.capacity,
+                "resets_in": round(self.reset_at - now) if self.reset_at else None
+            }
+
+def classify_endpoint(method, url):
+    """Map an X API request to the name of its rate limit bucket, or None if untracked."""
+    path = urlparse(url).path.rstrip("/")
+
+    if path.startswith("/2/users/") and path.endswith("/mentions"):
+        return "mentions"
+    if path == "/2/tweets/search/recent":
+        return "search"
+    if path == "/2/tweets":
+        return "create" if method == "POST" else "tweet_lookup"
+    if path.startswith("/2/tweets/") and method == "GET" and path.count("/") == 3:
+        return "tweet_lookup"
+    if path == "/2/users/me":
+        return "users_me"
+    if "friendships/show" in path:
+        return "friendship"
+    return None
+
+class RateLimiter:
+    """
+    Per-endpoint rate limiter for the X API.
+
+    Each endpoint gets its own TokenBucket, so reads like search are never
+    throttled by writes like create. Buckets calibrate themselves from the
+    x-rate-limit-limit, x-rate-limit-remaining and x-rate-limit-reset headers
+    of every response once install() has hooked a client's HTTP sessions.
+
+    Args:
+        limits: Optional dict of endpoint -> (requests, window_seconds) overriding DEFAULT_LIMITS
+    """
+
+    def __init__(self, limits=None):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.shared_budget = None
+        self.configure(limits or {})
+
+    def share(self, shared_budget):
+        """Also count requests against a budget shared with other processes (see queue_backends.SharedRateBudget)."""
+        self.shared_budget = shared_budget
+
+    def configure(self, limits, min_intervals=None):
+        """
+        Set the request budget of each endpoint.
+
+        Args:
+            limits: Dict of endpoint -> (requests, window_seconds)
+            min_intervals: Optional dict of endpoint -> minimum seconds between requests
+        """
+        merged = dict(DEFAULT_LIMITS)
+        merged.update(limits)
+        min_intervals = min_intervals or {}
+
+        with self._lock:
+            for endpoint, (requests, window_seconds) in merged.items():
+                bucket = self._buckets.get(endpoint)
+                if bucket is None:
+                    self._buckets[endpoint] = TokenBucket(
+                        requests, window_seconds, min_intervals.get(endpoint, 0)
+                    )
+                else:
+                    bucket.capacity = requests
+                    bucket.window_seconds = window_seconds
+                    bucket.min_interval = min_intervals.get(endpoint, bucket.min_interval)
+
+    def _bucket(self, endpoint):
+        """Return the bucket for an endpoint, creating a default one if needed."""
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                bucket = TokenBucket(*DEFAULT_LIMITS.get(endpoint, (15, 15 * 60)))
+                self._buckets[endpoint] = bucket
+            return bucket
+
+    def acquire(self, endpoint):
+        """Block until a request to the endpoint may be made."""
+        bucket = self._bucket(endpoint)
+        waited = bucket.acquire()
+        if self.shared_budget is not None:
+            waited += self.shared_budget.acquire(endpoint, bucket.capacity, bucket.window_seconds)
+        if waited > 1:
+            logger.info(f"Waited {waited:.1f} seconds for the '{endpoint}' rate limit")
+        return waited
+
+    async def acquire_async(self, endpoint):
+        """Wait without blocking the event loop until a request to the endpoint may be made."""
+        import asyncio
+        bucket = self._bucket(endpoint)
+        waited = 0
+        while True:
+            wait = bucket.try_acquire()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        if self.shared_budget is not None:
+            waited += await asyncio.to_thread(
+                self.shared_budget.acquire, endpoint, bucket.capacity, bucket.window_seconds
+            )
+        if waited > 1:
+            logger.info(f"Waited {waited:.1f} seconds for the '{endpoint}' rate limit")
+        return waited
+
+    def update_from_headers(self, endpoint, headers):
+        """Calibrate an endpoint's bucket from X API rate limit headers."""
+        try:
+            limit = headers.get("x-rate-limit-limit")
+            remaining = headers.get("x-rate-limit-remaining")
+            reset = headers.get("x-rate-limit-reset")
+            if remaining is None and reset is None:
+                return
+
+            self._bucket(endpoint).update(
+                limit=int(limit) if limit is not None else None,
+                remaining=int(remaining) if remaining is not None else None,
+                reset_at=int(reset) if reset is not None else None
+            )
+            logger.debug(f"Rate limit for '{endpoint}': {remaining}/{limit} remaining, resets at {reset}")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Could not parse rate limit headers for '{endpoint}': {e}")
+
+    def observe_response(self, response, *args, **kwargs):
+        """requests response hook that feeds rate limit headers into the matching bucket."""
+        endpoint = classify_endpoint(response.request.method, response.url)
+        if endpoint is not None:
+            self.update_from_headers(endpoint, response.headers)
+
+    def trace_config(self):
+        """Return an aiohttp TraceConfig that feeds rate limit headers into the matching bucket."""
+        import aiohttp
+
+        async def on_request_end(session, context, params):
+            endpoint = classify_endpoint(params.method, str(params.url))
+            if endpoint is not None:
+                self.update_from_headers(endpoint, params.response.headers)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def install(self, *clients):
+        """Hook the HTTP sessions of Tweepy Client/API instances so responses calibrate the buckets."""
+        for client in clients:
+            session = getattr(client, "session", None)
+            if session is None:
+                continue
+            hooks = session.hooks.setdefault("response", [])
+            if self.observe_response not in hooks:
+                hooks.append(self.observe_response)
+            with _client_limiters_lock:
+                _client_limiters[client] = self
+
+    def pause(self, endpoint, seconds=None):
+        """
+        Hold back an endpoint after a rate limit error.
+
+        If the server already reported when the window resets, that reset time
+        is kept; otherwise the endpoint is paused for the given number of seconds.
+        """
+        bucket = self._bucket(endpoint)
+        budget = bucket.budget()
+        if budget["resets_in"] is None or budget["remaining"] > 0:
+            bucket.pause(seconds or DEFAULT_PAUSE_SECONDS)
+
+    def budget(self):
+        """Return the current budget of every endpoint."""
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {endpoint: bucket.budget() for endpoint, bucket in buckets.items()}
+
+    def format_budget(self):
+        """Return the current budget as a short human-readable string."""
+        parts = []
+        for endpoint, budget in sorted(self.budget().items()):
+            part = f"{endpoint}={budget['remaining']}/{budget['limit']}"
+            if budget["resets_in"] is not None:
+                part += f" (resets in {budget['resets_in']}s)"
+            parts.append(part)
+        return ", ".join(parts)
+
+# Process-wide rate limiters, one per account since each has its own budget
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+# Limiter installed on each Tweepy client, so callers can find a client's budget
+_client_limiters = weakref.WeakKeyDictionary()
+_client_limiters_lock = threading.Lock()
+
+def get_rate_limiter(credentials_key=DEFAULT_CREDENTIALS_KEY):
+    """Get the shared rate limiter for an account, creating it on first use."""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(credentials_key)
+        if limiter is None:
+            limiter = RateLimiter()
+            _rate_limiters[credentials_key] = limiter
+        return limiter
+
+def get_client_rate_limiter(client):
+    """Return the rate limiter installed on a Tweepy client, or the default account's limiter."""
+    with _client_limiters_lock:
+        limiter = _client_limiters.get(client) if client is not None else None
+    return limiter if limiter is not None else get_rate_limiter()
@@ -0,0 +1,266 @@
+import re
+import math
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict
+from config_cache import load_json, PROMPTS_FILE
+
+logger = logging.getLogger("reply_cache")
+
+# Words that carry no meaning for matching similar questions
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "so", "i", "im", "i'm", "me", "my", "am", "is", "are",
+    "was", "were", "be", "been", "to", "of", "in", "on", "for", "with", "at", "it", "its", "this",
+    "that", "just", "really", "very", "lately", "today", "now", "again", "any", "anyone", "do",
+    "does", "have", "has", "had", "feel", "feeling", "got", "get", "getting"
+}
+
+URL_PATTERN = re.compile(r"https?://\S+")
+MENTION_PATTERN = re.compile(r"@\w+")
+NON_WORD_PATTERN = re.compile(r"[^\w\s']+")
+
+def normalize_text(text):
+    """Normalize tweet text for exact matching: lowercase, no URLs, mentions, punctuation or extra spaces."""
+    text = URL_PATTERN.sub(" ", text.lower())
+    text = MENTION_PATTERN.sub(" ", text)
+    text = NON_WORD_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+def tokenize(normalized_text):
+    """Return the meaningful words of normalized text."""
+    return frozenset(word for word in normalized_text.split() if word not in STOPWORDS)
+
+def jaccard_similarity(tokens, other_tokens):
+    """Return the Jaccard similarity of two token sets."""
+    if not tokens or not other_tokens:
+        return 0.0
+    return len(tokens & other_tokens) / len(tokens | other_tokens)
+
+def cosine_similarity(vector, other_vector):
+    """Return the cosine similarity of two vectors."""
+    dot = sum(a * b for a, b in zip(vector, other_vector))
+    norm = math.sqrt(sum(a * a for a in vector)) * math.sqrt(sum(b * b for b in other_vector))
+    return dot / norm if norm else 0.0
+
+def openai_embedder(model="text-embedding-3-small"):
+    """Return a function that embeds text with the OpenAI embeddings API."""
+    from ai_utils import get_openai_client
+
+    def embed(text):
+        return get_openai_client().embeddings.create(model=model, input=text).data[0].embedding
+    return embed
+
+class ReplyCache:
+    """
+    Cache of approved replies for near-identical tweets.
+
+    Replies are keyed on the normalized tweet text and its keyword category.
+    A lookup first tries the exact key, then the most similar cached tweet in
+    the same category: by word overlap (Jaccard) or, when an embedder is
+    given, by cosine similarity of embeddings. Each entry keeps up to
+    max_variants approved replies and hands them out in rotation; while an
+    entry still has room, a lookup misses with refresh_probability so new
+    variants are generated and approved over time.
+
+    Entries expire ttl_hours after they were first approved, and the least
+    recently used entry is evicted once max_entries is reached.
+
+    Args:
+        max_entries: Maximum number of cached tweets (default: 500)
+        ttl_hours: How long an entry may be reused (default: 24)
+        similarity_threshold: Minimum similarity for a near match, 0 to disable (default: 0.6)
+        max_variants: Maximum number of replies kept per entry (default: 3)
+        refresh_probability: Chance of a deliberate miss while an entry has room for variants (default: 0.2)
+        embedder: Optional function of (text) -> vector for the embedding tier
+    """
+
+    def __init__(self, max_entries=500, ttl_hours=24, similarity_threshold=0.6, max_variants=3,
+                 refresh_probability=0.2, embedder=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_hours * 60 * 60
+        self.similarity_threshold = similarity_threshold
+        self.max_variants = max_variants
+        self.refresh_probability = refresh_probability
+        self.embedder = embedder
+        self._entries = OrderedDict()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def _embed(self, text):
+        """Embed text, returning None if there is no embedder or it fails."""
+        if self.embedder is None:
+            return None
+        try:
+            return self.embedder(text)
+        except Exception as e:
+            logger.warning(f"Error embedding text for the reply cache: {e}")
+            return None
+
+    def _expire(self, now):
+        """Drop entries older than the TTL."""
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def _find_similar(self, category, tokens, embedding):
+        """Return the key of the most similar entry in the category, or None if none is close enough."""
+        best_key = None
+        best_score = self.similarity_threshold
+        for key, entry in self._entries.items():
+            if key[0] != category:
+                continue
+            if embedding is not None and entry["embedding"] is not None:
+                score = cosine_similarity(embedding, entry["embedding"])
+            else:
+                score = jaccard_similarity(tokens, entry["tokens"])
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def lookup(self, text, category=None):
+        """
+        Look up a cached reply for a tweet.
+
+        Successive hits on the same entry rotate through its reply variants.
+        The matched key is also returned on a deliberate refresh miss, so the
+        freshly generated reply can be approved as a variant of that entry.
+
+        Returns:
+            Tuple of (reply or None on a miss, key of the matched entry or None)
+        """
+        normalized = normalize_text(text)
+        key = (category, normalized)
+        embedding = None
+        if self.similarity_threshold > 0 and self.embedder is not None:
+            with self._lock:
+                needs_embedding = key not in self._entries
+            if needs_embedding:
+                embedding = self._embed(normalized)
+
+        with self._lock:
+            self._expire(time.time())
+
+            hit = "exact_hits" if key in self._entries else None
+            if hit is None and self.similarity_threshold > 0:
+                key = self._find_similar(category, tokenize(normalized), embedding)
+                hit = "similar_hits" if key is not None else None
+
+            entry = self._entries.get(key) if hit else None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None, None
+            if len(entry["replies"]) < self.max_variants and random.random() < self.refresh_probability:
+                self._stats["misses"] += 1
+                return None, key
+
+            self._stats[hit] += 1
+            self._entries.move_to_end(key)
+            entry["next_variant"] = (entry["next_variant"] + 1) % len(entry["replies"])
+            return entry["replies"][entry["next_variant"]], key
+
+    def approve(self, text, reply, category=None, key=None):
+        """
+        Record a freshly generated reply that was posted for a tweet, so similar tweets can reuse it.
+
+        Replies handed out by lookup must not be approved again. An existing
+        entry keeps the time it was first approved, so it still expires after
+        the TTL however often it gains variants.
+
+        Args:
+            text: Text of the tweet that was answered
+            reply: Reply that was posted
+            category: Keyword category of the tweet
+            key: Key returned by lookup for this tweet, to add the reply as a variant of that entry
+        """
+        normalized = normalize_text(text)
+        if not normalized:
+            return
+        if key is None:
+            key = (category, normalized)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and key != (category, normalized):
+                # The matched entry expired or was evicted meanwhile
+                key = (category, normalized)
+                entry = self._entries.get(key)
+            if entry is not None:
+                if reply not in entry["replies"] and len(entry["replies"]) < self.max_variants:
+                    entry["replies"].append(reply)
+                self._entries.move_to_end(key)
+                return
+
+        embedding = self._embed(normalized) if self.similarity_threshold > 0 else None
+        with self._lock:
+            self._entries[key] = {
+                "replies": [reply],
+                "next_variant": -1,
+                "tokens": tokenize(normalized),
+                "embedding": embedding,
+                "created_at": time.time()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Return hit and miss counters, the hit rate and the number of cached entries."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["similar_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def format_stats(self):
+        """Return the cache statistics as a short human-readable string."""
+        stats = self.stats()
+        return (
+            f"hit rate {stats['hit_rate']:.0%} ({stats['exact_hits']} exact, {stats['similar_hits']} similar, "
+            f"{stats['misses']} misses), {stats['entries']} entries, {stats['evictions']} evictions"
+        )
+
+def load_reply_cache_config(prompts_file=PROMPTS_FILE):
+    """Load the reply cache configuration from the monitoring section of a prompts file."""
+    try:
+        return load_json(prompts_file).get("monitoring", {}).get("reply_cache", {})
+    except Exception as e:
+        logger.error(f"Error loading reply cache config: {e}")
+        return {}
+
+# Process-wide caches shared by every reply worker, one per persona's prompts file
+_reply_caches = {}
+_reply_caches_lock = threading.Lock()
+
+def get_reply_cache(prompts_file=PROMPTS_FILE):
+    """Get the shared reply cache for a prompts file, or None if it is disabled in its configuration."""
+    with _reply_caches_lock:
+        reply_cache = _reply_caches.get(prompts_file)
+        if reply_cache is None:
+            config = load_reply_cache_config(prompts_file)
+            if not config.get("enabled", True):
+                return None
+
+            similarity = config.get("similarity", "jaccard")
+            embedder = None
+            if similarity == "embedding":
+                embedder = openai_embedder(config.get("embedding_model", "text-embedding-3-small"))
+            similarity_threshold = config.get("similarity_threshold", 0.85 if embedder else 0.6)
+
+            reply_cache = ReplyCache(
+                max_entries=config.get("max_entries", 500),
+                ttl_hours=config.get("ttl_hours", 24),
+                similarity_threshold=0 if similarity == "off" else similarity_threshold,
+                max_variants=config.get("max_variants", 3),
+                refresh_probability=config.get("refresh_probability", 0.2),
+                embedder=embedder
+            )
+            _reply_caches[prompts_file] = reply_cache
+        return reply_cache
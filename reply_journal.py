@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from reply_scheduler import ReplyScheduler, get_due_time
+
+logger = logging.getLogger("reply_journal")
+
+# Default write-ahead log of the reply queue
+REPLY_JOURNAL_FILE = "reply_queue.log"
+
+# Key of the journal entry ID attached to items handed out by a durable scheduler
+JOURNAL_ID_KEY = "_journal_id"
+
+# Record types written to the journal
+PUT_RECORD = "P"
+ACK_RECORD = "A"
+
+class ReplyJournal:
+    """
+    Append-only write-ahead log of the reply queue.
+
+    Every put is written as "P\\t<id>\\t<due_time>\\t<json>" and every
+    acknowledgement as "A\\t<id>", straight to the OS with one write each, so a
+    crash of the process loses nothing. fsync is batched: a background thread
+    syncs the file every fsync_interval seconds (or sooner once
+    fsync_batch_size records are waiting), so a put never waits for the disk
+    and at most fsync_interval seconds of puts are lost if the machine itself
+    goes down.
+
+    The log is rewritten with only the unacknowledged entries once it has grown
+    by compact_threshold lines (or by its own size, whichever is larger).
+
+    Args:
+        path: Path of the journal file
+        fsync_interval: Maximum seconds between fsyncs (default: 1)
+        fsync_batch_size: Number of unsynced records that triggers an early fsync (default: 100)
+        compact_threshold: Minimum number of log lines before compaction is considered (default: 1000)
+    """
+
+    def __init__(self, path=REPLY_JOURNAL_FILE, fsync_interval=1.0, fsync_batch_size=100, compact_threshold=1000):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_batch_size = fsync_batch_size
+        self.compact_threshold = compact_threshold
+        self._live = {}
+        self._next_id = 1
+        self._log_lines = 0
+        self._unsynced = 0
+        self._compact_at = compact_threshold
+        self._lock = threading.Lock()
+        self._sync_needed = threading.Event()
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+        # Sync whatever is still unsynced when the process exits
+        atexit.register(self.sync)
+
+        syncer = threading.Thread(
+            target=self._sync_loop,
+            daemon=True,
+            name=f"ReplyJournalSyncer-{os.path.basename(path)}"
+        )
+        syncer.start()
+
+    def _load(self):
+        """Read the unacknowledged entries from the journal."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._log_lines += 1
+                    parts = line.rstrip("\n").split("\t", 3)
+                    try:
+                        journal_id = int(parts[1])
+                        if parts[0] == PUT_RECORD and len(parts) == 4:
+                            self._live[journal_id] = (float(parts[2]), json.loads(parts[3]))
+                        elif parts[0] == ACK_RECORD:
+                            self._live.pop(journal_id, None)
+                        self._next_id = max(self._next_id, journal_id + 1)
+                    except (IndexError, ValueError):
+                        # Skip lines truncated by a crash mid-write
+                        continue
+            logger.info(f"Loaded {len(self._live)} unacknowledged replies from {self.path}")
+        except Exception as e:
+            logger.error(f"Error loading reply journal {self.path}: {e}")
+
+    def entries(self):
+        """Return the unacknowledged entries as (journal_id, due_time, tweet_data), in due time order."""
+        with self._lock:
+            entries = [(journal_id, due_time, item) for journal_id, (due_time, item) in self._live.items()]
+        return sorted(entries, key=lambda entry: (entry[1], entry[0]))
+
+    def _append(self, line):
+        """Write one record to the OS and wake the syncer when enough records are unsynced."""
+        self._file.write(line)
+        self._file.flush()
+        self._log_lines += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_batch_size:
+            self._sync_needed.set()
+
+    def put(self, due_time, tweet_data):
+        """Record a queued tweet and return its journal ID."""
+        item = dict(tweet_data)
+        item.pop(JOURNAL_ID_KEY, None)
+        created_at = item.get("created_at")
+        if hasattr(created_at, "isoformat"):
+            item["created_at"] = created_at.isoformat()
+        data = json.dumps(item)
+
+        with self._lock:
+            journal_id = self._next_id
+            self._next_id += 1
+            self._live[journal_id] = (due_time, item)
+            self._append(f"{PUT_RECORD}\t{journal_id}\t{due_time:.3f}\t{data}\n")
+        return journal_id
+
+    def ack(self, journal_id):
+        """Record that a queued tweet has been handled."""
+        with self._lock:
+            if self._live.pop(journal_id, None) is None:
+                return
+            self._append(f"{ACK_RECORD}\t{journal_id}\n")
+            if self._log_lines >= self._compact_at:
+                self._compact()
+
+    def sync(self):
+        """fsync the records written since the last sync."""
+        with self._lock:
+            if not self._unsynced:
+                return
+            try:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+            except Exception as e:
+                logger.error(f"Error syncing reply journal {self.path}: {e}")
+
+    def _sync_loop(self):
+        """Background loop that batches fsyncs."""
+        while True:
+            self._sync_needed.wait(self.fsync_interval)
+            self._sync_needed.clear()
+            self.sync()
+
+    def _compact(self):
+        """Rewrite the journal with only the unacknowledged entries (called with the lock held)."""
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for journal_id, (due_time, item) in self._live.items():
+                    f.write(f"{PUT_RECORD}\t{journal_id}\t{due_time:.3f}\t{json.dumps(item)}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._log_lines = len(self._live)
+            self._unsynced = 0
+            self._compact_at = self._log_lines + max(self.compact_threshold, self._log_lines)
+            logger.debug(f"Compacted {self.path} to {self._log_lines} entries")
+        except Exception as e:
+            logger.error(f"Error compacting reply journal {self.path}: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live)
+
+class DurableReplyScheduler(ReplyScheduler):
+    """
+    ReplyScheduler whose pending items survive restarts.
+
+    Every put is recorded in a ReplyJournal and every ack() marks the entry
+    done. On startup the unacknowledged items, including hashtag and keyword
+    hits still waiting out their reply delay, are put back in due time order.
+    Items handed out by get() carry their journal ID; pass them to ack() once
+    handled.
+
+    Args:
+        path: Path of the journal file
+        fsync_interval: Maximum seconds between fsyncs (default: 1)
+    """
+
+    def __init__(self, path=REPLY_JOURNAL_FILE, fsync_interval=1.0):
+        super().__init__()
+        self.journal = ReplyJournal(path, fsync_interval=fsync_interval)
+
+        entries = self.journal.entries()
+        for journal_id, due_time, tweet_data in entries:
+            tweet_data[JOURNAL_ID_KEY] = journal_id
+            super().put(tweet_data, not_before=due_time)
+        if entries:
+            logger.info(f"Replayed {len(entries)} pending replies from {path}")
+
+    def put(self, tweet_data, not_before=None):
+        """Schedule a tweet for replying and record it in the journal."""
+        due_time = get_due_time(tweet_data)
+        if not_before is not None:
+            due_time = max(due_time, not_before)
+
+        # Copy, so a re-queued item keeps its old ID for the caller's ack()
+        tweet_data = dict(tweet_data)
+        tweet_data[JOURNAL_ID_KEY] = self.journal.put(due_time, tweet_data)
+        super().put(tweet_data, not_before=due_time)
+
+    def ack(self, tweet_data):
+        """Indicate that a returned tweet has been handled and drop it from the journal."""
+        journal_id = tweet_data.get(JOURNAL_ID_KEY)
+        if journal_id is not None:
+            self.journal.ack(journal_id)
+        self.task_done()
@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger("reply_scheduler")
+
+# Lower numbers are replied to first once items are due
+SOURCE_PRIORITIES = {
+    "mention": 0,
+    "hashtag": 1,
+    "keyword": 1
+}
+DEFAULT_PRIORITY = 1
+
+def get_due_time(tweet_data):
+    """Return the epoch time at which a queued tweet may be replied to."""
+    delay_minutes = tweet_data.get("delay_minutes", 0)
+    if delay_minutes <= 0:
+        return time.time()
+
+    created_at = tweet_data.get("created_at")
+    if not created_at:
+        return time.time() + delay_minutes * 60
+
+    # Convert to datetime if it's a string
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+
+    reply_after = created_at + timedelta(minutes=delay_minutes)
+    return reply_after.timestamp()
+
+def get_priority(tweet_data):
+    """Return the priority of a queued tweet, using its source when not set explicitly."""
+    if "priority" in tweet_data:
+        return tweet_data["priority"]
+    return SOURCE_PRIORITIES.get(tweet_data.get("source"), DEFAULT_PRIORITY)
+
+class ReplyScheduler:
+    """
+    Delay-aware priority queue for tweets waiting to be replied to.
+
+    Items wait in a heap ordered by due time. Once due they move to a second
+    heap ordered by priority, so mentions are answered before hashtag and
+    keyword hits that became due at the same time. get() blocks until the
+    earliest item is due instead of re-queueing items that aren't ready yet.
+
+    The interface mirrors queue.Queue (put, get, task_done, qsize, empty, join)
+    so it can be used as a drop-in replacement.
+    """
+
+    def __init__(self):
+        self._waiting = []
+        self._ready = []
+        self._counter = itertools.count()
+        self._unfinished_tasks = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._all_tasks_done = threading.Condition(self._lock)
+
+    def put(self, tweet_data, not_before=None):
+        """
+        Schedule a tweet for replying.
+
+        Args:
+            tweet_data: Dictionary describing the tweet to reply to
+            not_before: Optional epoch time before which the tweet must not be handed out
+        """
+        due_time = get_due_time(tweet_data)
+        if not_before is not None:
+            due_time = max(due_time, not_before)
+
+        with self._not_empty:
+            heapq.heappush(self._waiting, (due_time, next(self._counter), tweet_data))
+            self._unfinished_tasks += 1
+            self._not_empty.notify()
+
+    def _promote_due(self, now):
+        """Move every item whose due time has passed onto the ready heap."""
+        while self._waiting and self._waiting[0][0] <= now:
+            due_time, seq, tweet_data = heapq.heappop(self._waiting)
+            heapq.heappush(self._ready, (get_priority(tweet_data), due_time, seq, tweet_data))
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return the highest-priority tweet that is due.
+
+        Blocks until an item is due. Raises queue.Empty if nothing became due
+        within the timeout, or immediately when block is False.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._not_empty:
+            while True:
+                now = time.time()
+                self._promote_due(now)
+                if self._ready:
+                    return heapq.heappop(self._ready)[-1]
+
+                if not block:
+                    raise queue.Empty
+
+                # Sleep until the earliest item is due, a new item arrives or the timeout passes
+                wait_time = self._waiting[0][0] - now if self._waiting else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    wait_time = remaining if wait_time is None else min(wait_time, remaining)
+                self._not_empty.wait(wait_time)
+
+    def next_due_in(self):
+        """Return seconds until the next item is due (0 if one is ready), or None if empty."""
+        with self._lock:
+            if self._ready:
+                return 0
+            if not self._waiting:
+                return None
+            return max(0, self._waiting[0][0] - time.time())
+
+    def task_done(self):
+        """Indicate that a previously returned tweet has been handled."""
+        with self._all_tasks_done:
+            if self._unfinished_tasks <= 0:
+                raise ValueError("task_done() called too many times")
+            self._unfinished_tasks -= 1
+            if self._unfinished_tasks == 0:
+                self._all_tasks_done.notify_all()
+
+    def ack(self, tweet_data):
+        """Indicate that a returned tweet has been handled (same as task_done, for the shared queue backends)."""
+        self.task_done()
+
+    def join(self):
+        """Block until every scheduled tweet has been handled."""
+        with self._all_tasks_done:
+            while self._unfinished_tasks:
+                self._all_tasks_done.wait()
+
+    def qsize(self):
+        """Return the number of tweets waiting or ready to be replied to."""
+        with self._lock:
+            return len(self._waiting) + len(self._ready)
+
+    def empty(self):
+        """Return True if no tweets are scheduled."""
+        return self.qsize() == 0
+
+    def __len__(self):
+        return self.qsize()
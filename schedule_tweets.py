@@ -1,18 +1,23 @@
 import schedule
 import time
 import random
-from twitter_poster import post_random_tweet
+from twitter_poster import post_buffered_tweet
+from content_buffer import create_content_producer
 
 def job():
-    """Function to be scheduled that posts a random tweet."""
+    """Function to be scheduled that posts the next buffered tweet."""
     # Randomly vary the image probability between 0.6 and 0.8
-    # This adds some natural variation to the tweet types
+    # This adds some natural variation when the buffer is empty and the
+    # tweet has to be generated on the spot
     image_probability = random.uniform(0.6, 0.8)
-    post_random_tweet(image_probability=image_probability)
+    post_buffered_tweet(image_probability=image_probability)
     print(f"Job completed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
 def main():
     """Main function to set up the schedule."""
+    # Keep ready-to-post tweets in the buffer between jobs
+    create_content_producer().start()
+    
     # Schedule the job to run at specific times
     # For example, post 3 times a day
     schedule.every().day.at("09:00").do(job)  # Morning tweet
@@ -0,0 +1,388 @@
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+import tweepy
+from twitter_poster import load_config
+from twitter_monitor import (
+    load_processed_tweets,
+    load_monitoring_config,
+    get_current_clients,
+    get_user_id,
+    schedule_reply
+)
+from accounts import get_accounts, get_default_account
+from batch_generation import get_batch_generator, batch_replies_enabled
+from query_planner import pack_terms
+
+logger = logging.getLogger("stream_ingest")
+
+# Maximum length of a filtered stream rule value
+MAX_RULE_LENGTH = 512
+
+# Tag prefix of the rules managed here; other rules on the app are left alone
+RULE_TAG_PREFIX = "agent:"
+
+# Fields requested with every streamed tweet
+TWEET_FIELDS = ["author_id", "created_at", "conversation_id", "referenced_tweets"]
+
+# A connection that lasted this long resets the reconnect backoff
+STABLE_CONNECTION_SECONDS = 60
+
+def load_stream_config(account=None):
+    """Load the stream section of the monitoring configuration."""
+    return load_monitoring_config(account).get("stream", {})
+
+def build_rules(accounts):
+    """
+    Build the filtered stream rules for the hashtags and keywords of every account.
+
+    Each rule is tagged with a hash of its value, and the tag routes matches
+    to every account (and source and keyword category) that asked for it, so
+    two accounts watching the same hashtags share one rule.
+
+    Returns:
+        Tuple of (dict of tag -> rule value, dict of tag -> list of (account, source, category))
+    """
+    rules = {}
+    routes = {}
+
+    def add(value, account, source, category=None):
+        tag = RULE_TAG_PREFIX + hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+        rules[tag] = value
+        routes.setdefault(tag, []).append((account, source, category))
+
+    for account in accounts:
+        config = load_monitoring_config(account)
+        for value in pack_terms(config.get("hashtags", []), max_length=MAX_RULE_LENGTH):
+            add(value, account, "hashtag")
+        for category, keywords in config.get("keywords", {}).items():
+            for value in pack_terms([f'"{keyword}"' for keyword in keywords], "lang:en", MAX_RULE_LENGTH):
+                add(value, account, "keyword", category)
+
+    return rules, routes
+
+class TweetStream(tweepy.StreamingClient):
+    """
+    Filtered stream connection that hands every matched tweet to a StreamIngestor.
+
+    Tweepy reconnects on its own after network errors (linear backoff) and
+    HTTP errors (exponential backoff) until max_retries is used up; the
+    ingestor's supervisor loop takes over from there.
+
+    Args:
+        bearer_token: App-only bearer token of the developer app
+        ingestor: StreamIngestor receiving the matched tweets
+        record_file: Optional file the raw stream is appended to, for replaying later
+    """
+
+    def __init__(self, bearer_token, ingestor, record_file=None, **kwargs):
+        super().__init__(bearer_token, **kwargs)
+        self.ingestor = ingestor
+        self.record_file = record_file
+
+    def on_connect(self):
+        """Log that the stream is connected."""
+        logger.info("Connected to the filtered stream")
+
+    def on_data(self, raw_data):
+        """Append the raw message to the record file, if there is one, before tweepy parses it."""
+        if self.record_file:
+            with open(self.record_file, "ab") as f:
+                f.write(raw_data.rstrip(b"\r\n") + b"\n")
+        super().on_data(raw_data)
+
+    def on_response(self, response):
+        """Hand a matched tweet and the rules it matched to the ingestor, without blocking."""
+        if response.data is not None:
+            self.ingestor.offer(response.data, response.matching_rules)
+
+    def on_errors(self, errors):
+        """Log errors X reports inside the stream (the connection stays up)."""
+        logger.warning(f"Filtered stream reported errors: {errors}")
+
+    def on_connection_error(self):
+        """Log a network error; tweepy reconnects on its own."""
+        logger.warning("Filtered stream connection error, tweepy is reconnecting")
+
+    def on_request_error(self, status_code):
+        """Log an HTTP error response; tweepy backs off and reconnects on its own."""
+        logger.warning(f"Filtered stream request failed with status {status_code}, tweepy is backing off")
+
+    def on_disconnect(self):
+        """Log that the stream was closed."""
+        logger.info("Disconnected from the filtered stream")
+
+class StreamIngestor:
+    """
+    Feeds filtered stream matches into the reply queues, instead of polling search.
+
+    The stream thread only drops matches into a bounded intake queue, so it
+    keeps reading the connection at the rate X sends. A dispatcher thread
+    routes each match to its accounts, claims it in their processed stores and
+    schedules the reply. While an account's backlog (its reply queue, plus the
+    replies held for OpenAI batches when those are on) holds
+    max_pending_replies or more, the dispatcher waits; once the intake queue is
+    full as well, new matches are dropped (and counted) rather than stalling
+    the connection, which X would disconnect.
+
+    Each account's own user ID, used to skip its own tweets, is looked up once.
+    For replays it can be passed in instead, and with resolve_user_ids off the
+    ingestor never calls the API, so a recording replays offline.
+
+    Args:
+        accounts: Accounts whose hashtags and keywords are streamed (default: every account)
+        intake_size: Maximum number of matches waiting for the dispatcher (default: 1000)
+        max_pending_replies: Backlog length at which dispatching pauses (default: 500)
+        user_ids: Optional dict of account name -> own user ID
+        resolve_user_ids: Look up the user IDs that weren't passed in (default: True)
+    """
+
+    def __init__(self, accounts=None, intake_size=1000, max_pending_replies=500, user_ids=None,
+                 resolve_user_ids=True):
+        self.accounts = accounts or get_accounts()
+        self.max_pending_replies = max_pending_replies
+        self.intake = queue.Queue(maxsize=intake_size)
+        self.dropped = 0
+        self.user_ids = dict(user_ids or {})
+        self.resolve_user_ids = resolve_user_ids
+        self.rules, self.routes = build_rules(self.accounts)
+
+    def offer(self, tweet, matching_rules, block=False):
+        """Hand a matched tweet to the dispatcher. Returns False if it was dropped."""
+        try:
+            self.intake.put((tweet, matching_rules), block=block)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"Stream intake is full, dropped {self.dropped} matches so far")
+            return False
+
+    def sync_rules(self, stream):
+        """Make the app's filtered stream rules match the current configuration."""
+        self.rules, self.routes = build_rules(self.accounts)
+
+        existing = stream.get_rules().data or []
+        managed = [rule for rule in existing if (rule.tag or "").startswith(RULE_TAG_PREFIX)]
+        current_tags = {rule.tag for rule in managed}
+
+        stale = [rule.id for rule in managed if rule.tag not in self.rules]
+        if stale:
+            stream.delete_rules(stale)
+
+        missing = [
+            tweepy.StreamRule(value=value, tag=tag)
+            for tag, value in self.rules.items() if tag not in current_tags
+        ]
+        if missing:
+            response = stream.add_rules(missing)
+            for error in response.errors or []:
+                logger.error(f"Filtered stream rejected a rule: {error}")
+
+        logger.info(f"Filtered stream rules synced: {len(self.rules)} active, {len(missing)} added, {len(stale)} removed")
+
+    def run_stream(self, bearer_token, record_file=None):
+        """
+        Thread function keeping the filtered stream connected.
+
+        Each connection syncs the rules first, so edits to the monitoring
+        configuration apply on the next reconnect. When tweepy gives up
+        reconnecting, the stream is opened again after an exponential backoff
+        that resets once a connection has stayed up for a while.
+        """
+        logger.info("Starting filtered stream thread")
+        config = load_stream_config()
+        min_backoff = config.get("reconnect_backoff_min_seconds", 5)
+        max_backoff = config.get("reconnect_backoff_max_seconds", 320)
+        backoff = min_backoff
+
+        while True:
+            started_at = time.time()
+            try:
+                stream = TweetStream(
+                    bearer_token,
+                    self,
+                    record_file=record_file,
+                    max_retries=config.get("max_retries", 10)
+                )
+                self.sync_rules(stream)
+                stream.filter(tweet_fields=TWEET_FIELDS)
+            except tweepy.errors.TooManyRequests as e:
+                logger.warning(f"Filtered stream rate limited: {e}")
+                backoff = max(backoff, 60)
+            except Exception as e:
+                logger.error(f"Error in filtered stream: {e}")
+
+            if time.time() - started_at >= STABLE_CONNECTION_SECONDS:
+                backoff = min_backoff
+            logger.info(f"Reopening the filtered stream in {backoff} seconds")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff)
+
+    def own_user_id(self, account):
+        """Return an account's own user ID, looking it up on first use; None if unknown and lookups are off."""
+        if account.name not in self.user_ids and self.resolve_user_ids:
+            client, api = get_current_clients(account)
+            self.user_ids[account.name] = get_user_id(client)
+        return self.user_ids.get(account.name)
+
+    def backlog(self, account):
+        """Return the number of replies an account has waiting, including those held for OpenAI batches."""
+        backlog = len(account.reply_queue)
+        # Same routing as schedule_reply: the default account's hits go through batches when they are on
+        if account.default and batch_replies_enabled():
+            backlog += get_batch_generator().pending_replies()
+        return backlog
+
+    def _wait_for_room(self, account):
+        """Block while an account's backlog is too long to take more hits."""
+        backlog = self.backlog(account)
+        if backlog < self.max_pending_replies:
+            return
+        logger.warning(f"Account {account.name} has {backlog} replies waiting, pausing stream dispatch")
+        while self.backlog(account) >= self.max_pending_replies:
+            time.sleep(5)
+        logger.info(f"Resuming stream dispatch for account {account.name}")
+
+    def dispatch(self, tweet, matching_rules):
+        """Schedule replies to a matched tweet for every account whose rules it matched."""
+        targets = {}
+        for rule in matching_rules or []:
+            for account, source, category in self.routes.get(rule.tag, []):
+                # A tweet matching several rules of an account is queued once, for its first rule
+                targets.setdefault(account.name, (account, source, category))
+
+        for account, source, category in targets.values():
+            processed_tweets = load_processed_tweets(account)
+            if not processed_tweets.claim(tweet.id):
+                logger.debug(f"Skipping already processed tweet: {tweet.id}")
+                continue
+
+            own_user_id = self.own_user_id(account)
+            if own_user_id is not None and str(tweet.author_id) == str(own_user_id):
+                logger.debug(f"Skipping our own tweet: {tweet.id}")
+                continue
+
+            self._wait_for_room(account)
+            delay_minutes = load_monitoring_config(account).get("reply_delay_minutes", 60)
+            tweet_data = {
+                "tweet_id": tweet.id,
+                "user_id": tweet.author_id,
+                "text": tweet.text,
+                "created_at": tweet.created_at,
+                "delay_minutes": delay_minutes,
+                "is_reply_to_us": False,
+                "source": source
+            }
+            if category is not None:
+                tweet_data["category"] = category
+            logger.info(f"Adding streamed tweet {tweet.id} ({source}) to reply queue of account {account.name} with {delay_minutes} minute delay")
+            schedule_reply(tweet_data, account)
+
+    def run_dispatcher(self):
+        """Thread function moving matches from the intake queue to the reply queues."""
+        logger.info("Starting stream dispatcher thread")
+        while True:
+            tweet, matching_rules = self.intake.get()
+            try:
+                self.dispatch(tweet, matching_rules)
+            except Exception as e:
+                logger.error(f"Error dispatching streamed tweet {tweet.id}: {e}")
+            finally:
+                self.intake.task_done()
+
+class ReplayTweetSource:
+    """
+    Replays recorded filtered stream data instead of connecting to X.
+
+    The file holds one stream message per line, as written by the stream's
+    record_file option: {"data": {...}, "matching_rules": [{"id": ..., "tag": ...}]}.
+    Since rule tags are derived from the rule values, a recording matches the
+    routes of the same monitoring configuration. Lines are handed to the
+    ingestor with blocking puts, so nothing is dropped.
+
+    Args:
+        path: Path of the recorded stream
+        interval: Seconds to wait between tweets (default: 0)
+    """
+
+    def __init__(self, path, interval=0):
+        self.path = path
+        self.interval = interval
+
+    def tweets(self):
+        """Yield (tweet, matching_rules) for every recorded match."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Skipping unreadable line in {self.path}: {e}")
+                    continue
+                if "data" not in message:
+                    continue
+                matching_rules = [
+                    tweepy.StreamRule(id=rule.get("id"), tag=rule.get("tag"))
+                    for rule in message.get("matching_rules", [])
+                ]
+                yield tweepy.Tweet(message["data"]), matching_rules
+
+    def run(self, ingestor):
+        """Thread function feeding the recorded tweets to an ingestor."""
+        logger.info(f"Replaying recorded stream from {self.path}")
+        count = 0
+        for tweet, matching_rules in self.tweets():
+            ingestor.offer(tweet, matching_rules, block=True)
+            count += 1
+            if self.interval:
+                time.sleep(self.interval)
+        logger.info(f"Replayed {count} recorded tweets from {self.path}")
+
+def create_stream_threads(accounts=None, replay_file=None):
+    """
+    Create the threads of the filtered stream mode (not started).
+
+    The stream uses the app-only bearer token ("app_bearer_token") of the
+    default account's credentials; every streamed account must belong to the
+    same developer app. With replay_file, recorded tweets are replayed instead,
+    without calling the API: the own user IDs to skip come from
+    stream.replay_user_ids (account name -> user ID), if set.
+
+    Returns:
+        List of daemon threads, not yet started
+    """
+    config = load_stream_config()
+    ingestor = StreamIngestor(
+        accounts,
+        intake_size=config.get("intake_size", 1000),
+        max_pending_replies=config.get("max_pending_replies", 500),
+        user_ids=config.get("replay_user_ids") if replay_file else None,
+        resolve_user_ids=not replay_file
+    )
+
+    if replay_file:
+        source = threading.Thread(
+            target=ReplayTweetSource(replay_file, config.get("replay_interval_seconds", 0)).run,
+            args=(ingestor,),
+            daemon=True,
+            name="StreamReplay"
+        )
+    else:
+        bearer_token = load_config(get_default_account().credentials_key).get("app_bearer_token")
+        if not bearer_token:
+            raise ValueError("The filtered stream needs an app-only bearer token in 'app_bearer_token' of the account's credentials")
+        source = threading.Thread(
+            target=ingestor.run_stream,
+            args=(bearer_token, config.get("record_file")),
+            daemon=True,
+            name="FilteredStream"
+        )
+
+    dispatcher = threading.Thread(target=ingestor.run_dispatcher, daemon=True, name="StreamDispatcher")
+    return [source, dispatcher]
@@ -10,7 +10,6 @@ from twitter_poster import load_config, initialize_twitter_client, post_tweet_wi
 from twitter_monitor import (
     load_monitoring_config, 
     get_hashtag_query, 
-    get_keyword_query,
     safe_get_users_mentions,
     safe_get_tweet,
     safe_search_recent_tweets,
@@ -18,6 +17,7 @@ from twitter_monitor import (
     safe_get_friendship,
     get_user_id
 )
+from query_planner import get_query_planner
 
 # Set up logging
 logging.basicConfig(
@@ -36,6 +36,11 @@ api = None
 user_id = None
 processed_tweets = set()
 
+def get_keyword_queries():
+    """Plan the keyword search queries the same way the keywords monitor does."""
+    config = load_monitoring_config()
+    return get_query_planner("test_functions", config).next_queries(config.get("keywords", {}))
+
 def setup():
     """Initialize the Twitter clients."""
     global client, api, user_id
@@ -95,8 +100,8 @@ def test_monitoring_config():
         hashtag_query = get_hashtag_query()
         logger.info(f"Hashtag query: {hashtag_query}")
         
-        keyword_query = get_keyword_query()
-        logger.info(f"Keyword query: {keyword_query}")
+        for keyword_query in get_keyword_queries():
+            logger.info(f"Keyword query for {', '.join(keyword_query.categories)}: {keyword_query.text}")
     except Exception as e:
         logger.error(f"Error loading monitoring config: {e}")
 
@@ -201,8 +206,12 @@ def test_keywords_monitoring():
     logger.info("\n=== TESTING KEYWORDS MONITORING ===")
     
     try:
-        # Get the keyword query
-        query = get_keyword_query()
+        # Get the first keyword query the keywords monitor would run
+        keyword_queries = get_keyword_queries()
+        if not keyword_queries:
+            logger.warning("No keyword categories found in monitoring config")
+            return
+        query = keyword_queries[0].text
         logger.info(f"Searching for keywords with query: {query}")
         
         # Search for tweets with the keywords
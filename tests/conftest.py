@@ -0,0 +1,14 @@
+import os
+import sys
+import shutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in a scratch directory with a copy of the prompts template, so state files stay out of the repo."""
+    shutil.copy(os.path.join(ROOT, "prompts_template_alex.json"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
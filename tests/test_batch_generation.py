@@ -0,0 +1,94 @@
+import json
+import os
+import pytest
+
+from batch_generation import BatchGenerator, LocalBatchTransport
+from content_buffer import ContentBuffer
+from reply_scheduler import ReplyScheduler
+
+def make_generator(tmp_path, transport):
+    return BatchGenerator(
+        transport=transport,
+        reply_queue=ReplyScheduler(),
+        content_buffer=ContentBuffer(str(tmp_path / "content_buffer.json")),
+        state_path=str(tmp_path / "batch_jobs.json"),
+        input_dir=str(tmp_path / "batches")
+    )
+
+def test_reply_batch_fills_in_replies(tmp_path):
+    transport = LocalBatchTransport(
+        responder=lambda body: json.dumps({"reply": "Reply to: " + body["messages"][-1]["content"][-12:]}),
+        polls_until_done=1
+    )
+    generator = make_generator(tmp_path, transport)
+    generator.queue_reply({"tweet_id": 1, "text": "can't sleep", "source": "keyword", "category": "sleep"})
+    generator.queue_reply({"tweet_id": 2, "text": "#HealthTips", "source": "hashtag"})
+    assert generator.pending_replies() == 2
+
+    batch_id = generator.submit_replies()
+    assert batch_id is not None
+    assert generator.has_pending("replies")
+    assert generator.pending_replies() == 2
+
+    # Still running on the first poll, finished on the second
+    generator.poll()
+    assert len(generator.reply_queue) == 0
+    generator.poll()
+    assert not generator.has_pending("replies")
+    assert generator.pending_replies() == 0
+
+    items = sorted((generator.reply_queue.get(block=False) for _ in range(2)), key=lambda item: item["tweet_id"])
+    assert [item["tweet_id"] for item in items] == [1, 2]
+    assert all(item["reply_text"].startswith("Reply to: ") for item in items)
+    assert items[0]["category"] == "sleep"
+    assert os.listdir(tmp_path / "batches") == []
+
+def test_tweet_batch_fills_the_content_buffer(tmp_path):
+    generator = make_generator(tmp_path, LocalBatchTransport())
+    generator.submit_tweets(3, image_probability=0)
+    generator.poll()
+
+    assert len(generator.content_buffer) == 3
+    assert generator.content_buffer.pop()["tweet"] == "Local batch tweet"
+
+def test_batches_in_flight_survive_a_restart(tmp_path):
+    transport = LocalBatchTransport(polls_until_done=1)
+    generator = make_generator(tmp_path, transport)
+    generator.queue_reply({"tweet_id": 1, "text": "hi", "source": "hashtag"})
+    generator.submit_replies()
+    generator.poll()
+
+    restarted = make_generator(tmp_path, transport)
+    assert restarted.has_pending("replies")
+    restarted.poll()
+    assert restarted.reply_queue.get(block=False)["reply_text"] == "Local batch reply"
+
+def test_reply_batch_that_takes_too_long_falls_back_to_direct_generation(tmp_path):
+    generator = make_generator(tmp_path, LocalBatchTransport(polls_until_done=10))
+    generator.queue_reply({"tweet_id": 1, "text": "hi", "source": "hashtag"})
+    generator.submit_replies()
+
+    generator.poll(reply_max_wait_minutes=-1)
+    item = generator.reply_queue.get(block=False)
+    assert item["tweet_id"] == 1
+    assert "reply_text" not in item
+
+def test_finished_batch_is_tracked_until_its_results_are_ingested(tmp_path, monkeypatch):
+    generator = make_generator(tmp_path, LocalBatchTransport())
+    generator.queue_reply({"tweet_id": 1, "text": "hi", "source": "hashtag"})
+    generator.submit_replies()
+
+    # The process dies right after the results are queued
+    def crash(batch_id):
+        raise SystemExit
+    monkeypatch.setattr(generator, "_finish", crash)
+    with pytest.raises(SystemExit):
+        generator.poll()
+    assert generator.reply_queue.get(block=False)["reply_text"] == "Local batch reply"
+
+    # The batch is still on disk, so a restart picks its results up again
+    restarted = make_generator(tmp_path, generator.transport)
+    assert restarted.has_pending("replies")
+    restarted.poll()
+    assert restarted.reply_queue.get(block=False)["tweet_id"] == 1
+    assert not restarted.has_pending("replies")
@@ -0,0 +1,30 @@
+
+from content_buffer import ContentBuffer
+
+def test_buffers_sharing_a_file_see_each_others_changes(tmp_path):
+    path = str(tmp_path / "content_buffer.json")
+    producer = ContentBuffer(path)
+    poster = ContentBuffer(path)
+
+    first = producer.add("first tweet")
+    producer.add("second tweet")
+
+    # Each pop re-reads the file, so no tweet is handed out twice
+    assert poster.pop()["id"] == first["id"]
+    assert producer.pop()["tweet"] == "second tweet"
+    assert poster.pop() is None
+    assert len(producer) == 0
+
+def test_requeue_drops_an_item_after_max_attempts(tmp_path):
+    buffer = ContentBuffer(str(tmp_path / "content_buffer.json"), max_attempts=3)
+    buffer.add("rejected tweet")
+
+    for attempt in range(2):
+        item = buffer.pop()
+        assert buffer.requeue(item)
+        assert len(buffer) == 1
+
+    item = buffer.pop()
+    assert item["attempts"] == 2
+    assert not buffer.requeue(item)
+    assert len(buffer) == 0
@@ -0,0 +1,39 @@
+import os
+import sys
+import subprocess
+import pytest
+
+pytest.importorskip("tweepy")
+
+from conftest import ROOT
+
+def test_importing_the_agent_modules_does_not_build_the_accounts(tmp_path):
+    code = (
+        "import accounts, twitter_monitor, async_agent, twitter_agent, stream_ingest\n"
+        "assert accounts._accounts is None, 'accounts were built at import'\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + sys.path))
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
+
+def test_refresh_tokens_mode_only_touches_the_token_managers(tmp_path):
+    (tmp_path / "config.json").write_text(
+        '{"accounts": {"alex": {"credentials": "alex_token"}, "sam": {"credentials": "sam_token"}}}'
+    )
+    code = (
+        "import sys, accounts, token_refresher, twitter_agent\n"
+        "refreshed = []\n"
+        "class FakeManager:\n"
+        "    def __init__(self, key):\n"
+        "        self.key = key\n"
+        "    def needs_refresh(self):\n"
+        "        refreshed.append(self.key)\n"
+        "        return False\n"
+        "token_refresher.get_token_manager = FakeManager\n"
+        "sys.argv = ['twitter_agent.py', '--refresh-tokens']\n"
+        "twitter_agent.main()\n"
+        "assert refreshed == ['alex_token', 'sam_token'], refreshed\n"
+        "assert accounts._accounts is None, 'accounts were built to refresh tokens'\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT] + sys.path))
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / "reply_queue.log").exists()
@@ -0,0 +1,60 @@
+import types
+import mimetypes
+from io import BytesIO
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+class RecordingAPI:
+    """v1.1 API stand-in that records each media upload."""
+
+    def __init__(self):
+        self.uploads = []
+
+    def media_upload(self, filename, file, chunked=False, media_category=None):
+        self.uploads.append({"filename": filename, "data": file.read(), "chunked": chunked})
+        return types.SimpleNamespace(media_id=123)
+
+class RecordingClient:
+    """Client stand-in that records each posted tweet."""
+
+    def __init__(self):
+        self.tweets = []
+
+    def create_tweet(self, **kwargs):
+        self.tweets.append(kwargs)
+        return types.SimpleNamespace(data={"id": "1"})
+
+def jpeg_bytes():
+    output = BytesIO()
+    Image.new("RGB", (64, 64), "red").save(output, format="JPEG")
+    return output.getvalue()
+
+@pytest.mark.parametrize("chunked_threshold", [1024 * 1024, 0])
+def test_in_memory_jpeg_is_uploaded_as_jpeg(chunked_threshold):
+    from media_store import upload_image
+
+    api = RecordingAPI()
+    upload_image(api, image_data=jpeg_bytes(), extension=".jpg", chunked_threshold=chunked_threshold)
+
+    upload = api.uploads[0]
+    assert upload["chunked"] == (chunked_threshold == 0)
+    assert mimetypes.guess_type(upload["filename"])[0] == "image/jpeg"
+
+def test_random_tweet_uploads_generated_image_with_its_format(monkeypatch):
+    import twitter_poster
+
+    data = jpeg_bytes()
+    monkeypatch.setattr(twitter_poster, "generate_tweet_and_image", lambda save=True: {
+        "tweet": "Hello",
+        "image_data": data,
+        "image_extension": ".jpg",
+        "image_path": None
+    })
+    api = RecordingAPI()
+    client = RecordingClient()
+    twitter_poster.post_random_tweet(image_probability=1, client=client, api=api)
+
+    assert api.uploads[0]["data"] == data
+    assert mimetypes.guess_type(api.uploads[0]["filename"])[0] == "image/jpeg"
+    assert client.tweets == [{"text": "Hello", "media_ids": [123]}]
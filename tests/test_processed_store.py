@@ -0,0 +1,89 @@
+import json
+import time
+
+from processed_store import ProcessedTweetStore
+
+def make_store(path, **kwargs):
+    kwargs.setdefault("flush_interval", 0)
+    return ProcessedTweetStore(str(path), **kwargs)
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    store = make_store(tmp_path / "processed.log")
+    assert store.claim(1)
+    assert not store.claim("1")
+    assert 1 in store
+
+    store.release(1)
+    assert 1 not in store
+    assert store.claim(1)
+
+def test_claims_and_releases_are_replayed_from_the_log(tmp_path):
+    path = tmp_path / "processed.log"
+    store = make_store(path)
+    store.claim(1)
+    store.claim(2)
+    store.release(2)
+    store.claim(3)
+    store.flush()
+
+    restarted = make_store(path)
+    assert 1 in restarted and 3 in restarted
+    assert 2 not in restarted
+    assert not restarted.claim(1)
+    assert restarted.claim(2)
+
+def test_pending_entries_are_flushed_in_batches(tmp_path):
+    path = tmp_path / "processed.log"
+    store = make_store(path, flush_batch_size=3)
+    store.claim(1)
+    store.claim(2)
+    assert not path.exists() or path.read_text() == ""
+
+    store.claim(3)
+    assert len(path.read_text().splitlines()) == 3
+
+def test_truncated_lines_are_skipped(tmp_path):
+    path = tmp_path / "processed.log"
+    path.write_text(f"1\t{time.time():.0f}\n2\t")
+
+    store = make_store(path)
+    assert 1 in store
+    assert 2 not in store
+
+def test_compaction_keeps_one_line_per_live_entry(tmp_path):
+    path = tmp_path / "processed.log"
+    store = make_store(path, compact_threshold=4, flush_batch_size=1)
+    for tweet_id in range(3):
+        store.claim(tweet_id)
+    store.release(0)
+    store.flush()
+
+    # The fourth line crosses the threshold and the log is rewritten
+    assert sorted(line.split("\t")[0] for line in path.read_text().splitlines()) == ["1", "2"]
+    assert len(make_store(path)) == 2
+
+def test_entries_older_than_the_retention_window_are_dropped(tmp_path):
+    path = tmp_path / "processed.log"
+    old = time.time() - 31 * 24 * 60 * 60
+    path.write_text(f"1\t{old:.0f}\n2\t{time.time():.0f}\n")
+
+    store = make_store(path, retention_days=30)
+    assert 1 not in store
+    assert 2 in store
+    assert store.claim(1)
+
+    # Loading compacted the expired entry out of the log
+    assert [line.split("\t")[0] for line in path.read_text().splitlines()] == ["2"]
+
+def test_legacy_json_list_is_migrated_once(tmp_path):
+    legacy = tmp_path / "processed_tweets.json"
+    legacy.write_text(json.dumps([10, 11]))
+    path = tmp_path / "processed.log"
+
+    store = make_store(path, legacy_path=str(legacy))
+    assert 10 in store and 11 in store
+    assert len(path.read_text().splitlines()) == 2
+
+    # Once the log exists the legacy file is ignored
+    legacy.write_text(json.dumps([12]))
+    assert 12 not in make_store(path, legacy_path=str(legacy))
@@ -0,0 +1,20 @@
+import json
+import pytest
+
+from prompt_registry import PromptRegistry
+
+def test_validation_error_names_the_registry_file(tmp_path):
+    with open("prompts_template_alex.json", encoding="utf-8") as f:
+        data = json.load(f)
+    data["tweet_prompt"] = []
+    path = tmp_path / "prompts_template_sam.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+    with pytest.raises(ValueError, match=r"Invalid .*prompts_template_sam\.json: tweet_prompt must be a non-empty list"):
+        PromptRegistry(str(path)).tweet_templates()
+
+def test_template_file_compiles():
+    registry = PromptRegistry("prompts_template_alex.json")
+    assert registry.tweet_templates()
+    assert all("image_prompt" in template for template in registry.image_templates())
+    assert "{user_tweet}" not in registry.reply_prompt().system_prefix
@@ -0,0 +1,82 @@
+import time
+import queue
+import pytest
+
+from queue_backends import SQLiteReplyQueue, RedisReplyQueue, LocalRedis, LEASE_KEY
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_queue(request, tmp_path):
+    """Build reply queues of one backend that share the same storage, like separate processes would."""
+    redis = LocalRedis()
+
+    def make(visibility_timeout=600):
+        if request.param == "sqlite":
+            return SQLiteReplyQueue(str(tmp_path / "reply_queue.db"), visibility_timeout, poll_interval=0.05)
+        return RedisReplyQueue(redis, "test:reply_queue", visibility_timeout, poll_interval=0.05)
+    return make
+
+def test_put_get_ack(make_queue):
+    reply_queue = make_queue()
+    reply_queue.put({"tweet_id": 1, "text": "hashtag hit", "source": "hashtag"})
+    reply_queue.put({"tweet_id": 2, "text": "mention", "source": "mention"})
+    reply_queue.put({"tweet_id": 3, "text": "later", "delay_minutes": 60})
+    assert len(reply_queue) == 3
+
+    # Mentions are handed out first; the delayed item isn't due yet
+    first = reply_queue.get(block=False)
+    second = reply_queue.get(block=False)
+    assert [first["tweet_id"], second["tweet_id"]] == [2, 1]
+    assert first[LEASE_KEY] != second[LEASE_KEY]
+    with pytest.raises(queue.Empty):
+        reply_queue.get(timeout=0.1)
+
+    # Claimed items count until they are acknowledged
+    assert len(reply_queue) == 3
+    reply_queue.ack(first)
+    reply_queue.ack(second)
+    assert len(reply_queue) == 1
+    assert 3500 < reply_queue.next_due_in() <= 3600
+
+def test_each_item_is_claimed_once_across_queues(make_queue):
+    producer, worker, other_worker = make_queue(), make_queue(), make_queue()
+    producer.put({"tweet_id": 1, "text": "hi"})
+
+    assert worker.get(block=False)["tweet_id"] == 1
+    with pytest.raises(queue.Empty):
+        other_worker.get(block=False)
+
+def test_expired_lease_hands_the_item_out_again(make_queue):
+    reply_queue = make_queue(visibility_timeout=0.2)
+    reply_queue.put({"tweet_id": 1, "text": "hi"})
+
+    # The worker holding the lease dies without acknowledging the item
+    reply_queue.get(block=False)
+    with pytest.raises(queue.Empty):
+        reply_queue.get(block=False)
+
+    time.sleep(0.3)
+    again = make_queue(visibility_timeout=0.2).get(block=False)
+    assert again["tweet_id"] == 1
+    reply_queue.ack(again)
+    assert reply_queue.empty()
+    assert reply_queue.next_due_in() is None
+
+def test_stale_ack_leaves_a_reclaimed_item_queued(make_queue):
+    reply_queue = make_queue(visibility_timeout=0.2)
+    reply_queue.put({"tweet_id": 1, "text": "hi"})
+
+    # The first worker stalls past its lease and another worker claims the item
+    stale = reply_queue.get(block=False)
+    time.sleep(0.3)
+    other_worker = make_queue(visibility_timeout=0.2)
+    current = other_worker.get(block=False)
+    assert current["tweet_id"] == 1
+
+    # The late ack must not delete the item out from under the new lease holder
+    reply_queue.ack(stale)
+    assert len(reply_queue) == 1
+    with pytest.raises(queue.Empty):
+        reply_queue.get(block=False)
+
+    other_worker.ack(current)
+    assert reply_queue.empty()
@@ -0,0 +1,91 @@
+import time
+import types
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket, classify_endpoint
+
+def test_endpoints_are_classified_by_method_and_path():
+    assert classify_endpoint("GET", "https://api.twitter.com/2/users/42/mentions?max_results=10") == "mentions"
+    assert classify_endpoint("GET", "https://api.twitter.com/2/tweets/search/recent") == "search"
+    assert classify_endpoint("POST", "https://api.twitter.com/2/tweets") == "create"
+    assert classify_endpoint("GET", "https://api.twitter.com/2/tweets/123") == "tweet_lookup"
+    assert classify_endpoint("GET", "https://api.twitter.com/1.1/friendships/show.json") == "friendship"
+    assert classify_endpoint("GET", "https://api.twitter.com/2/users/42/followers") is None
+
+def test_bucket_refills_continuously():
+    bucket = TokenBucket(2, 1)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert 0 < bucket.try_acquire() <= 0.5
+
+    time.sleep(0.55)
+    assert bucket.try_acquire() == 0
+
+def test_buckets_are_independent_per_endpoint():
+    limiter = RateLimiter({"search": (1, 60)})
+    limiter._bucket("search").try_acquire()
+    assert limiter._bucket("search").try_acquire() > 0
+    assert limiter._bucket("create").try_acquire() == 0
+
+def test_headers_calibrate_the_bucket_to_the_server_window():
+    limiter = RateLimiter()
+    reset_at = int(time.time()) + 120
+    limiter.update_from_headers("search", {
+        "x-rate-limit-limit": "450",
+        "x-rate-limit-remaining": "1",
+        "x-rate-limit-reset": str(reset_at)
+    })
+
+    budget = limiter.budget()["search"]
+    assert budget["limit"] == 450
+    assert budget["remaining"] == 1
+    assert 115 <= budget["resets_in"] <= 120
+
+    # The reported remaining request is handed out, then nothing until the reset
+    bucket = limiter._bucket("search")
+    assert bucket.try_acquire() == 0
+    assert 115 <= bucket.try_acquire() <= 120
+
+def test_bad_headers_are_ignored():
+    limiter = RateLimiter()
+    before = limiter.budget()["search"]
+    limiter.update_from_headers("search", {"x-rate-limit-remaining": "many"})
+    limiter.update_from_headers("search", {})
+    assert limiter.budget()["search"] == before
+
+def test_response_hook_feeds_the_matching_bucket():
+    limiter = RateLimiter()
+    response = types.SimpleNamespace(
+        request=types.SimpleNamespace(method="POST"),
+        url="https://api.twitter.com/2/tweets",
+        headers={"x-rate-limit-remaining": "7", "x-rate-limit-reset": str(int(time.time()) + 60)}
+    )
+    limiter.observe_response(response)
+    assert limiter.budget()["create"]["remaining"] == 7
+
+def test_pause_holds_the_endpoint_back():
+    limiter = RateLimiter()
+    limiter.pause("create", 60)
+
+    budget = limiter.budget()["create"]
+    assert budget["remaining"] == 0
+    assert 55 <= budget["resets_in"] <= 60
+    assert limiter._bucket("create").try_acquire() > 55
+    assert limiter._bucket("search").try_acquire() == 0
+
+def test_pause_keeps_a_reset_time_reported_by_the_server():
+    limiter = RateLimiter()
+    reset_at = int(time.time()) + 300
+    limiter.update_from_headers("create", {"x-rate-limit-remaining": "0", "x-rate-limit-reset": str(reset_at)})
+
+    limiter.pause("create", 60)
+    assert limiter.budget()["create"]["resets_in"] == pytest.approx(300, abs=2)
+
+def test_window_reset_restores_the_full_budget():
+    bucket = TokenBucket(5, 60)
+    bucket.update(remaining=0, reset_at=time.time() + 0.2)
+    assert bucket.try_acquire() > 0
+
+    time.sleep(0.25)
+    assert bucket.try_acquire() == 0
+    assert bucket.budget()["remaining"] == 4
@@ -0,0 +1,34 @@
+import reply_cache as reply_cache_module
+from reply_cache import ReplyCache
+
+def test_cache_hit_does_not_extend_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(reply_cache_module.time, "time", lambda: now[0])
+    cache = ReplyCache(ttl_hours=1, refresh_probability=0)
+
+    cache.approve("my head hurts so bad", "Rest and drink water!", "health")
+    now[0] += 30 * 60
+    reply, key = cache.lookup("my head hurts so bad", "health")
+    assert reply == "Rest and drink water!"
+
+    # Posting the cached reply leaves the entry alone
+    now[0] += 31 * 60
+    assert cache.lookup("my head hurts so bad", "health") == (None, None)
+
+def test_fresh_reply_after_similar_match_becomes_a_variant(monkeypatch):
+    monkeypatch.setattr(reply_cache_module.random, "random", lambda: 0.0)
+    cache = ReplyCache(refresh_probability=1, similarity_threshold=0.5)
+
+    cache.approve("my head hurts so bad", "Rest and drink water!", "health")
+    created_at = next(iter(cache._entries.values()))["created_at"]
+
+    # A deliberate refresh miss still reports the similar entry it matched
+    reply, key = cache.lookup("my head hurts so bad today", "health")
+    assert reply is None
+    assert key == ("health", "my head hurts so bad")
+
+    cache.approve("my head hurts so bad today", "Try a cold compress.", "health", key)
+    assert len(cache) == 1
+    entry = cache._entries[key]
+    assert entry["replies"] == ["Rest and drink water!", "Try a cold compress."]
+    assert entry["created_at"] == created_at
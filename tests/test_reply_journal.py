@@ -0,0 +1,69 @@
+import time
+import queue
+import pytest
+
+from reply_journal import DurableReplyScheduler, ReplyJournal, JOURNAL_ID_KEY
+
+def test_unacknowledged_replies_are_replayed_after_a_restart(tmp_path):
+    path = str(tmp_path / "reply_queue.log")
+    scheduler = DurableReplyScheduler(path)
+    scheduler.put({"tweet_id": 1, "source": "hashtag"})
+    scheduler.put({"tweet_id": 2, "source": "mention"})
+    scheduler.put({"tweet_id": 3, "source": "keyword"}, not_before=time.time() + 60)
+    scheduler.ack(scheduler.get(block=False))
+
+    # Tweet 2 was answered; 1 is still due and 3 still waits out its delay
+    restarted = DurableReplyScheduler(path)
+    assert len(restarted) == 2
+    assert restarted.get(block=False)["tweet_id"] == 1
+    with pytest.raises(queue.Empty):
+        restarted.get(block=False)
+    assert 55 < restarted.next_due_in() <= 60
+
+def test_requeued_reply_gets_a_new_journal_id(tmp_path):
+    path = str(tmp_path / "reply_queue.log")
+    scheduler = DurableReplyScheduler(path)
+    scheduler.put({"tweet_id": 1})
+    item = scheduler.get(block=False)
+
+    # A rate-limited worker puts the item back, then acks the copy it holds
+    scheduler.put(item, not_before=time.time() + 60)
+    scheduler.ack(item)
+    requeued = scheduler.journal.entries()
+    assert len(requeued) == 1
+    assert requeued[0][0] != item[JOURNAL_ID_KEY]
+
+    restarted = DurableReplyScheduler(path)
+    assert len(restarted) == 1
+    assert 55 < restarted.next_due_in() <= 60
+
+def test_journal_is_compacted_to_the_unacknowledged_entries(tmp_path):
+    path = tmp_path / "reply_queue.log"
+    journal = ReplyJournal(str(path), compact_threshold=4)
+    first = journal.put(time.time(), {"tweet_id": 1})
+    journal.put(time.time(), {"tweet_id": 2})
+    journal.put(time.time(), {"tweet_id": 3})
+    journal.ack(first)
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert all(line.startswith("P\t") for line in lines)
+
+    # IDs keep increasing after compaction and a restart
+    restarted = ReplyJournal(str(path))
+    assert restarted.put(time.time(), {"tweet_id": 4}) > first + 2
+    assert [item["tweet_id"] for _, _, item in restarted.entries()] == [2, 3, 4]
+
+def test_truncated_records_are_skipped(tmp_path):
+    path = tmp_path / "reply_queue.log"
+    path.write_text('P\t1\t0.000\t{"tweet_id": 1}\nP\t2\t0.000\t{"tweet_i')
+
+    journal = ReplyJournal(str(path))
+    assert [item["tweet_id"] for _, _, item in journal.entries()] == [1]
+
+def test_writes_reach_the_file_before_they_are_synced(tmp_path):
+    path = tmp_path / "reply_queue.log"
+    journal = ReplyJournal(str(path), fsync_interval=60)
+    journal.put(time.time(), {"tweet_id": 1})
+    assert '"tweet_id": 1' in path.read_text()
+    journal.sync()
@@ -0,0 +1,68 @@
+import time
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+
+from reply_scheduler import ReplyScheduler, get_due_time, get_priority
+
+def test_due_time_counts_the_delay_from_the_tweet_creation():
+    created_at = datetime.now(timezone.utc) - timedelta(minutes=50)
+    due_time = get_due_time({"delay_minutes": 60, "created_at": created_at.isoformat().replace("+00:00", "Z")})
+    assert due_time == pytest.approx(time.time() + 10 * 60, abs=5)
+
+    # Naive datetimes are taken as UTC; no delay means due now
+    assert get_due_time({"delay_minutes": 60, "created_at": created_at.replace(tzinfo=None)}) == pytest.approx(due_time)
+    assert get_due_time({"text": "hi"}) == pytest.approx(time.time(), abs=1)
+
+def test_priority_comes_from_the_source_unless_set():
+    assert get_priority({"source": "mention"}) < get_priority({"source": "hashtag"})
+    assert get_priority({"source": "keyword"}) == get_priority({"source": "unknown"})
+    assert get_priority({"source": "hashtag", "priority": -1}) == -1
+
+def test_due_items_are_handed_out_by_priority():
+    scheduler = ReplyScheduler()
+    scheduler.put({"tweet_id": 1, "source": "keyword"})
+    scheduler.put({"tweet_id": 2, "source": "hashtag"})
+    scheduler.put({"tweet_id": 3, "source": "mention"})
+
+    # Mentions first, then the others in the order they became due
+    assert [scheduler.get(block=False)["tweet_id"] for _ in range(3)] == [3, 1, 2]
+
+def test_items_are_held_until_due():
+    scheduler = ReplyScheduler()
+    scheduler.put({"tweet_id": 1, "source": "mention"}, not_before=time.time() + 60)
+    scheduler.put({"tweet_id": 2, "source": "hashtag"})
+
+    assert scheduler.get(block=False)["tweet_id"] == 2
+    with pytest.raises(queue.Empty):
+        scheduler.get(block=False)
+    assert 55 < scheduler.next_due_in() <= 60
+    assert len(scheduler) == 1
+
+def test_get_wakes_up_when_the_earliest_item_is_due():
+    scheduler = ReplyScheduler()
+    scheduler.put({"tweet_id": 1}, not_before=time.time() + 0.2)
+
+    started = time.monotonic()
+    assert scheduler.get(timeout=5)["tweet_id"] == 1
+    assert 0.15 < time.monotonic() - started < 2
+
+def test_get_wakes_up_for_a_new_item():
+    scheduler = ReplyScheduler()
+    threading.Timer(0.1, scheduler.put, args=({"tweet_id": 1},)).start()
+    assert scheduler.get(timeout=5)["tweet_id"] == 1
+
+def test_join_waits_for_every_item_to_be_acknowledged():
+    scheduler = ReplyScheduler()
+    scheduler.put({"tweet_id": 1})
+    item = scheduler.get(block=False)
+    assert scheduler.empty()
+
+    joined = threading.Event()
+    threading.Thread(target=lambda: (scheduler.join(), joined.set()), daemon=True).start()
+    assert not joined.wait(0.1)
+    scheduler.ack(item)
+    assert joined.wait(1)
+    with pytest.raises(ValueError):
+        scheduler.task_done()
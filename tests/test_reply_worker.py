@@ -0,0 +1,84 @@
+import time
+import types
+import pytest
+
+tweepy = pytest.importorskip("tweepy")
+
+class StopWorker(BaseException):
+    """Raised by the fake queue to end the reply worker's loop."""
+
+class RateLimitedClient:
+    """Client whose create_tweet always answers 429."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create_tweet(self, **kwargs):
+        self.calls += 1
+        response = types.SimpleNamespace(status_code=429, reason="Too Many Requests", json=lambda: {}, text="")
+        raise tweepy.errors.TooManyRequests(response)
+
+class FakeAccount:
+    """Minimal account with a local queue, limiter and replied store."""
+
+    def __init__(self, client, tmp_path):
+        from reply_scheduler import ReplyScheduler
+        from rate_limiter import RateLimiter
+        from processed_store import ProcessedTweetStore
+        self.name = "test"
+        self.client = client
+        self.reply_queue = ReplyScheduler()
+        self.rate_limiter = RateLimiter()
+        self.rate_limiter.install(client)
+        self._replied = ProcessedTweetStore(str(tmp_path / "replied.log"))
+        self.prompt_registry = None
+
+    def get_clients(self):
+        return self.client, None
+
+    def replied_tweets(self):
+        return self._replied
+
+    def reply_cache(self):
+        return None
+
+@pytest.mark.parametrize("is_reply_to_us", [False, True])
+def test_rate_limited_reply_is_requeued_and_pauses_writes(tmp_path, monkeypatch, is_reply_to_us):
+    import twitter_monitor
+
+    client = RateLimitedClient()
+    account = FakeAccount(client, tmp_path)
+    monkeypatch.setattr(twitter_monitor, "get_client_rate_limiter", lambda c: account.rate_limiter)
+    monkeypatch.setattr(twitter_monitor.safe_create_tweet.retry, "sleep", lambda seconds: None)
+
+    tweet_data = {
+        "tweet_id": 1,
+        "user_id": 2,
+        "text": "any doctors here?",
+        "reply_text": "Hope you feel better soon!",
+        "source": "mention",
+        "is_reply_to_us": is_reply_to_us
+    }
+    items = [(account, tweet_data)]
+
+    def next_reply(accounts, timeout=60):
+        if items:
+            return items.pop()
+        raise StopWorker()
+
+    monkeypatch.setattr(twitter_monitor, "next_reply", next_reply)
+
+    with pytest.raises(StopWorker):
+        twitter_monitor.reply_worker(client, None, accounts=[account])
+
+    # Three attempts, then the 429 reaches the worker instead of a RetryError
+    assert client.calls == 3
+
+    # The reply is back in the queue for later and may be claimed again
+    assert len(account.reply_queue) == 1
+    assert account.reply_queue.next_due_in() > 60 * 14
+    assert 1 not in account.replied_tweets()
+
+    # Writes are held back for every worker of the account
+    assert account.rate_limiter.budget()["create"]["remaining"] == 0
+    assert account.rate_limiter._bucket("create").try_acquire() > 0
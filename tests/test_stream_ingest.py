@@ -0,0 +1,83 @@
+import json
+import pytest
+
+tweepy = pytest.importorskip("tweepy")
+
+from processed_store import ProcessedTweetStore
+from reply_scheduler import ReplyScheduler
+
+class FakeAccount:
+    """Account with local state and a fixed monitoring config."""
+
+    def __init__(self, name, tmp_path, config, default=False):
+        self.name = name
+        self.default = default
+        self.reply_queue = ReplyScheduler()
+        self._processed = ProcessedTweetStore(str(tmp_path / f"processed.{name}.log"), flush_interval=0)
+        self._config = config
+
+    def monitoring_config(self):
+        return self._config
+
+    def processed_tweets(self):
+        return self._processed
+
+def record(path, tweets):
+    """Write stream messages the way TweetStream's record_file does."""
+    with open(path, "w", encoding="utf-8") as f:
+        for data, tags in tweets:
+            data = dict(data, edit_history_tweet_ids=[data["id"]])
+            f.write(json.dumps({"data": data, "matching_rules": [{"id": "1", "tag": tag} for tag in tags]}) + "\n")
+
+def test_replayed_stream_is_dispatched_offline(tmp_path, monkeypatch):
+    import stream_ingest
+    from stream_ingest import StreamIngestor, ReplayTweetSource, build_rules
+
+    def no_api(*args, **kwargs):
+        raise AssertionError("replay must not call the API")
+    monkeypatch.setattr(stream_ingest, "get_current_clients", no_api)
+
+    alex = FakeAccount("alex", tmp_path, {
+        "hashtags": ["#HealthTips"],
+        "keywords": {"sleep": ["can't sleep"]},
+        "reply_delay_minutes": 0
+    })
+    sam = FakeAccount("sam", tmp_path, {"hashtags": ["#HealthTips"], "keywords": {}, "reply_delay_minutes": 0})
+    rules, routes = build_rules([alex, sam])
+    hashtag_tag = next(tag for tag, value in rules.items() if "#HealthTips" in value)
+    keyword_tag = next(tag for tag, value in rules.items() if "sleep" in value)
+
+    path = tmp_path / "recorded.jsonl"
+    record(path, [
+        ({"id": "1", "text": "#HealthTips drink water", "author_id": "50"}, [hashtag_tag]),
+        ({"id": "2", "text": "can't sleep again #HealthTips", "author_id": "51"}, [keyword_tag, hashtag_tag]),
+        ({"id": "3", "text": "our own #HealthTips tweet", "author_id": "42"}, [hashtag_tag]),
+        ({"id": "1", "text": "#HealthTips drink water", "author_id": "50"}, [hashtag_tag]),
+    ])
+
+    ingestor = StreamIngestor([alex, sam], user_ids={"alex": "42"}, resolve_user_ids=False)
+    for tweet, matching_rules in ReplayTweetSource(str(path)).tweets():
+        ingestor.dispatch(tweet, matching_rules)
+
+    # alex: tweets 1 and 2 (2 once, under its first matching rule); its own tweet 3 is skipped
+    queued = [alex.reply_queue.get(block=False) for _ in range(len(alex.reply_queue))]
+    assert sorted((item["tweet_id"], item["source"]) for item in queued) == [(1, "hashtag"), (2, "keyword")]
+    assert next(item for item in queued if item["tweet_id"] == 2)["category"] == "sleep"
+
+    # sam has no known user ID in the replay, so nothing of theirs is skipped
+    assert sorted(sam.reply_queue.get(block=False)["tweet_id"] for _ in range(len(sam.reply_queue))) == [1, 2, 3]
+
+def test_backlog_includes_replies_held_for_batches(tmp_path, monkeypatch):
+    import stream_ingest
+    from stream_ingest import StreamIngestor
+
+    alex = FakeAccount("alex", tmp_path, {"hashtags": ["#HealthTips"], "keywords": {}}, default=True)
+    alex.reply_queue.put({"tweet_id": 1, "text": "hi", "delay_minutes": 0})
+
+    class HeldReplies:
+        def pending_replies(self):
+            return 3
+
+    monkeypatch.setattr(stream_ingest, "batch_replies_enabled", lambda: True)
+    monkeypatch.setattr(stream_ingest, "get_batch_generator", lambda: HeldReplies())
+    assert StreamIngestor([alex], resolve_user_ids=False).backlog(alex) == 4
@@ -0,0 +1,125 @@
+import asyncio
+import types
+import pytest
+
+tweepy = pytest.importorskip("tweepy")
+
+from monitor_state import HighWaterMarks
+
+class FakeAccount:
+    """Account with its own high-water marks and a fixed monitoring config."""
+
+    def __init__(self, tmp_path, max_pages=5):
+        self.high_water_marks = HighWaterMarks(str(tmp_path / "monitor_state.json"))
+        self._config = {"max_pages_per_poll": max_pages}
+
+    def monitoring_config(self):
+        return self._config
+
+def page(ids, newest_id=None, next_token=None):
+    """Build a response holding tweets with the given IDs."""
+    meta = {"newest_id": newest_id}
+    if next_token:
+        meta["next_token"] = next_token
+    data = [types.SimpleNamespace(id=tweet_id) for tweet_id in ids]
+    return types.SimpleNamespace(data=data, includes={}, meta=meta)
+
+class FakeTimeline:
+    """Serves pages keyed by (since_id, until_id, page_token) and records the requests."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def __call__(self, max_results, since_id, until_id, page_token):
+        self.requests.append((since_id, until_id, page_token))
+        return self.pages[(since_id, until_id, page_token)]
+
+PAGES = {
+    ("100", None, None): page([130, 120], newest_id="130", next_token="t1"),
+    ("100", None, "t1"): page([110], newest_id="110"),
+}
+
+def test_sync_and_async_monitors_share_the_pager(tmp_path, monkeypatch):
+    import twitter_monitor
+    import async_agent
+
+    account = FakeAccount(tmp_path)
+    account.high_water_marks.update("hashtags", "100")
+    timeline = FakeTimeline(PAGES)
+    tweets, _, pager = twitter_monitor.fetch_new_tweets(timeline, "hashtags", 20, account)
+    assert [tweet.id for tweet in tweets] == [130, 120, 110]
+    pager.commit()
+    assert account.high_water_marks.get("hashtags") == "130"
+
+    account.high_water_marks.reset("hashtags")
+    account.high_water_marks.update("hashtags", "100")
+    async_timeline = FakeTimeline(PAGES)
+
+    async def fetch_page(**request):
+        return async_timeline(**request)
+
+    monkeypatch.setattr(async_agent, "get_default_account", lambda: account)
+    tweets, _, pager = asyncio.run(async_agent.fetch_new_tweets(fetch_page, "hashtags", 20))
+    assert [tweet.id for tweet in tweets] == [130, 120, 110]
+    assert async_timeline.requests == timeline.requests
+    pager.commit()
+    assert account.high_water_marks.get("hashtags") == "130"
+
+def test_mark_only_moves_when_the_poll_is_committed(tmp_path):
+    import twitter_monitor
+
+    account = FakeAccount(tmp_path)
+    account.high_water_marks.update("hashtags", "100")
+    twitter_monitor.fetch_new_tweets(FakeTimeline(PAGES), "hashtags", 20, account)
+
+    # Queueing failed, so the next poll fetches the same tweets again
+    assert account.high_water_marks.get("hashtags") == "100"
+    tweets, _, _ = twitter_monitor.fetch_new_tweets(FakeTimeline(PAGES), "hashtags", 20, account)
+    assert [tweet.id for tweet in tweets] == [130, 120, 110]
+
+def test_poll_cut_short_resumes_the_gap_before_moving_the_mark(tmp_path):
+    import twitter_monitor
+
+    account = FakeAccount(tmp_path, max_pages=1)
+    marks = account.high_water_marks
+    marks.update("hashtags", "100")
+
+    # First poll only reads the newest page; 110 is left in the gap
+    tweets, _, pager = twitter_monitor.fetch_new_tweets(FakeTimeline(PAGES), "hashtags", 20, account)
+    assert [tweet.id for tweet in tweets] == [130, 120]
+    pager.commit()
+    assert marks.get("hashtags") == "100"
+    assert marks.get_gap("hashtags") == ("120", "130")
+
+    # Next poll reads the gap below the oldest tweet read, then moves the mark past everything seen
+    gap_timeline = FakeTimeline({("100", "120", None): page([110], newest_id="110")})
+    tweets, _, pager = twitter_monitor.fetch_new_tweets(gap_timeline, "hashtags", 20, account)
+    assert [tweet.id for tweet in tweets] == [110]
+    pager.commit()
+    assert marks.get("hashtags") == "130"
+    assert marks.get_gap("hashtags") is None
+
+    # The state survives a restart
+    from monitor_state import HighWaterMarks
+    assert HighWaterMarks(marks.path).get("hashtags") == "130"
+
+def test_idle_reply_workers_wake_when_a_tweet_is_queued(monkeypatch):
+    import async_agent
+    from reply_scheduler import ReplyScheduler
+
+    reply_queue = ReplyScheduler()
+    monkeypatch.setattr(async_agent, "get_default_account", lambda: types.SimpleNamespace(reply_queue=reply_queue))
+
+    async def scenario():
+        reply_ready = asyncio.Event()
+        worker = asyncio.create_task(async_agent.next_reply(reply_ready))
+        await asyncio.sleep(0.2)
+        assert not worker.done()
+
+        reply_queue.put({"tweet_id": 1, "text": "hi", "delay_minutes": 0})
+        reply_ready.set()
+        return await asyncio.wait_for(worker, 5)
+
+    # Far below IDLE_WAIT_SECONDS, so the event woke the worker, not its timeout
+    assert asyncio.run(scenario())["tweet_id"] == 1
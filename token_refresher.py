@@ -3,7 +3,9 @@ import json
 import time
 import logging
 import requests
+import threading
 from datetime import datetime, timedelta
+from config_cache import DEFAULT_CREDENTIALS_KEY
 
 # Set up logging
 logging.basicConfig(
@@ -19,19 +21,22 @@ logger = logging.getLogger("token_refresher")
 # File to store tokens
 CONFIG_FILE = "config.json"
 
-def load_tokens():
-    """Load tokens from the config file."""
+# Serializes rewrites of config.json when several accounts refresh at once
+_config_write_lock = threading.Lock()
+
+def load_tokens(credentials_key=DEFAULT_CREDENTIALS_KEY):
+    """Load tokens for an account from the config file."""
     try:
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r') as f:
                 config = json.load(f)
                 tokens = {
                     # Only load the bearer tokens and credentials needed for refreshing
-                    "bearer_token": config["Aalexhealth_token"].get("access_bearer_token"),
-                    "refresh_token": config["Aalexhealth_token"].get("access_refersh_bearer_token"),
-                    "expires_at": config["Aalexhealth_token"].get("token_expires_at"),
-                    "client_id": config["Aalexhealth_token"].get("client_id"),
-                    "client_id_secret": config["Aalexhealth_token"].get("client_id_secret")
+                    "bearer_token": config[credentials_key].get("access_bearer_token"),
+                    "refresh_token": config[credentials_key].get("access_refersh_bearer_token"),
+                    "expires_at": config[credentials_key].get("token_expires_at"),
+                    "client_id": config[credentials_key].get("client_id"),
+                    "client_id_secret": config[credentials_key].get("client_id_secret")
                 }
                 logger.debug("Tokens loaded successfully from config.json")
                 return tokens
@@ -42,34 +47,40 @@ def load_tokens():
         logger.error(f"Error loading tokens from config: {e}")
         return None
 
-def save_tokens(tokens):
-    """Save tokens to the config file, only updating the bearer tokens."""
+def save_tokens(tokens, credentials_key=DEFAULT_CREDENTIALS_KEY):
+    """Save tokens to the config file, only updating the account's bearer tokens."""
     try:
-        # Load existing config
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                config = json.load(f)
-        else:
-            config = {"Aalexhealth_token": {}}
-        
-        # Only update the bearer tokens and expiry time
-        if "bearer_token" in tokens:
-            config["Aalexhealth_token"]["access_bearer_token"] = tokens.get("bearer_token")
-        if "refresh_token" in tokens:
-            config["Aalexhealth_token"]["access_refersh_bearer_token"] = tokens.get("refresh_token")
-        if "expires_at" in tokens:
-            config["Aalexhealth_token"]["token_expires_at"] = tokens.get("expires_at")
-        
-        # Save updated config
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
-        logger.debug("Bearer tokens saved successfully to config.json")
+        with _config_write_lock:
+            # Load existing config
+            if os.path.exists(CONFIG_FILE):
+                with open(CONFIG_FILE, 'r') as f:
+                    config = json.load(f)
+            else:
+                config = {}
+            account_config = config.setdefault(credentials_key, {})
+            
+            # Only update the bearer tokens and expiry time
+            if "bearer_token" in tokens:
+                account_config["access_bearer_token"] = tokens.get("bearer_token")
+            if "refresh_token" in tokens:
+                account_config["access_refersh_bearer_token"] = tokens.get("refresh_token")
+            if "expires_at" in tokens:
+                account_config["token_expires_at"] = tokens.get("expires_at")
+            
+            # Save updated config atomically so readers never see a half-written file
+            temp_path = CONFIG_FILE + ".tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(config, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, CONFIG_FILE)
+        logger.debug(f"Bearer tokens for {credentials_key} saved successfully to config.json")
     except Exception as e:
         logger.error(f"Error saving tokens to config: {e}")
 
-def refresh_access_token(client_id, client_secret, refresh_token):
+def refresh_access_token(client_id, client_secret, refresh_token, credentials_key=DEFAULT_CREDENTIALS_KEY):
     """Refresh the Twitter API bearer tokens using the refresh token."""
-    logger.info("Refreshing Twitter API bearer tokens")
+    logger.info(f"Refreshing Twitter API bearer tokens for {credentials_key}")
     
     if not refresh_token:
         logger.error("No refresh token available")
@@ -103,7 +114,7 @@ def refresh_access_token(client_id, client_secret, refresh_token):
             }
             
             # Save the new tokens
-            save_tokens(tokens)
+            save_tokens(tokens, credentials_key)
             
             logger.info(f"Bearer tokens refreshed successfully, expires in {expires_in} seconds")
             return tokens
@@ -115,30 +126,173 @@ def refresh_access_token(client_id, client_secret, refresh_token):
         logger.error(f"Error refreshing token: {e}")
         return None
 
-def check_token_expiry():
-    """Check if the access token is expired or about to expire."""
-    tokens = load_tokens()
-    
-    if not tokens:
-        logger.warning("No tokens found")
-        return True  # Tokens need refreshing
-    
-    if "expires_at" not in tokens or not tokens["expires_at"]:
-        logger.warning("No expiration time found in tokens")
-        return True  # Tokens need refreshing
-    
-    # Check if token is expired or about to expire (within 5 minutes)
-    current_time = int(time.time())
-    expires_at = int(tokens["expires_at"])
-    time_left = expires_at - current_time
-    
-    if time_left <= 300:  # 5 minutes in seconds
-        logger.info(f"Token expires in {time_left} seconds, needs refreshing")
-        return True
-    else:
+class TokenManager:
+    """
+    Process-wide owner of the OAuth 2.0 bearer token.
+
+    The token expiry is read from config.json once and then kept in memory, so
+    checking it costs nothing. Refreshes are single-flight: when several threads
+    notice the token is about to expire, only one of them calls the token
+    endpoint and the others reuse its result. get_clients() hands every thread
+    the shared Tweepy clients carrying the current token.
+
+    Args:
+        refresh_margin: Seconds before expiry at which the token is refreshed (default: 300)
+        retry_interval: Seconds to wait after a failed refresh before trying again (default: 60)
+        credentials_key: Section of config.json holding the account's credentials
+    """
+
+    def __init__(self, refresh_margin=300, retry_interval=60, credentials_key=DEFAULT_CREDENTIALS_KEY):
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.credentials_key = credentials_key
+        self._tokens = None
+        self._next_attempt_at = 0
+        self._warned_missing_expiry = False
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        """Load the token state from disk the first time it is needed."""
+        if self._tokens is None:
+            self._tokens = load_tokens(self.credentials_key) or {}
+
+    def seconds_left(self):
+        """Return the number of seconds until the token expires, or None if unknown."""
+        with self._lock:
+            self._ensure_loaded()
+            expires_at = self._tokens.get("expires_at")
+            if not expires_at:
+                return None
+            return int(expires_at) - int(time.time())
+
+    def needs_refresh(self):
+        """Check (in memory) whether the token is expired or about to expire."""
+        time_left = self.seconds_left()
+        if time_left is None:
+            # Checked on every API call, so only the first miss is worth a warning
+            if not self._warned_missing_expiry:
+                logger.warning("No expiration time found in tokens")
+                self._warned_missing_expiry = True
+            else:
+                logger.debug("No expiration time found in tokens")
+            return True
+        self._warned_missing_expiry = False
+        if time_left <= self.refresh_margin:
+            logger.info(f"Token expires in {time_left} seconds, needs refreshing")
+            return True
         logger.debug(f"Token is valid for {time_left} more seconds")
         return False
 
+    def refresh(self, force=False):
+        """
+        Refresh the bearer token if it is due (or if force is set).
+
+        Only one thread refreshes at a time; threads that were waiting on the
+        lock see the new expiry and return without refreshing again.
+
+        Returns:
+            True if the token was refreshed by this call, False otherwise
+        """
+        with self._lock:
+            if not force and not self.needs_refresh():
+                return False
+            if not force and time.time() < self._next_attempt_at:
+                logger.debug("Skipping token refresh, last attempt failed recently")
+                return False
+
+            self._ensure_loaded()
+            refreshed_tokens = refresh_access_token(
+                self._tokens.get("client_id"),
+                self._tokens.get("client_id_secret"),
+                self._tokens.get("refresh_token"),
+                self.credentials_key
+            )
+
+            if not refreshed_tokens:
+                logger.error("Failed to refresh bearer tokens")
+                self._next_attempt_at = time.time() + self.retry_interval
+                return False
+
+            self._tokens.update(refreshed_tokens)
+            logger.info("Bearer tokens refreshed successfully")
+            return True
+
+    def get_clients(self):
+        """
+        Return the current (client, api) pair, refreshing the token first if it is due.
+
+        The same instances are returned to every caller; a refreshed bearer token
+        is rotated into them in place by the shared client registry.
+        """
+        if self.needs_refresh():
+            self.refresh()
+
+        from twitter_poster import get_twitter_clients, load_config
+        from rate_limiter import get_rate_limiter
+        return get_twitter_clients(load_config(self.credentials_key), get_rate_limiter(self.credentials_key))
+
+    def next_check_in(self, check_interval=30 * 60):
+        """Return how long to wait before checking again: until shortly before expiry, at most check_interval."""
+        time_left = self.seconds_left()
+        if time_left is None:
+            return self.retry_interval
+        return max(self.retry_interval, min(check_interval, time_left - self.refresh_margin))
+
+    def run_refresh_loop(self, check_interval=30 * 60):
+        """
+        Refresh the token proactively, shortly before it expires.
+
+        Sleeps until refresh_margin seconds before expiry (or check_interval,
+        whichever comes first), so worker threads never have to refresh inline.
+        """
+        logger.info("Starting proactive token refresh loop")
+        while True:
+            try:
+                self.refresh()
+                sleep_time = self.next_check_in(check_interval)
+                logger.info(f"Token manager sleeping for {sleep_time / 60:.1f} minutes")
+                time.sleep(sleep_time)
+            except Exception as e:
+                logger.error(f"Error in token refresh loop: {e}")
+                time.sleep(self.retry_interval)
+
+def run_refresh_loops(managers, check_interval=30 * 60):
+    """
+    Refresh the tokens of several accounts from a single thread.
+
+    Refreshes every manager that is due and sleeps until the first of them
+    needs attention again.
+    """
+    logger.info(f"Starting proactive token refresh loop for {len(managers)} accounts")
+    while True:
+        sleep_time = check_interval
+        for manager in managers:
+            try:
+                manager.refresh()
+                sleep_time = min(sleep_time, manager.next_check_in(check_interval))
+            except Exception as e:
+                logger.error(f"Error refreshing tokens for {manager.credentials_key}: {e}")
+                sleep_time = min(sleep_time, manager.retry_interval)
+        logger.info(f"Token managers sleeping for {sleep_time / 60:.1f} minutes")
+        time.sleep(sleep_time)
+
+# Process-wide token managers, one per account
+_token_managers = {}
+_token_managers_lock = threading.Lock()
+
+def get_token_manager(credentials_key=DEFAULT_CREDENTIALS_KEY):
+    """Get the shared token manager for an account's credentials, creating it on first use."""
+    with _token_managers_lock:
+        manager = _token_managers.get(credentials_key)
+        if manager is None:
+            manager = TokenManager(credentials_key=credentials_key)
+            _token_managers[credentials_key] = manager
+        return manager
+
+def check_token_expiry():
+    """Check if the access token is expired or about to expire."""
+    return get_token_manager().needs_refresh()
+
 def main():
     """Main function to check and refresh tokens if needed."""
     import argparse
@@ -154,19 +308,8 @@ def main():
         needs_refresh = check_token_expiry()
     
     if needs_refresh:
-        # Load tokens to get credentials
-        tokens = load_tokens()
-        
-        if not tokens:
-            logger.error("No tokens found, cannot refresh")
-            return
-        
         # Refresh the token
-        refresh_access_token(
-            tokens.get("client_id"),
-            tokens.get("client_id_secret"),
-            tokens.get("refresh_token")
-        )
+        get_token_manager().refresh(force=True)
     else:
         logger.info("Token is still valid, no refresh needed")
 
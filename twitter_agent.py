@@ -1,9 +1,13 @@
+import time
+
+# Startup is measured from here, so module imports count toward each mode's budget
+STARTUP_STARTED = time.perf_counter()
+
 import logging
 import threading
-import time
 import argparse
 import os
-from twitter_poster import post_random_tweet
+from twitter_poster import post_buffered_tweet
 from twitter_monitor import (
     load_config, 
     initialize_twitter_client, 
@@ -13,10 +17,15 @@ from twitter_monitor import (
     monitor_mentions,
     monitor_hashtags,
     monitor_keywords,
-    reply_worker,
+    create_monitor_threads,
+    create_reply_workers,
+    configure_rate_limits,
     test_reply_queue
 )
-from token_refresher import load_tokens, save_tokens, refresh_access_token, check_token_expiry
+from config_cache import install_reload_signal_handler
+from content_buffer import create_content_producer
+from batch_generation import create_batch_worker, batch_replies_enabled, batch_tweets_enabled
+from accounts import get_accounts, get_default_account, get_account_credentials, create_token_refresh_thread
 
 # Set up logging with UTF-8 encoding
 logging.basicConfig(
@@ -29,35 +38,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger("twitter_agent")
 
-def check_and_refresh_tokens():
-    """Check if bearer tokens need refreshing and refresh them if needed."""
-    logger.info("Checking if bearer tokens need refreshing")
+# Startup time budget per mode, in seconds: imports, argument parsing and local
+# setup, up to the first network request
+STARTUP_BUDGETS = {
+    "refresh-tokens": 1.0,
+    "post-now": 1.5,
+    "scheduler-only": 1.5,
+    "monitor-only": 2.0,
+    "workers-only": 2.0,
+    "full": 2.0
+}
+
+def check_startup_budget(mode):
+    """Log how long startup took for a mode and warn if it went over the mode's budget."""
+    elapsed = time.perf_counter() - STARTUP_STARTED
+    budget = STARTUP_BUDGETS.get(mode)
+    if budget is not None and elapsed > budget:
+        logger.warning(f"Startup for '{mode}' took {elapsed * 1000:.0f} ms, over its {budget * 1000:.0f} ms budget")
+    else:
+        logger.info(f"Startup for '{mode}' took {elapsed * 1000:.0f} ms")
+    return elapsed
+
+def check_and_refresh_tokens(force=False, account=None):
+    """Check if an account's bearer tokens (the default account's unless given) need refreshing and refresh them if needed."""
+    account = account or get_default_account()
+    return refresh_account_tokens(account.name, account.token_manager, force)
+
+def refresh_account_tokens(name, token_manager, force=False):
+    """Refresh an account's bearer tokens through its token manager if they need it."""
+    logger.info(f"Checking if bearer tokens of account {name} need refreshing")
     
     try:
-        # Check if tokens need refreshing
-        if check_token_expiry():
+        # The token manager keeps the expiry in memory and refreshes single-flight
+        if force or token_manager.needs_refresh():
             logger.info("Bearer tokens need refreshing")
-            
-            # Load tokens to get credentials
-            tokens = load_tokens()
-            
-            if not tokens:
-                logger.error("No tokens found, cannot refresh")
-                return False
-            
-            # Refresh the bearer tokens
-            refreshed_tokens = refresh_access_token(
-                tokens.get("client_id"),
-                tokens.get("client_id_secret"),
-                tokens.get("refresh_token")
-            )
-            
-            if refreshed_tokens:
-                logger.info("Bearer tokens refreshed successfully")
-                return True
-            else:
-                logger.error("Failed to refresh bearer tokens")
-                return False
+            return token_manager.refresh(force=force)
         else:
             logger.info("Bearer tokens are still valid, no refresh needed")
             return False
@@ -67,15 +82,12 @@ def check_and_refresh_tokens():
         return False
 
 def get_refreshed_clients():
-    """Get fresh API clients, refreshing bearer tokens if necessary."""
+    """Get the default account's shared API clients, refreshing bearer tokens if necessary."""
     # Check and refresh bearer tokens if needed
     tokens_refreshed = check_and_refresh_tokens()
     
-    # Load credentials
-    credentials = load_config()
-    
-    # Initialize clients with fresh bearer tokens
-    client, api = initialize_twitter_client(credentials)
+    # Reuse the current clients; they are only rebuilt after a refresh
+    client, api = get_default_account().get_clients()
     
     return client, api, tokens_refreshed
 
@@ -88,9 +100,9 @@ def run_tweet_scheduler(client, api, interval_hours=8):
             # Check if tokens need refreshing
             client, api, tokens_refreshed = get_refreshed_clients()
             
-            # Post a random tweet
-            logger.info("Posting a random tweet...")
-            post_random_tweet()
+            # Post the next pre-generated tweet with the shared clients
+            logger.info("Posting a buffered tweet...")
+            post_buffered_tweet(client=client, api=api)
             logger.info("Tweet posted successfully")
             
             # Sleep for the specified interval
@@ -105,82 +117,43 @@ def run_tweet_scheduler(client, api, interval_hours=8):
             time.sleep(15 * 60)
 
 def token_refresh_monitor():
-    """Thread to periodically check and refresh tokens."""
+    """Thread to refresh the default account's tokens proactively, shortly before they expire."""
     logger.info("Starting token refresh monitor thread")
-    
-    while True:
-        try:
-            # Check and refresh tokens if needed
-            check_and_refresh_tokens()
-            
-            # Sleep for 30 minutes before checking again
-            logger.info("Token monitor sleeping for 30 minutes")
-            time.sleep(30 * 60)
-            
-        except Exception as e:
-            logger.error(f"Error in token refresh monitor: {e}")
-            time.sleep(5 * 60)  # Sleep for 5 minutes before retrying
+    get_default_account().token_manager.run_refresh_loop(check_interval=30 * 60)
+
+def start_monitoring_system(include_scheduler=True, test_mode=False, scheduler_interval=8, stream=False, replay_file=None):
+    """
+    Start the Twitter monitoring and posting system.
 
-def start_monitoring_system(include_scheduler=True, test_mode=False, scheduler_interval=8):
-    """Start the Twitter monitoring and posting system."""
+    With stream, hashtag and keyword hits come from the filtered stream (or
+    from a recorded stream in replay_file) instead of search polling.
+    """
     logger.info("Starting Twitter agent system")
     
     # Get fresh clients
     client, api, _ = get_refreshed_clients()
-    
-    # Load previously processed tweets
-    load_processed_tweets()
-    
-    # Get the user ID for monitoring mentions
-    user_id = get_user_id(client)
-    logger.info(f"Starting monitoring for user ID: {user_id}")
+    accounts = get_accounts()
     
     # Start the monitoring threads
     threads = []
     
-    # Thread for token refresh monitoring
-    token_thread = threading.Thread(
-        target=token_refresh_monitor,
-        daemon=True,
-        name="TokenRefreshMonitor"
-    )
-    threads.append(token_thread)
-    
-    # Thread for monitoring mentions
-    mentions_thread = threading.Thread(
-        target=monitor_mentions,
-        args=(client, api, user_id),
-        daemon=True,
-        name="MentionsMonitor"
-    )
-    threads.append(mentions_thread)
+    # Thread for token refresh monitoring, covering every account
+    threads.append(create_token_refresh_thread(accounts))
     
-    # Thread for monitoring hashtags
-    hashtags_thread = threading.Thread(
-        target=monitor_hashtags,
-        args=(client, api),
-        daemon=True,
-        name="HashtagsMonitor"
-    )
-    threads.append(hashtags_thread)
+    # Threads for monitoring mentions, hashtags and keywords of each account
+    for account in accounts:
+        # Load previously processed tweets
+        load_processed_tweets(account)
+        threads.extend(create_monitor_threads(account, streaming=stream))
     
-    # Thread for monitoring keywords
-    keywords_thread = threading.Thread(
-        target=monitor_keywords,
-        args=(client, api),
-        daemon=True,
-        name="KeywordsMonitor"
-    )
-    threads.append(keywords_thread)
+    # Threads for the filtered stream, replacing hashtag and keyword polling
+    if stream:
+        # Imported here so polling mode doesn't load the streaming client
+        from stream_ingest import create_stream_threads
+        threads.extend(create_stream_threads(accounts, replay_file=replay_file))
     
-    # Thread for processing replies
-    reply_thread = threading.Thread(
-        target=reply_worker,
-        args=(client, api),
-        daemon=True,
-        name="ReplyWorker"
-    )
-    threads.append(reply_thread)
+    # Pool of threads for processing the replies of every account
+    threads.extend(create_reply_workers(client, api, accounts=accounts))
     
     # Thread for posting scheduled tweets (optional)
     if include_scheduler:
@@ -191,6 +164,15 @@ def start_monitoring_system(include_scheduler=True, test_mode=False, scheduler_i
             name="TweetScheduler"
         )
         threads.append(scheduler_thread)
+        
+        # Thread for keeping ready-to-post tweets in the content buffer
+        if not batch_tweets_enabled():
+            threads.append(create_content_producer())
+    
+    # Thread for submitting and polling OpenAI batches (optional)
+    batch_tweets = include_scheduler and batch_tweets_enabled()
+    if batch_replies_enabled() or batch_tweets:
+        threads.append(create_batch_worker(get_default_account().reply_queue, include_tweets=batch_tweets))
     
     # Start all threads
     for thread in threads:
@@ -213,35 +195,74 @@ def start_monitoring_system(include_scheduler=True, test_mode=False, scheduler_i
         # Save processed tweets before exiting
         save_processed_tweets()
 
+def start_reply_workers():
+    """
+    Run only the reply workers and the token refresher.
+
+    Meant for extra nodes sharing a Redis or SQLite reply queue: they take
+    replies off the shared backlog that the monitoring nodes fill.
+    """
+    logger.info("Starting reply workers only")
+    client, api, _ = get_refreshed_clients()
+    accounts = get_accounts()
+    
+    threads = [create_token_refresh_thread(accounts)]
+    threads.extend(create_reply_workers(client, api, accounts=accounts))
+    for thread in threads:
+        thread.start()
+        logger.info(f"Started thread: {thread.name}")
+    
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+
 def main():
     """Parse command line arguments and start the system."""
     parser = argparse.ArgumentParser(description="Twitter AI Agent")
     parser.add_argument("--monitor-only", action="store_true", help="Run only the monitoring system without tweet scheduler")
     parser.add_argument("--scheduler-only", action="store_true", help="Run only the tweet scheduler")
+    parser.add_argument("--workers-only", action="store_true", help="Run only reply workers on the shared reply queue")
     parser.add_argument("--post-now", action="store_true", help="Post a tweet immediately and exit")
     parser.add_argument("--test", action="store_true", help="Run in test mode (adds a test tweet to the reply queue)")
     parser.add_argument("--interval", type=int, default=8, help="Hours between scheduled tweets (default: 8)")
     parser.add_argument("--refresh-tokens", action="store_true", help="Force refresh of tokens and exit")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run monitors, reply workers and the scheduler as asyncio tasks in one event loop")
+    parser.add_argument("--stream", action="store_true", help="Receive hashtag and keyword matches from the filtered stream instead of polling search")
+    parser.add_argument("--replay-stream", metavar="FILE", help="Feed a recorded filtered stream to the monitors instead of connecting (implies --stream)")
     
     args = parser.parse_args()
+    stream = args.stream or bool(args.replay_stream)
+    if stream and args.use_async:
+        parser.error("--stream and --replay-stream are not supported with --async")
+    
+    # Reload cached configuration files on SIGHUP
+    install_reload_signal_handler()
     
     if args.refresh_tokens:
         # Just refresh tokens and exit
         logger.info("Forcing token refresh and exiting")
-        check_and_refresh_tokens()
+        check_startup_budget("refresh-tokens")
+        # Only the token managers are needed; building the accounts would open their queues and stores
+        from token_refresher import get_token_manager
+        for name, credentials_key in get_account_credentials():
+            refresh_account_tokens(name, get_token_manager(credentials_key))
         return
     
     if args.post_now:
         # Just post a single tweet and exit
         logger.info("Posting a single tweet and exiting")
+        check_startup_budget("post-now")
         # Refresh tokens if needed
         client, api, _ = get_refreshed_clients()
-        post_random_tweet()
+        post_buffered_tweet(client=client, api=api)
         return
     
     if args.scheduler_only:
         # Run only the tweet scheduler
         logger.info("Running tweet scheduler only")
+        check_startup_budget("scheduler-only")
         # Refresh tokens if needed
         client, api, _ = get_refreshed_clients()
         
@@ -253,6 +274,12 @@ def main():
         )
         token_thread.start()
         
+        # Fill the content buffer in advance, through batches if enabled
+        if batch_tweets_enabled():
+            create_batch_worker(None).start()
+        else:
+            create_content_producer().start()
+        
         scheduler_thread = threading.Thread(
             target=run_tweet_scheduler,
             args=(client, api, args.interval),
@@ -265,12 +292,33 @@ def main():
             logger.info("Shutting down...")
         return
     
+    if args.workers_only:
+        # Extra node consuming a shared reply queue
+        check_startup_budget("workers-only")
+        start_reply_workers()
+        return
+    
     # Run the full system or monitoring-only
     include_scheduler = not args.monitor_only
+    check_startup_budget("full" if include_scheduler else "monitor-only")
+    
+    if args.use_async:
+        # Imported here so the default threaded mode doesn't need aiohttp
+        import asyncio
+        from async_agent import run_async_agent
+        asyncio.run(run_async_agent(
+            include_scheduler=include_scheduler,
+            test_mode=args.test,
+            scheduler_interval=args.interval
+        ))
+        return
+    
     start_monitoring_system(
         include_scheduler=include_scheduler,
         test_mode=args.test,
-        scheduler_interval=args.interval
+        scheduler_interval=args.interval,
+        stream=stream,
+        replay_file=args.replay_stream
     )
 
 if __name__ == "__main__":
@@ -3,13 +3,18 @@ import json
 import time
 import threading
 import queue
-import random
 import logging
 import os
-from datetime import datetime, timedelta, timezone
+import itertools
+from datetime import datetime, timezone
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from ai_utils import generate_reply
+from ai_utils import generate_reply, FALLBACK_REPLY
 from twitter_poster import load_config, initialize_twitter_client
+from rate_limiter import get_client_rate_limiter
+from config_cache import current_generation
+from accounts import get_accounts, get_default_account, create_token_refresh_thread
+from batch_generation import get_batch_generator, batch_replies_enabled, create_batch_worker
+from query_planner import get_query_planner, seed_high_water_mark
 
 # Set up logging with UTF-8 encoding
 logging.basicConfig(
@@ -22,224 +27,519 @@ logging.basicConfig(
 )
 logger = logging.getLogger("twitter_monitor")
 
-# Queue for storing tweets to reply to
-reply_queue = queue.Queue()
+# Per-account state that used to be module globals; each account has its own
+# reply queue, rate limiter and high-water marks (see accounts.Account)
+_DEFAULT_ACCOUNT_ATTRIBUTES = ("reply_queue", "rate_limiter", "high_water_marks")
 
-# Keep track of tweets we've already processed
-processed_tweets = set()
+def __getattr__(name):
+    """Keep the old module attributes working; they resolve to the default account's state on access."""
+    if name in _DEFAULT_ACCOUNT_ATTRIBUTES:
+        return getattr(get_default_account(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Rate limiting variables
-last_api_call = 0
-min_time_between_calls = 2  # seconds between API calls
+# Rotates which account's queue the shared reply workers check first
+_reply_rotation = itertools.count()
+
+# Authenticated user IDs, cached per access token
+_user_ids = {}
+_user_ids_lock = threading.Lock()
+
+# Limits how many replies are generated with OpenAI at the same time
+generation_slots = threading.BoundedSemaphore(4)
 
 # Define retry decorator for Twitter API calls
-# This will retry on rate limit errors with exponential backoff
+# This will retry on rate limit errors with exponential backoff, then re-raise
+# the last TooManyRequests so callers can requeue and pause the endpoint
 twitter_retry = retry(
     retry=retry_if_exception_type(tweepy.errors.TooManyRequests),
     stop=stop_after_attempt(3),
+    reraise=True,
     wait=wait_exponential(multiplier=1, min=4, max=60),
     before_sleep=lambda retry_state: logger.warning(
         f"Rate limit hit, waiting {retry_state.next_action.sleep} seconds before retry {retry_state.attempt_number}"
     )
 )
 
-# File to store processed tweets
-PROCESSED_TWEETS_FILE = "processed_tweets.json"
+def load_processed_tweets(account=None):
+    """
+    Load the process-wide store of an account's processed tweet IDs.
 
-def load_processed_tweets():
-    """Load the list of processed tweet IDs from file."""
-    try:
-        if os.path.exists("processed_tweets.json"):
-            with open("processed_tweets.json", "r", encoding="utf-8") as f:
-                return json.load(f)
-        else:
-            logger.info("No processed tweets file found, creating a new one")
-            return []
-    except Exception as e:
-        logger.error(f"Error loading processed tweets: {e}")
-        return []
+    All monitors of the account share this one instance, so a tweet found by
+    several of them is only claimed (and queued) once.
+    """
+    return (account or get_default_account()).processed_tweets()
 
-def save_processed_tweets(processed_tweets):
-    """Save the list of processed tweet IDs to file."""
-    try:
-        # Keep only the most recent 1000 tweets to avoid the file growing too large
-        if len(processed_tweets) > 1000:
-            processed_tweets = processed_tweets[-1000:]
-        
-        with open("processed_tweets.json", "w", encoding="utf-8") as f:
-            json.dump(processed_tweets, f)
-        logger.debug(f"Saved {len(processed_tweets)} processed tweets")
-    except Exception as e:
-        logger.error(f"Error saving processed tweets: {e}")
+def load_replied_tweets(account=None):
+    """Load the process-wide store of an account's tweets the reply workers have answered."""
+    return (account or get_default_account()).replied_tweets()
 
-def load_monitoring_config():
-    """Load the monitoring configuration from the prompts template file."""
-    try:
-        with open("prompts_template_alex.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("monitoring", {})
-    except Exception as e:
-        logger.error(f"Error loading monitoring config: {e}")
-        return {}
+def save_processed_tweets(processed_tweets=None):
+    """Compact the processed tweets logs (of every account, by default) so they only hold live entries."""
+    stores = [processed_tweets] if processed_tweets is not None else [
+        account.processed_tweets() for account in get_accounts()
+    ]
+    for store in stores:
+        try:
+            store.flush()
+            store.prune()
+            store.compact()
+            logger.debug(f"Saved {len(store)} processed tweets")
+        except Exception as e:
+            logger.error(f"Error saving processed tweets: {e}")
+
+def load_monitoring_config(account=None):
+    """
+    Load the monitoring configuration from an account's prompts template file.
 
-def get_hashtag_query():
+    The file is cached process-wide and only re-parsed when it changes on disk
+    or the process receives SIGHUP, so this is cheap to call on every loop.
+    """
+    return (account or get_default_account()).monitoring_config()
+
+def get_hashtag_query(account=None):
     """Generate a query string for the hashtags to monitor."""
-    monitoring_config = load_monitoring_config()
+    monitoring_config = load_monitoring_config(account)
     hashtags = monitoring_config["hashtags"]
     return " OR ".join(hashtags)
 
-def get_keyword_query():
-    """Get a search query for keywords from a random category."""
-    # Load monitoring configuration
-    config = load_monitoring_config()
-    
-    # Get keyword categories
-    keyword_categories = config.get("keywords", {})
-    if not keyword_categories:
-        logger.warning("No keyword categories found in monitoring config")
-        return "", ""
-    
-    # Instead of using all keywords, select one random category
-    category_name = random.choice(list(keyword_categories.keys()))
-    keywords = keyword_categories[category_name]
-    
-    logger.info(f"Selected keyword category: {category_name} with {len(keywords)} keywords")
-    
-    # Build the query
-    query = " OR ".join([f'"{keyword}"' for keyword in keywords])
-    
-    # Add language filter
-    query += " lang:en"
-    
-    return query, category_name
+def get_current_clients(account=None):
+    """Return an account's clients shared by every thread; its token manager refreshes them centrally."""
+    return (account or get_default_account()).get_clients()
 
-def respect_rate_limit():
-    """Sleep if necessary to respect the rate limit."""
-    global last_api_call
-    current_time = time.time()
-    time_since_last_call = current_time - last_api_call
-    
-    if time_since_last_call < min_time_between_calls:
-        sleep_time = min_time_between_calls - time_since_last_call
-        time.sleep(sleep_time)
+def schedule_reply(tweet_data, account=None):
+    """
+    Queue a tweet for replying.
+
+    When batch replies are enabled, the default account's hashtag and keyword
+    hits are held for the next OpenAI batch and reach the reply queue with
+    their reply already generated. Mentions always go straight to the reply
+    queue, as does everything for the other accounts.
+    """
+    account = account or get_default_account()
+    if account.default and tweet_data.get("source") != "mention" and batch_replies_enabled():
+        get_batch_generator(account.reply_queue).queue_reply(tweet_data)
+    else:
+        account.reply_queue.put(tweet_data)
+
+def respect_rate_limit(endpoint, client=None):
+    """Sleep if necessary to respect the rate limit of the given endpoint for the client's account."""
+    get_client_rate_limiter(client).acquire(endpoint)
+
+def configure_rate_limits(account=None):
+    """Apply the rate limits from an account's monitoring configuration to its limiter."""
+    account = account or get_default_account()
+    rate_limiter = account.rate_limiter
+    config = load_monitoring_config(account)
+    limits = {}
+    for endpoint, limit in config.get("rate_limits", {}).items():
+        limits[endpoint] = (limit["requests"], limit["window_minutes"] * 60)
     
-    last_api_call = time.time()
+    rate_limiter.configure(
+        limits,
+        min_intervals={"create": config.get("min_seconds_between_replies", 5)}
+    )
+    logger.info(f"Rate limit budget: {rate_limiter.format_budget()}")
 
 @twitter_retry
-def safe_get_users_mentions(client, user_id, max_results=10):
+def safe_get_users_mentions(client, user_id, max_results=10, since_id=None, pagination_token=None, until_id=None):
     """Safely get user mentions with retry logic."""
-    respect_rate_limit()
+    respect_rate_limit("mentions", client)
+    kwargs = {}
+    if since_id:
+        kwargs["since_id"] = since_id
+    if until_id:
+        kwargs["until_id"] = until_id
+    if pagination_token:
+        kwargs["pagination_token"] = pagination_token
     return client.get_users_mentions(
         id=user_id,
         max_results=max_results,
-        tweet_fields=["author_id", "created_at", "conversation_id"]
+        tweet_fields=["author_id", "created_at", "conversation_id", "referenced_tweets"],
+        # Include the tweets being replied to, so replies to us are found without extra lookups
+        expansions=["referenced_tweets.id", "referenced_tweets.id.author_id"],
+        **kwargs
     )
 
 @twitter_retry
 def safe_get_tweet(client, tweet_id):
     """Safely get a tweet with retry logic."""
-    respect_rate_limit()
+    respect_rate_limit("tweet_lookup", client)
     return client.get_tweet(tweet_id, tweet_fields=["author_id", "created_at", "conversation_id"])
 
 @twitter_retry
-def safe_search_recent_tweets(client, query, max_results=20):
+def safe_get_tweets(client, tweet_ids):
+    """Safely get up to 100 tweets in a single request with retry logic."""
+    respect_rate_limit("tweet_lookup", client)
+    return client.get_tweets(ids=tweet_ids, tweet_fields=["author_id", "created_at", "conversation_id"])
+
+@twitter_retry
+def safe_search_recent_tweets(client, query, max_results=20, since_id=None, next_token=None, until_id=None):
     """Safely search for recent tweets with retry logic."""
-    respect_rate_limit()
+    respect_rate_limit("search", client)
+    kwargs = {}
+    if since_id:
+        kwargs["since_id"] = since_id
+    if until_id:
+        kwargs["until_id"] = until_id
+    if next_token:
+        kwargs["next_token"] = next_token
     return client.search_recent_tweets(
         query=query,
         max_results=max_results,
-        tweet_fields=["author_id", "created_at", "conversation_id"]
+        tweet_fields=["author_id", "created_at", "conversation_id"],
+        **kwargs
     )
 
 @twitter_retry
 def safe_create_tweet(client, text, in_reply_to_tweet_id=None):
     """Safely create a tweet with retry logic."""
-    respect_rate_limit()
+    respect_rate_limit("create", client)
     return client.create_tweet(text=text, in_reply_to_tweet_id=in_reply_to_tweet_id)
 
 @twitter_retry
 def safe_get_friendship(api, source_id, target_id):
     """Safely get friendship status with retry logic."""
-    respect_rate_limit()
+    respect_rate_limit("friendship", api)
     return api.get_friendship(source_id=source_id, target_id=target_id)
 
-def monitor_mentions(client, api, user_id):
-    """Monitor Twitter for mentions and add them to the reply queue."""
+class TweetPager:
+    """
+    Paging state of one poll of a stream, shared by the sync and async monitors.
+
+    Requests only tweets newer than the stream's high-water mark and follows
+    next_token until it catches up (at most max_pages_per_poll pages). A
+    stream that was never polled only fetches its first page. The pager never
+    calls the API itself; the caller sends each request with its own (sync or
+    async) client, and commits the poll once the tweets are queued:
+
+        pager = TweetPager(stream_key, max_results, account)
+        request = pager.next_request()
+        while request is not None:
+            try:
+                pager.add_page(fetch_page(**request))
+            except tweepy.errors.BadRequest as e:
+                pager.restart(e)
+            request = pager.next_request()
+        tweets, includes = pager.result()
+        ...
+        pager.commit()
+
+    If the page limit cuts a poll short, the tweets between the mark and the
+    oldest one read are left for the next poll (see HighWaterMarks), which
+    pages through them with until_id before the mark moves on.
+
+    Args:
+        stream_key: Key of the stream in the high-water marks
+        max_results: Page size to use when the stream has no high-water mark yet
+        account: Account whose high-water marks are used (default: the default account)
+    """
+
+    def __init__(self, stream_key, max_results, account=None):
+        self.stream_key = stream_key
+        self.max_results = max_results
+        self.account = account or get_default_account()
+        self._start()
+
+    def _start(self):
+        """Start paging from the stream's current high-water mark, or through its unread gap."""
+        high_water_marks = self.account.high_water_marks
+        self.since_id = high_water_marks.get(self.stream_key)
+        gap = high_water_marks.get_gap(self.stream_key) if self.since_id else None
+        self.until_id, self.gap_newest_id = gap or (None, None)
+        self.max_pages = load_monitoring_config(self.account).get("max_pages_per_poll", 5) if self.since_id else 1
+        # With since_id only new tweets come back, so full pages cost no extra reads
+        self.page_size = 100 if self.since_id else self.max_results
+        self.tweets = []
+        self.includes = {}
+        self.newest_id = None
+        self.oldest_id = None
+        self.page_token = None
+        self.pages = 0
+        self.truncated = False
+        self.done = False
+
+    def next_request(self):
+        """Return the keyword arguments (max_results, since_id, until_id, page_token) of the next page, or None when done."""
+        if self.done:
+            return None
+        if self.pages >= self.max_pages:
+            if self.page_token and self.since_id:
+                logger.warning(f"Stopped paging '{self.stream_key}' after {self.max_pages} pages, reading older new tweets on the next poll")
+                self.truncated = True
+            self.done = True
+            return None
+        return {
+            "max_results": self.page_size,
+            "since_id": self.since_id,
+            "until_id": self.until_id,
+            "page_token": self.page_token
+        }
+
+    def add_page(self, response):
+        """Collect the tweets and includes of a page and note where the next one starts."""
+        self.pages += 1
+        if response.data:
+            self.tweets.extend(response.data)
+        for key, values in (response.includes or {}).items():
+            self.includes.setdefault(key, []).extend(values)
+        
+        meta = response.meta or {}
+        if self.newest_id is None:
+            self.newest_id = meta.get("newest_id")
+        if response.data:
+            self.oldest_id = meta.get("oldest_id") or min((tweet.id for tweet in response.data), key=int)
+        self.page_token = meta.get("next_token")
+        if not self.page_token:
+            self.done = True
+
+    def restart(self, error):
+        """
+        Start over from the latest tweets after the API rejected the high-water mark.
+
+        since_id can fall outside the searchable window after a long pause.
+        Any other bad request (or one without since_id) is re-raised.
+        """
+        if not self.since_id:
+            raise error
+        logger.warning(f"High-water mark for '{self.stream_key}' rejected, starting from the latest tweets: {error}")
+        self.account.high_water_marks.reset(self.stream_key)
+        self._start()
+
+    def result(self):
+        """
+        Return what the poll fetched.
+
+        Returns:
+            Tuple of (list of tweets, dict of includes merged across pages)
+        """
+        return self.tweets, self.includes
+
+    def commit(self):
+        """
+        Record the poll in the high-water marks, once its tweets have been queued.
+
+        Until then a crash or an error while queueing leaves the mark where it
+        was, so the next poll fetches the same tweets again.
+        """
+        high_water_marks = self.account.high_water_marks
+        if self.truncated:
+            # The tweets between the mark and the oldest one read are still unread
+            high_water_marks.set_gap(self.stream_key, self.oldest_id, self.gap_newest_id or self.newest_id)
+        elif self.until_id:
+            high_water_marks.close_gap(self.stream_key)
+        elif self.newest_id:
+            high_water_marks.update(self.stream_key, self.newest_id)
+
+def fetch_new_tweets(fetch_page, stream_key, max_results, account=None):
+    """
+    Fetch the tweets posted on a stream since it was last polled (see TweetPager).
+
+    The high-water mark is not moved yet: call commit() on the returned pager
+    once the tweets have been queued.
+
+    Args:
+        fetch_page: Callable taking max_results, since_id, until_id and page_token keyword arguments
+        stream_key: Key of the stream in the high-water marks
+        max_results: Page size to use when the stream has no high-water mark yet
+        account: Account whose high-water marks are used (default: the default account)
+    
+    Returns:
+        Tuple of (list of tweets, dict of includes merged across pages, TweetPager to commit)
+    """
+    pager = TweetPager(stream_key, max_results, account)
+    request = pager.next_request()
+    while request is not None:
+        try:
+            pager.add_page(fetch_page(**request))
+        except tweepy.errors.BadRequest as e:
+            pager.restart(e)
+        request = pager.next_request()
+    tweets, includes = pager.result()
+    return tweets, includes, pager
+
+def get_replied_to_ids(tweet):
+    """Return the IDs of the tweets a tweet is replying to."""
+    return [str(ref.id) for ref in (tweet.referenced_tweets or []) if ref.type == "replied_to"]
+
+def find_missing_parents(mentions, includes):
+    """
+    Start mapping the tweets the mentions reply to onto their authors.
+
+    Returns:
+        Tuple of (dict of parent tweet ID (as a string) -> author ID for the
+        tweets expanded into the mentions response, list of batches of up to
+        100 parent tweet IDs that still have to be looked up)
+    """
+    parent_authors = {str(tweet.id): tweet.author_id for tweet in includes.get("tweets", [])}
+    
+    missing_ids = []
+    for mention in mentions:
+        for parent_id in get_replied_to_ids(mention):
+            if parent_id not in parent_authors and parent_id not in missing_ids:
+                missing_ids.append(parent_id)
+    
+    return parent_authors, [missing_ids[start:start + 100] for start in range(0, len(missing_ids), 100)]
+
+def add_parent_authors(parent_authors, response):
+    """Add the authors of the tweets in a get_tweets response to the parent authors."""
+    for tweet in response.data or []:
+        parent_authors[str(tweet.id)] = tweet.author_id
+
+def get_parent_authors(client, mentions, includes):
+    """
+    Map the IDs of the tweets the mentions reply to onto their authors.
+
+    Uses the tweets expanded into the mentions response and looks up any that
+    are missing in batches of 100 with a single get_tweets call each.
+    
+    Returns:
+        Dictionary of parent tweet ID (as a string) -> author ID
+    """
+    parent_authors, batches = find_missing_parents(mentions, includes)
+    for batch in batches:
+        try:
+            add_parent_authors(parent_authors, safe_get_tweets(client, batch))
+        except Exception as e:
+            logger.warning(f"Error looking up {len(batch)} parent tweets: {e}")
+    
+    return parent_authors
+
+def queue_mentions(mentions, user_id, parent_authors, account=None):
+    """
+    Claim new mentions and add them to the reply queue, flagging replies to our own tweets.
+
+    Returns:
+        Number of mentions queued
+    """
+    account = account or get_default_account()
+    processed_tweets = load_processed_tweets(account)
+    queued = 0
+    
+    for mention in mentions:
+        # Claim the tweet, skipping it if another monitor already has
+        if not processed_tweets.claim(mention.id):
+            logger.debug(f"Skipping already processed mention: {mention.id}")
+            continue
+        
+        # Skip if this is our own tweet
+        if mention.author_id == user_id:
+            logger.debug(f"Skipping our own tweet: {mention.id}")
+            continue
+        
+        # Check if this is a reply to our tweet
+        is_reply_to_us = any(
+            parent_authors.get(parent_id) == user_id
+            for parent_id in get_replied_to_ids(mention)
+        )
+        if is_reply_to_us:
+            logger.info(f"Found reply to our tweet: {mention.id}")
+        
+        # Add to reply queue
+        logger.info(f"Adding mention {mention.id} to reply queue")
+        schedule_reply({
+            "tweet_id": mention.id,
+            "user_id": mention.author_id,
+            "text": mention.text,
+            "created_at": mention.created_at,
+            "delay_minutes": 0,  # No delay for mentions
+            "is_reply_to_us": is_reply_to_us,
+            "source": "mention"
+        }, account)
+        queued += 1
+    
+    logger.info(f"Tracking {len(processed_tweets)} processed tweets")
+    return queued
+
+def queue_search_hits(tweets, user_id, source, delay_minutes, account=None, keyword_query=None):
+    """
+    Claim new hashtag or keyword hits and schedule replies to them after a delay.
+
+    Args:
+        tweets: Tweets found by the search
+        user_id: Our own user ID, whose tweets are skipped
+        source: "hashtag" or "keyword"
+        delay_minutes: Minutes to wait before replying
+        account: Account whose reply queue is used (default: the default account)
+        keyword_query: KeywordQuery the tweets were found with, to route each hit to its category
+    
+    Returns:
+        Number of tweets queued
+    """
+    account = account or get_default_account()
+    processed_tweets = load_processed_tweets(account)
+    queued = 0
+    
+    for tweet in tweets:
+        # Claim the tweet, skipping it if another monitor already has
+        if not processed_tweets.claim(tweet.id):
+            logger.debug(f"Skipping already processed tweet: {tweet.id}")
+            continue
+        
+        # Skip if this is our own tweet
+        if tweet.author_id == user_id:
+            logger.debug(f"Skipping our own tweet: {tweet.id}")
+            continue
+        
+        tweet_data = {
+            "tweet_id": tweet.id,
+            "user_id": tweet.author_id,
+            "text": tweet.text,
+            "created_at": tweet.created_at,
+            "delay_minutes": delay_minutes,
+            "is_reply_to_us": False,
+            "source": source
+        }
+        if keyword_query is not None:
+            # Route the hit back to the category its text matched
+            tweet_data["category"] = keyword_query.route(tweet.text)
+            logger.info(f"Adding tweet {tweet.id} ({tweet_data['category']}) to reply queue with {delay_minutes} minute delay")
+        else:
+            logger.info(f"Adding tweet {tweet.id} to reply queue with {delay_minutes} minute delay")
+        schedule_reply(tweet_data, account)
+        queued += 1
+    
+    logger.info(f"Tracking {len(processed_tweets)} processed tweets")
+    return queued
+
+def monitor_mentions(client, api, user_id, account=None):
+    """Monitor Twitter for mentions of an account and add them to its reply queue."""
     logger.info("Starting mentions monitoring thread")
+    account = account or get_default_account()
     
     # Load processed tweets
-    processed_tweets = load_processed_tweets()
+    load_processed_tweets(account)
     
     while True:
         try:
-            # Check for token refresh
-            from token_refresher import check_token_expiry
-            if check_token_expiry():
-                logger.info("Token expired during mentions monitoring, refreshing...")
-                from twitter_agent import get_refreshed_clients
-                client, api, _ = get_refreshed_clients()
-                logger.info("Clients refreshed in mentions monitoring")
+            # Use the current clients; the token manager refreshes them centrally
+            client, api = get_current_clients(account)
             
             # Get mentions
             logger.info("Checking for new mentions")
-            mentions = safe_get_users_mentions(client, user_id, max_results=10)
+            mentions, includes, pager = fetch_new_tweets(
+                lambda max_results, since_id, until_id, page_token: safe_get_users_mentions(
+                    client, user_id, max_results=max_results, since_id=since_id, until_id=until_id,
+                    pagination_token=page_token
+                ),
+                f"mentions:{user_id}",
+                max_results=10,
+                account=account
+            )
             
-            if mentions and mentions.data:
-                logger.info(f"Found {len(mentions.data)} mentions")
+            if mentions:
+                logger.info(f"Found {len(mentions)} mentions")
                 
-                # Process each mention
-                for mention in mentions.data:
-                    # Skip if we've already processed this tweet
-                    if mention.id in processed_tweets:
-                        logger.debug(f"Skipping already processed mention: {mention.id}")
-                        continue
-                    
-                    # Skip if this is our own tweet
-                    if mention.author_id == user_id:
-                        logger.debug(f"Skipping our own tweet: {mention.id}")
-                        processed_tweets.append(mention.id)
-                        continue
-                    
-                    # Get the full tweet to check if it's a reply to our tweet
-                    try:
-                        tweet = safe_get_tweet(client, mention.id)
-                        is_reply_to_us = False
-                        
-                        # Check if this is a reply to our tweet
-                        if tweet.data.referenced_tweets:
-                            for ref_tweet in tweet.data.referenced_tweets:
-                                if ref_tweet.type == "replied_to":
-                                    # Get the tweet being replied to
-                                    parent_tweet = safe_get_tweet(client, ref_tweet.id)
-                                    if parent_tweet.data.author_id == user_id:
-                                        logger.info(f"Found reply to our tweet: {mention.id}")
-                                        is_reply_to_us = True
-                        
-                        # Add to reply queue
-                        logger.info(f"Adding mention {mention.id} to reply queue")
-                        reply_queue.put({
-                            "tweet_id": mention.id,
-                            "user_id": mention.author_id,
-                            "text": mention.text,
-                            "created_at": mention.created_at,
-                            "delay_minutes": 0,  # No delay for mentions
-                            "is_reply_to_us": is_reply_to_us
-                        })
-                        
-                        # Mark as processed
-                        processed_tweets.append(mention.id)
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing mention {mention.id}: {e}")
-                
-                # Save processed tweets
-                save_processed_tweets(processed_tweets)
-                logger.info(f"Saved {len(processed_tweets)} processed tweets")
+                # Resolve who wrote the tweets being replied to, in one round trip
+                parent_authors = get_parent_authors(client, mentions, includes)
+                queue_mentions(mentions, user_id, parent_authors, account)
             else:
                 logger.info("No new mentions found")
             
+            # Only now that the mentions are queued may the next poll skip them
+            pager.commit()
+            
             # Sleep before checking again
-            sleep_time = load_monitoring_config().get("check_interval_minutes", 30) * 60
+            sleep_time = load_monitoring_config(account).get("check_interval_minutes", 30) * 60
             logger.info(f"Sleeping for {sleep_time/60} minutes before checking mentions again")
             time.sleep(sleep_time)
             
@@ -250,73 +550,48 @@ def monitor_mentions(client, api, user_id):
             logger.error(f"Error in mentions monitoring: {e}")
             time.sleep(60)  # Wait 1 minute before retrying
 
-def monitor_hashtags(client, api):
-    """Monitor Twitter for tweets with specific hashtags and add them to the reply queue."""
+def monitor_hashtags(client, api, account=None):
+    """Monitor Twitter for tweets with an account's hashtags and add them to its reply queue."""
     logger.info("Starting hashtags monitoring thread")
+    account = account or get_default_account()
     
     # Load processed tweets
-    processed_tweets = load_processed_tweets()
-    
-    # Get monitoring configuration
-    config = load_monitoring_config()
-    delay_minutes = config.get("reply_delay_minutes", 60)
+    load_processed_tweets(account)
     
     while True:
         try:
-            # Check for token refresh
-            from token_refresher import check_token_expiry
-            if check_token_expiry():
-                logger.info("Token expired during hashtags monitoring, refreshing...")
-                from twitter_agent import get_refreshed_clients
-                client, api, _ = get_refreshed_clients()
-                logger.info("Clients refreshed in hashtags monitoring")
+            # Use the current clients; the token manager refreshes them centrally
+            client, api = get_current_clients(account)
+            
+            # Get monitoring configuration (cached, picks up edits to the file)
+            config = load_monitoring_config(account)
+            delay_minutes = config.get("reply_delay_minutes", 60)
             
             # Get the hashtag query
-            query = get_hashtag_query()
+            query = get_hashtag_query(account)
             logger.info(f"Searching for tweets with hashtags: {query}")
             
             # Search for tweets
-            tweets = safe_search_recent_tweets(client, query, max_results=20)
+            tweets, _, pager = fetch_new_tweets(
+                lambda max_results, since_id, until_id, page_token: safe_search_recent_tweets(
+                    client, query, max_results=max_results, since_id=since_id, until_id=until_id,
+                    next_token=page_token
+                ),
+                "hashtags",
+                max_results=20,
+                account=account
+            )
             
-            if tweets and tweets.data:
-                logger.info(f"Found {len(tweets.data)} tweets with hashtags")
-                
-                # Get our user ID
-                our_user_id = get_user_id(client)
+            if tweets:
+                logger.info(f"Found {len(tweets)} tweets with hashtags")
                 
-                # Process each tweet
-                for tweet in tweets.data:
-                    # Skip if we've already processed this tweet
-                    if tweet.id in processed_tweets:
-                        logger.debug(f"Skipping already processed tweet: {tweet.id}")
-                        continue
-                    
-                    # Skip if this is our own tweet
-                    if tweet.author_id == our_user_id:
-                        logger.debug(f"Skipping our own tweet: {tweet.id}")
-                        processed_tweets.append(tweet.id)
-                        continue
-                    
-                    # Add to reply queue with delay
-                    logger.info(f"Adding tweet {tweet.id} to reply queue with {delay_minutes} minute delay")
-                    reply_queue.put({
-                        "tweet_id": tweet.id,
-                        "user_id": tweet.author_id,
-                        "text": tweet.text,
-                        "created_at": tweet.created_at,
-                        "delay_minutes": delay_minutes,
-                        "is_reply_to_us": False
-                    })
-                    
-                    # Mark as processed
-                    processed_tweets.append(tweet.id)
-                
-                # Save processed tweets
-                save_processed_tweets(processed_tweets)
-                logger.info(f"Saved {len(processed_tweets)} processed tweets")
+                queue_search_hits(tweets, get_user_id(client), "hashtag", delay_minutes, account)
             else:
                 logger.info("No new tweets with hashtags found")
             
+            # Only now that the tweets are queued may the next poll skip them
+            pager.commit()
+            
             # Sleep before checking again
             sleep_time = config.get("check_interval_minutes", 30) * 60
             logger.info(f"Sleeping for {sleep_time/60} minutes before checking hashtags again")
@@ -329,83 +604,61 @@ def monitor_hashtags(client, api):
             logger.error(f"Error in hashtags monitoring: {e}")
             time.sleep(60)  # Wait 1 minute before retrying
 
-def monitor_keywords(client, api):
-    """Monitor Twitter for tweets with specific keywords and add them to the reply queue."""
+def monitor_keywords(client, api, account=None):
+    """
+    Monitor Twitter for tweets with an account's keywords and add them to its reply queue.
+
+    The keywords of all categories are packed into as few search queries as
+    the query length limit allows (see query_planner), and each hit is routed
+    back to its category by matching the keywords locally.
+    """
     logger.info("Starting keywords monitoring thread")
+    account = account or get_default_account()
     
     # Load processed tweets
-    processed_tweets = load_processed_tweets()
-    
-    # Get monitoring configuration
-    config = load_monitoring_config()
-    delay_minutes = config.get("reply_delay_minutes", 60)
+    load_processed_tweets(account)
     
-    # Track used categories to rotate through them
-    used_categories = []
+    # Plans which packed keyword queries run on each poll
+    planner = get_query_planner(account.name, load_monitoring_config(account))
     
     while True:
         try:
-            # Check for token refresh
-            from token_refresher import check_token_expiry
-            if check_token_expiry():
-                logger.info("Token expired during keywords monitoring, refreshing...")
-                from twitter_agent import get_refreshed_clients
-                client, api, _ = get_refreshed_clients()
-                logger.info("Clients refreshed in keywords monitoring")
+            # Use the current clients; the token manager refreshes them centrally
+            client, api = get_current_clients(account)
             
-            # Get the keyword query
-            query, category = get_keyword_query()
+            # Get monitoring configuration (cached, picks up edits to the file)
+            config = load_monitoring_config(account)
+            delay_minutes = config.get("reply_delay_minutes", 60)
             
-            # Track used categories
-            if category not in used_categories:
-                used_categories.append(category)
-                # If we've used all categories, reset the list
-                if len(used_categories) >= len(config["keywords"]):
-                    used_categories = [category]
+            queries = planner.next_queries(config.get("keywords", {}))
+            if not queries:
+                logger.warning("No keyword categories found in monitoring config")
             
-            logger.info(f"Searching for tweets with keywords from category '{category}': {query}")
-            
-            # Search for tweets
-            tweets = safe_search_recent_tweets(client, query, max_results=20)
-            
-            if tweets and tweets.data:
-                logger.info(f"Found {len(tweets.data)} tweets with keywords")
+            for keyword_query in queries:
+                # Start a new query where its categories' searches left off
+                seed_high_water_mark(account.high_water_marks, keyword_query)
+                logger.info(f"Searching for tweets with keywords from categories {', '.join(keyword_query.categories)}: {keyword_query.text}")
                 
-                # Get our user ID
-                our_user_id = get_user_id(client)
+                # Search for tweets
+                tweets, _, pager = fetch_new_tweets(
+                    lambda max_results, since_id, until_id, page_token, query=keyword_query.text: safe_search_recent_tweets(
+                        client, query, max_results=max_results, since_id=since_id, until_id=until_id,
+                        next_token=page_token
+                    ),
+                    keyword_query.stream_key,
+                    max_results=20,
+                    account=account
+                )
+                planner.record(keyword_query, len(tweets))
                 
-                # Process each tweet
-                for tweet in tweets.data:
-                    # Skip if we've already processed this tweet
-                    if tweet.id in processed_tweets:
-                        logger.debug(f"Skipping already processed tweet: {tweet.id}")
-                        continue
-                    
-                    # Skip if this is our own tweet
-                    if tweet.author_id == our_user_id:
-                        logger.debug(f"Skipping our own tweet: {tweet.id}")
-                        processed_tweets.append(tweet.id)
-                        continue
-                    
-                    # Add to reply queue with delay
-                    logger.info(f"Adding tweet {tweet.id} to reply queue with {delay_minutes} minute delay")
-                    reply_queue.put({
-                        "tweet_id": tweet.id,
-                        "user_id": tweet.author_id,
-                        "text": tweet.text,
-                        "created_at": tweet.created_at,
-                        "delay_minutes": delay_minutes,
-                        "is_reply_to_us": False
-                    })
-                    
-                    # Mark as processed
-                    processed_tweets.append(tweet.id)
+                if tweets:
+                    logger.info(f"Found {len(tweets)} tweets with keywords")
+                    queue_search_hits(tweets, get_user_id(client), "keyword", delay_minutes, account, keyword_query)
+                else:
+                    logger.info(f"No new tweets with keywords from categories {', '.join(keyword_query.categories)} found")
                 
-                # Save processed tweets
-                save_processed_tweets(processed_tweets)
-                logger.info(f"Saved {len(processed_tweets)} processed tweets")
-            else:
-                logger.info(f"No new tweets with keywords from category '{category}' found")
+                # Only now that the tweets are queued may the next poll skip them
+                pager.commit()
             
             # Sleep before checking again
             sleep_time = config.get("check_interval_minutes", 30) * 60
@@ -419,50 +672,70 @@ def monitor_keywords(client, api):
             logger.error(f"Error in keywords monitoring: {e}")
             time.sleep(60)  # Wait 1 minute before retrying
 
-def reply_worker(client, api):
-    """Process tweets in the reply queue and post replies."""
+def next_reply(accounts, timeout=60):
+    """
+    Wait for the next tweet that is due on any account's reply queue.
+
+    With a single account this blocks on its queue. With several, the queues
+    are checked in turn from a rotating starting point, so a busy account
+    can't starve the others, sleeping until the earliest item is due (at
+    most a second, so newly queued tweets are picked up promptly).
+    
+    Returns:
+        Tuple of (account, tweet_data)
+    
+    Raises:
+        queue.Empty if nothing became due within the timeout
+    """
+    if len(accounts) == 1:
+        return accounts[0], accounts[0].reply_queue.get(timeout=timeout)
+    
+    deadline = time.monotonic() + timeout
+    while True:
+        start = next(_reply_rotation)
+        for offset in range(len(accounts)):
+            account = accounts[(start + offset) % len(accounts)]
+            try:
+                return account, account.reply_queue.get(block=False)
+            except queue.Empty:
+                pass
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise queue.Empty
+        due_in = [account.reply_queue.next_due_in() for account in accounts]
+        time.sleep(min([remaining, 1.0] + [seconds for seconds in due_in if seconds is not None]))
+
+def reply_worker(client, api, accounts=None):
+    """Process tweets in the reply queues of every account and post replies."""
     logger.info("Starting reply worker thread")
+    accounts = accounts or get_accounts()
     
     while True:
         try:
-            # Check for token refresh
-            from token_refresher import check_token_expiry
-            if check_token_expiry():
-                logger.info("Token expired during reply worker, refreshing...")
-                from twitter_agent import get_refreshed_clients
-                client, api, _ = get_refreshed_clients()
-                logger.info("Clients refreshed in reply worker")
-            
-            # Check if there are any tweets in the reply queue
-            if not reply_queue:
-                logger.debug("Reply queue is empty, sleeping for 60 seconds")
-                time.sleep(60)
+            # Wait for the next tweet that is due, waking up periodically
+            try:
+                account, tweet_data = next_reply(accounts)
+            except queue.Empty:
+                logger.debug("No replies due, checking again")
                 continue
+            logger.info(f"Processing tweet {tweet_data['tweet_id']} from the {account.name} reply queue")
+            reply_queue = account.reply_queue
+            
+            # Use the account's current clients; the token manager refreshes them centrally
+            client, api = get_current_clients(account)
             
-            # Get a tweet from the queue
-            tweet_data = reply_queue.get()
-            logger.info(f"Processing tweet {tweet_data['tweet_id']} from reply queue")
+            # Shared record of tweets the account has already answered
+            replied_tweets = load_replied_tweets(account)
             
-            # Check if we need to delay the reply
-            if tweet_data.get("delay_minutes", 0) > 0:
-                # Calculate when we should reply
-                created_at = tweet_data.get("created_at")
-                if created_at:
-                    # Convert to datetime if it's a string
-                    if isinstance(created_at, str):
-                        created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    
-                    # Calculate when we should reply
-                    reply_after = created_at + timedelta(minutes=tweet_data["delay_minutes"])
-                    current_time = datetime.now(timezone.utc)
-                    
-                    # If it's not time to reply yet, put it back in the queue
-                    if current_time < reply_after:
-                        time_to_wait = (reply_after - current_time).total_seconds()
-                        logger.info(f"Not time to reply to tweet {tweet_data['tweet_id']} yet. Waiting {time_to_wait/60:.1f} more minutes")
-                        reply_queue.put(tweet_data)
-                        time.sleep(60)  # Sleep for a minute before checking the next tweet
-                        continue
+            # Cache of approved replies for near-identical tweets (None if disabled)
+            reply_cache = account.reply_cache()
+            
+            # Claim the reply so the same tweet is never answered twice
+            if not replied_tweets.claim(tweet_data["tweet_id"]):
+                logger.info(f"Already replied to tweet {tweet_data['tweet_id']}, skipping")
+                reply_queue.ack(tweet_data)
+                continue
             
             # Generate a reply using AI
             try:
@@ -470,92 +743,214 @@ def reply_worker(client, api):
                 tweet_text = tweet_data["text"]
                 logger.info(f"Generating reply to: {tweet_text}")
                 
-                # Generate the reply
-                from ai_utils import generate_reply
-                reply_text = generate_reply(tweet_text)
-                logger.info(f"Generated reply: {reply_text}")
+                # Near-identical tweets share replies, cached per keyword category
+                category = tweet_data.get("category", tweet_data.get("source"))
+                
+                # Use the reply generated in a batch, if there is one, then a cached one
+                reply_text = tweet_data.get("reply_text")
+                cache_key = None
+                if reply_text:
+                    logger.info(f"Using batch-generated reply: {reply_text}")
+                elif reply_cache is not None:
+                    reply_text, cache_key = reply_cache.lookup(tweet_text, category)
+                    if reply_text:
+                        logger.info(f"Using cached reply: {reply_text}")
+                        logger.info(f"Reply cache: {reply_cache.format_stats()}")
+                
+                # Cached replies are already in the cache; only fresh ones get approved
+                from_cache = bool(reply_text) and cache_key is not None
+                
+                if not reply_text:
+                    # Generate the reply, limiting how many run at the same time
+                    with generation_slots:
+                        reply_text = generate_reply(tweet_text, account.prompt_registry)
+                    logger.info(f"Generated reply: {reply_text}")
                 
                 # Post the reply
                 if tweet_data.get("is_reply_to_us", False):
                     # This is a reply to our tweet, we can always reply to it
                     logger.info(f"Replying to a comment on our tweet {tweet_data['tweet_id']}")
-                    response = safe_create_tweet(client, reply_text, in_reply_to_tweet_id=tweet_data["tweet_id"])
-                    logger.info(f"Posted reply to tweet {tweet_data['tweet_id']}: {reply_text}")
+                    posted = post_reply(client, account, tweet_data, reply_text, replied_tweets)
                 else:
                     # For other tweets, we'll try to reply directly
                     # Twitter will handle permissions on their end
-                    try:
-                        logger.info(f"Attempting to reply to tweet {tweet_data['tweet_id']}")
-                        response = safe_create_tweet(client, reply_text, in_reply_to_tweet_id=tweet_data["tweet_id"])
-                        logger.info(f"Successfully posted reply to tweet {tweet_data['tweet_id']}")
-                    except tweepy.errors.Forbidden as e:
-                        logger.warning(f"Permission error posting reply to {tweet_data['tweet_id']}: {e}")
-                        # This user has restricted who can reply to their tweets
-                        # We could try to follow them first and then reply, but that might be too aggressive
-                        logger.info("Skipping this tweet due to reply restrictions")
-                    except tweepy.errors.TooManyRequests as e:
-                        logger.warning(f"Rate limit exceeded when replying to {tweet_data['tweet_id']}: {e}")
-                        # Put the tweet back in the queue to try again later
-                        reply_queue.put(tweet_data)
-                        # Sleep for a while to respect rate limits
-                        time.sleep(60 * 15)  # 15 minutes
-                    except Exception as e:
-                        logger.error(f"Unexpected error posting reply to {tweet_data['tweet_id']}: {e}")
+                    logger.info(f"Attempting to reply to tweet {tweet_data['tweet_id']}")
+                    posted = post_reply(client, account, tweet_data, reply_text, replied_tweets)
+                if posted and not from_cache:
+                    approve_reply(reply_cache, tweet_text, reply_text, category, cache_key)
                 
             except Exception as e:
                 logger.error(f"Error processing reply for tweet {tweet_data['tweet_id']}: {e}")
+                replied_tweets.release(tweet_data["tweet_id"])
             
             # Mark the task as done
-            reply_queue.task_done()
+            reply_queue.ack(tweet_data)
             logger.info(f"Completed processing tweet {tweet_data['tweet_id']}")
             
-            # Sleep a bit to avoid rate limits
-            time.sleep(random.uniform(5, 15))
-            
         except Exception as e:
             logger.error(f"Error in reply worker: {e}")
             time.sleep(30)  # Wait before retrying
 
+def post_reply(client, account, tweet_data, reply_text, replied_tweets):
+    """
+    Post a reply to a queued tweet, handling reply restrictions and rate limits.
+
+    A rate-limited reply is put back in the account's queue for later and
+    writes are paused for every worker of the account; any other failure
+    releases the claim so the tweet can be answered again.
+    
+    Args:
+        client: Tweepy client used to post the reply
+        account: Account whose queue and rate limiter the tweet belongs to
+        tweet_data: Queued tweet being answered
+        reply_text: Text of the reply
+        replied_tweets: The account's store of answered tweets
+    
+    Returns:
+        True if the reply was posted
+    """
+    tweet_id = tweet_data["tweet_id"]
+    try:
+        safe_create_tweet(client, reply_text, in_reply_to_tweet_id=tweet_id)
+        logger.info(f"Posted reply to tweet {tweet_id}: {reply_text}")
+        return True
+    except tweepy.errors.Forbidden as e:
+        logger.warning(f"Permission error posting reply to {tweet_id}: {e}")
+        # This user has restricted who can reply to their tweets
+        # We could try to follow them first and then reply, but that might be too aggressive
+        logger.info("Skipping this tweet due to reply restrictions")
+    except tweepy.errors.TooManyRequests as e:
+        logger.warning(f"Rate limit exceeded when replying to {tweet_id}: {e}")
+        # Put the tweet back in the queue to try again later
+        replied_tweets.release(tweet_id)
+        account.reply_queue.put(tweet_data, not_before=time.time() + 60 * 15)
+        # Hold back posting in every worker until the write window resets
+        account.rate_limiter.pause("create", 60 * 15)
+        logger.info(f"Rate limit budget: {account.rate_limiter.format_budget()}")
+    except Exception as e:
+        logger.error(f"Unexpected error posting reply to {tweet_id}: {e}")
+        replied_tweets.release(tweet_id)
+    return False
+
+def approve_reply(reply_cache, tweet_text, reply_text, category, cache_key=None):
+    """Add a freshly generated reply to the reply cache, unless it is the generic fallback reply."""
+    if reply_cache is not None and reply_text != FALLBACK_REPLY:
+        reply_cache.approve(tweet_text, reply_text, category, cache_key)
+
+def create_reply_workers(client, api, num_workers=None, max_concurrent_generations=None, accounts=None):
+    """
+    Create a pool of reply worker threads shared by every account's reply queue.
+
+    Args:
+        client: Tweepy client used to post replies
+        api: Tweepy v1.1 API instance
+        num_workers: Number of worker threads (default: monitoring.reply_workers or 4)
+        max_concurrent_generations: Maximum number of replies generated at once
+                                    (default: monitoring.max_concurrent_generations or num_workers)
+        accounts: Accounts whose queues the workers serve (default: every account)
+    
+    Returns:
+        List of daemon threads, not yet started
+    """
+    global generation_slots
+    config = load_monitoring_config()
+    
+    if num_workers is None:
+        num_workers = config.get("reply_workers", 4)
+    if max_concurrent_generations is None:
+        max_concurrent_generations = config.get("max_concurrent_generations", num_workers)
+    
+    generation_slots = threading.BoundedSemaphore(max(1, max_concurrent_generations))
+    logger.info(f"Creating {num_workers} reply workers with up to {max_concurrent_generations} concurrent generations")
+    
+    workers = []
+    for index in range(max(1, num_workers)):
+        workers.append(threading.Thread(
+            target=reply_worker,
+            args=(client, api, accounts),
+            daemon=True,
+            name=f"ReplyWorker-{index + 1}"
+        ))
+    return workers
+
 def get_user_id(client):
-    """Get the user ID of the authenticated user."""
+    """
+    Get the user ID of the authenticated user.
+
+    The ID is fetched with get_me() once per set of credentials and cached for
+    the life of the process (until SIGHUP), instead of costing a request per poll.
+    """
+    cache_key = getattr(client, "access_token", None)
+    with _user_ids_lock:
+        cached = _user_ids.get(cache_key)
+        if cached is not None and cached[1] == current_generation():
+            return cached[0]
+    
     try:
+        respect_rate_limit("users_me", client)
         user = client.get_me()
-        return user.data.id
     except Exception as e:
         logger.error(f"Error getting user ID: {e}")
         raise
+    
+    with _user_ids_lock:
+        _user_ids[cache_key] = (user.data.id, current_generation())
+    return user.data.id
+
+def create_monitor_threads(account, streaming=False):
+    """
+    Create the mention, hashtag and keyword monitor threads of an account.
+
+    Looks up the account's user ID and applies its rate limits first. With
+    streaming, hashtags and keywords arrive through the filtered stream (see
+    stream_ingest), so only the mentions monitor is created.
+    
+    Returns:
+        List of daemon threads, not yet started
+    """
+    client, api = get_current_clients(account)
+    user_id = get_user_id(client)
+    logger.info(f"Account {account.name} authenticated as user ID: {user_id}")
+    
+    # Apply the account's configured rate limits
+    configure_rate_limits(account)
+    
+    suffix = "" if account.default else f"-{account.name}"
+    threads = [
+        threading.Thread(target=monitor_mentions, args=(client, api, user_id, account),
+                         daemon=True, name=f"MentionsMonitor{suffix}")
+    ]
+    if not streaming:
+        threads.append(threading.Thread(target=monitor_hashtags, args=(client, api, account),
+                                        daemon=True, name=f"HashtagsMonitor{suffix}"))
+        threads.append(threading.Thread(target=monitor_keywords, args=(client, api, account),
+                                        daemon=True, name=f"KeywordsMonitor{suffix}"))
+    return threads
 
 def main():
     """Run the Twitter monitoring system."""
     logger.info("Starting Twitter monitoring system")
     
     try:
-        # Load credentials
-        credentials = load_config()
-        
-        # Initialize Twitter clients
-        client, api = initialize_twitter_client(credentials)
+        # Create the monitoring threads of every account
+        accounts = get_accounts()
+        monitor_threads = []
+        for account in accounts:
+            monitor_threads.extend(create_monitor_threads(account))
         
-        # Get the user ID
-        user_id = get_user_id(client)
-        logger.info(f"Authenticated as user ID: {user_id}")
-        
-        # Create threads for monitoring
-        mention_thread = threading.Thread(target=monitor_mentions, args=(client, api, user_id))
-        hashtag_thread = threading.Thread(target=monitor_hashtags, args=(client, api))
-        keyword_thread = threading.Thread(target=monitor_keywords, args=(client, api))
-        reply_thread = threading.Thread(target=reply_worker, args=(client, api))
+        # The default account's clients are passed to the shared reply workers
+        client, api = get_current_clients()
+        token_thread = create_token_refresh_thread(accounts)
+        reply_threads = create_reply_workers(client, api, accounts=accounts)
+        if batch_replies_enabled():
+            reply_threads.append(create_batch_worker(get_default_account().reply_queue, include_tweets=False))
         
         # Start the threads
-        mention_thread.daemon = True
-        hashtag_thread.daemon = True
-        keyword_thread.daemon = True
-        reply_thread.daemon = True
-        
-        mention_thread.start()
-        hashtag_thread.start()
-        keyword_thread.start()
-        reply_thread.start()
+        for monitor_thread in monitor_threads:
+            monitor_thread.start()
+        token_thread.start()
+        for reply_thread in reply_threads:
+            reply_thread.start()
         
         logger.info("All monitoring threads started")
         
@@ -569,16 +964,17 @@ def main():
     
     return 0
 
-def test_reply_queue(client):
-    """Add a test tweet to the reply queue for debugging."""
+def test_reply_queue(client, account=None):
+    """Add a test tweet to an account's reply queue (default: the default account) for debugging."""
     logger.info("Adding test tweet to reply queue")
-    reply_queue.put({
+    (account or get_default_account()).reply_queue.put({
         "tweet_id": "1234567890",  # This is a dummy ID
         "user_id": "987654321",    # This is a dummy ID
         "text": "@DrAlexAI I've been so tired lately, no matter how much I sleep. What's wrong with me?",
         "created_at": datetime.now(timezone.utc),  # Fixed datetime usage
         "delay_minutes": 0,        # Reply immediately
-        "is_reply_to_us": False
+        "is_reply_to_us": False,
+        "source": "mention"
     })
     logger.info("Test tweet added to reply queue")
 
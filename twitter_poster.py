@@ -2,16 +2,42 @@ import tweepy
 import json
 import random
 import os
+import logging
+import threading
+from requests.adapters import HTTPAdapter
 from ai_utils import *
+from ai_utils import _generate_tweet_text
+from rate_limiter import get_rate_limiter
+from config_cache import load_json, CONFIG_FILE, DEFAULT_CREDENTIALS_KEY
+from content_buffer import get_content_buffer
+from media_store import upload_image
 
-def load_config():
-    """Load Twitter API credentials from config file."""
-    with open("config.json", "r") as file:
-        config = json.load(file)
-    return config["Aalexhealth_token"]
+logger = logging.getLogger("twitter_poster")
 
-def initialize_twitter_client(credentials):
-    """Initialize and return a Tweepy client with the given credentials."""
+# Number of keep-alive connections kept per host for each client session
+HTTP_POOL_SIZE = 16
+
+# Shared clients, keyed by (consumer_key, access_token)
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Connection pool mounted on every client session, so all accounts share it
+_shared_adapter = None
+_shared_adapter_lock = threading.Lock()
+
+def load_config(credentials_key=DEFAULT_CREDENTIALS_KEY):
+    """Load an account's Twitter API credentials from config file (cached until the file changes)."""
+    config = load_json(CONFIG_FILE)
+    return config[credentials_key]
+
+def initialize_twitter_client(credentials, rate_limiter=None):
+    """
+    Initialize and return a Tweepy client with the given credentials.
+
+    Args:
+        credentials: Credentials dictionary of the account
+        rate_limiter: Rate limiter calibrated by the clients' responses (default: the default account's)
+    """
     client = tweepy.Client(
         bearer_token=credentials["access_bearer_token"],
         consumer_key=credentials["consumer_key"],
@@ -29,55 +55,95 @@ def initialize_twitter_client(credentials):
     )
     api = tweepy.API(auth)
     
+    # Keep enough warm connections for every worker thread, shared by every account
+    mount_connection_pool(client.session, shared_connection_pool())
+    mount_connection_pool(api.session, shared_connection_pool())
+    
+    # Let every response calibrate the account's per-endpoint rate limiter
+    (rate_limiter or get_rate_limiter()).install(client, api)
+    
     return client, api
 
-def generate_tweet_only():
-    """Generate a tweet without an image using the existing tweet prompts."""
-    # Load prompt templates
-    with open("prompts_template_alex.json", "r", encoding="utf-8") as file:
-        prompt_data = json.load(file)
+def mount_connection_pool(session, adapter=None, pool_size=HTTP_POOL_SIZE):
+    """Mount a keep-alive connection pool large enough for concurrent threads on a requests session."""
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+def shared_connection_pool():
+    """
+    Return the connection pool shared by every client session.
+
+    Authentication is per request (OAuth headers), so the sessions of all
+    accounts can reuse the same warm TLS connections to the Twitter API.
+    """
+    global _shared_adapter
+    with _shared_adapter_lock:
+        if _shared_adapter is None:
+            _shared_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        return _shared_adapter
+
+def get_twitter_clients(credentials=None, rate_limiter=None):
+    """
+    Return the shared Tweepy client and API for a set of credentials.
+
+    Clients are created once per account and reused for every post and lookup,
+    so requests go over already-open TLS connections. When the bearer token
+    changes (after a token refresh) it is swapped into the existing client in
+    place instead of building new clients and sessions.
     
-    # Select a random tweet prompt from the Image_prompts section
-    image_templates = prompt_data["Image_prompts"]
-    random_template = random.choice(image_templates)
+    Args:
+        credentials: Credentials dictionary (default: the default account's credentials in config.json)
+        rate_limiter: Rate limiter of the account (default: the default account's)
     
-    # Initialize the OpenAI client
-    from openai import OpenAI
-    import os
-    from dotenv import load_dotenv
+    Returns:
+        Tuple of (client, api)
+    """
+    if credentials is None:
+        from accounts import get_default_account
+        account = get_default_account()
+        credentials = load_config(account.credentials_key)
+        rate_limiter = account.rate_limiter
     
-    # Load environment variables from .env file
-    load_dotenv()
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
+    key = (credentials["consumer_key"], credentials["access_token"])
+    with _clients_lock:
+        clients = _clients.get(key)
+        if clients is None:
+            clients = initialize_twitter_client(credentials, rate_limiter)
+            _clients[key] = clients
+        else:
+            client = clients[0]
+            if client.bearer_token != credentials["access_bearer_token"]:
+                client.bearer_token = credentials["access_bearer_token"]
+                logger.info("Rotated bearer token on the shared Twitter client")
+        return clients
+
+def generate_tweet_only():
+    """Generate a tweet without an image using the existing tweet prompts."""
+    # Select a random tweet prompt from the Image_prompts section
+    random_template = prompt_registry.random_image_template()
     
     # Generate tweet using the tweet_text_prompt
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": random_template["tweet_text_prompt"]}
-        ],
-        temperature=0.4
-    )
+    return _generate_tweet_text(random_template["tweet"])
 
-    # Extract and parse the tweet JSON response
-    tweet_content = response.choices[0].message.content
-    try:
-        tweet_json = json.loads(tweet_content)
-        return tweet_json["tweet"]
-    except (json.JSONDecodeError, KeyError):
-        return tweet_content
+def post_tweet_with_image(client, api, tweet_text, image_path=None, image_data=None, media_id=None, image_extension=None):
+    """
+    Post a tweet with an image.
 
-def post_tweet_with_image(client, api, tweet_text, image_path):
-    """Post a tweet with an image."""
+    An already uploaded media_id is attached as-is; otherwise the image is
+    uploaded first, from memory when its bytes are given (image_extension
+    names their format, e.g. ".jpg").
+    """
     try:
-        # Upload the image
-        media = api.media_upload(image_path)
+        # Upload the image unless it already has been
+        if media_id is None:
+            media_id = upload_image(api, image_path, image_data, image_extension).media_id
         
         # Post the tweet with the media
         response = client.create_tweet(
             text=tweet_text,
-            media_ids=[media.media_id]
+            media_ids=[media_id]
         )
         print(f"Tweet with image posted successfully! Tweet ID: {response.data['id']}")
         return response
@@ -95,27 +161,29 @@ def post_tweet_without_image(client, tweet_text):
         print(f"Error posting tweet: {e}")
         return None
 
-def post_random_tweet(image_probability=0.7):
+def post_random_tweet(image_probability=0.7, client=None, api=None):
     """
     Post a tweet with or without an image based on the given probability.
     
     Args:
         image_probability: Float between 0 and 1 representing the probability 
                           of posting a tweet with an image (default: 0.7)
+        client: Tweepy client to post with (default: the shared client)
+        api: Tweepy v1.1 API for media upload (default: the shared API)
     """
-    # Load credentials and initialize clients
-    credentials = load_config()
-    client, api = initialize_twitter_client(credentials)
+    # Reuse the shared clients instead of building new ones for every post
+    if client is None or api is None:
+        client, api = get_twitter_clients()
     
     # Decide whether to post with an image based on probability
     if random.random() < image_probability:
         print("Generating tweet with image...")
-        result = generate_tweet_and_image()
+        result = generate_tweet_and_image(save=False)
         tweet_text = result["tweet"]
-        image_path = result["image_path"]
         
-        # Post tweet with image
-        post_tweet_with_image(client, api, tweet_text, image_path)
+        # Post tweet with image, uploading it straight from memory
+        post_tweet_with_image(client, api, tweet_text, image_data=result["image_data"],
+                              image_extension=result["image_extension"])
     else:
         print("Generating tweet without image...")
         tweet_text = generate_tweet_only()
@@ -123,6 +191,47 @@ def post_random_tweet(image_probability=0.7):
         # Post tweet without image
         post_tweet_without_image(client, tweet_text)
 
+def post_buffered_tweet(image_probability=0.7, client=None, api=None):
+    """
+    Post the next ready-made tweet from the content buffer.
+    
+    Falls back to generating a tweet on the spot (see post_random_tweet) when
+    the buffer is empty. A buffered tweet that fails to post is put back at the
+    front of the buffer so the next run retries it, reusing its uploaded image
+    while the media ID is still valid.
+    
+    Args:
+        image_probability: Image probability used for the fallback (default: 0.7)
+        client: Tweepy client to post with (default: the shared client)
+        api: Tweepy v1.1 API for media upload (default: the shared API)
+    """
+    if client is None or api is None:
+        client, api = get_twitter_clients()
+    
+    buffer = get_content_buffer()
+    item = buffer.pop()
+    if item is None:
+        print("Content buffer is empty, generating tweet now...")
+        post_random_tweet(image_probability=image_probability, client=client, api=api)
+        return
+    
+    print(f"Posting buffered tweet ({len(buffer)} left in buffer)...")
+    if item["image_path"]:
+        response = None
+        try:
+            media_id = buffer.upload_media(item, api)
+        except Exception as e:
+            print(f"Error uploading buffered image: {e}")
+        else:
+            response = post_tweet_with_image(client, api, item["tweet"], media_id=media_id)
+    else:
+        response = post_tweet_without_image(client, item["tweet"])
+    
+    if response is None:
+        buffer.requeue(item)
+    elif item["image_path"]:
+        buffer.discard(item)
+
 if __name__ == "__main__":
     # You can adjust the probability as needed
     post_random_tweet(image_probability=0.7) 
\ No newline at end of file